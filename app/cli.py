@@ -0,0 +1,121 @@
+"""Командная строка: импорт и экспорт каталога.
+
+    python -m app.cli import books.ndjson [--mode create] [--checkpoint books.ckpt]
+    python -m app.cli export books.csv
+    python -m app.cli export - --format ndjson > books.ndjson
+    python -m app.cli rebalance [--cleanup]
+
+Импорт после сбоя продолжается с записи из --checkpoint (или --resume-from).
+rebalance переносит книги к шардам-владельцам после добавления шардов в DATABASE_SHARDS.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from app.db import repository
+from app.db.repository import BULK_CHUNK_SIZE, init_db, make_repository, rebalance_shards
+from app.transfer import (
+    IMPORT_BATCH_SIZE, export_books, format_from_name, import_books, iter_file, progress_line,
+)
+
+
+async def run_import(args) -> int:
+    file_format = args.format or format_from_name(args.path)
+    checkpoint = Path(args.checkpoint) if args.checkpoint else None
+    skip = args.resume_from
+    if checkpoint is not None and checkpoint.exists():
+        skip = int(checkpoint.read_text() or 0)
+        print(f"resuming after record {skip}", file=sys.stderr)
+
+    started = time.perf_counter()
+
+    def on_progress(report):
+        if checkpoint is not None:
+            checkpoint.write_text(str(report.resume_from))
+        print(progress_line(report, time.perf_counter() - started), file=sys.stderr)
+
+    await init_db()
+    with open(args.path, "rb") if args.path != "-" else sys.stdin.buffer as file:
+        repo = make_repository()
+        try:
+            report = await import_books(
+                repo, iter_file(file), file_format, args.mode, skip, args.batch_size, on_progress,
+            )
+        finally:
+            await repo.close()
+
+    for issue in report.errors:
+        print(f"record {issue.record}: {issue.error}", file=sys.stderr)
+    print(report.model_dump_json(exclude={"errors"}))
+    if report.completed and checkpoint is not None:
+        checkpoint.unlink(missing_ok=True)
+    return 0 if report.completed else 1
+
+
+async def run_export(args) -> int:
+    file_format = args.format or format_from_name(args.path)
+    started = time.perf_counter()
+    written = 0
+    with open(args.path, "wb") if args.path != "-" else sys.stdout.buffer as file:
+        repo = make_repository()
+        try:
+            async for chunk in export_books(repo, file_format, args.after):
+                file.write(chunk)
+                written += len(chunk)
+        finally:
+            await repo.close()
+    elapsed = time.perf_counter() - started
+    print(f"exported {written:,} bytes in {elapsed:.1f}s", file=sys.stderr)
+    return 0
+
+
+async def run_rebalance(args) -> int:
+    await init_db()
+    if repository.shards is None:
+        print("DATABASE_SHARDS is not set", file=sys.stderr)
+        return 2
+    started = time.perf_counter()
+
+    def on_progress(report):
+        print(f"scanned {report.scanned:,}, copied {report.copied:,}, deleted {report.deleted:,} "
+              f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    report = await rebalance_shards(repository.shards, args.cleanup, args.batch_size, on_progress)
+    for (source, target), moved in sorted(report.moves.items()):
+        print(f"shard{source} -> shard{target}: {moved:,}")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="загрузить книги из NDJSON/CSV")
+    importer.add_argument("path", help="файл или - для stdin")
+    importer.add_argument("--format", choices=("ndjson", "csv"), help="по умолчанию — по расширению файла")
+    importer.add_argument("--mode", choices=("upsert", "create"), default="upsert",
+                          help="create не трогает существующие книги (conflict в отчёте)")
+    importer.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    importer.add_argument("--resume-from", type=int, default=0, help="пропустить первые N записей")
+    importer.add_argument("--checkpoint", help="файл с номером последней зафиксированной записи")
+
+    exporter = commands.add_parser("export", help="выгрузить каталог в NDJSON/CSV")
+    exporter.add_argument("path", help="файл или - для stdout")
+    exporter.add_argument("--format", choices=("ndjson", "csv"))
+    exporter.add_argument("--after", help="курсор: выгрузить книги после него")
+
+    rebalancer = commands.add_parser("rebalance", help="перенести книги к шардам-владельцам")
+    rebalancer.add_argument("--cleanup", action="store_true",
+                            help="удалить перенесённые книги из старых шардов (после перезапуска воркеров)")
+    rebalancer.add_argument("--batch-size", type=int, default=BULK_CHUNK_SIZE)
+
+    args = parser.parse_args(argv)
+    runners = {"import": run_import, "export": run_export, "rebalance": run_rebalance}
+    return asyncio.run(runners[args.command](args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""Сжатие ответов по Accept-Encoding: zstd и br (если установлены zstandard/brotli) и gzip.
+
+Ответы короче minimum_size отдаются как есть; потоковые ответы сжимаются по частям
+с промежуточным flush, чтобы клиент получал данные без задержки.
+"""
+import zlib
+from importlib.util import find_spec
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# Уже сжатые форматы повторно не сжимаются
+# text/event-stream: мелкие события, которые надо отдавать сразу, сжатие только добавит задержку
+_SKIP_CONTENT_TYPES = (
+    "image/", "video/", "audio/", "application/zip", "application/gzip", "application/zstd", "text/event-stream",
+)
+
+
+class _Gzip:
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class _Zstd:
+    def __init__(self):
+        import zstandard
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(self._flush_block)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        import brotli
+        # Качество 4 — разумный компромисс для динамических ответов
+        self._compressor = brotli.Compressor(quality=4)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+def _available_encoders() -> dict[str, type]:
+    # Только проверка наличия: сами библиотеки загружаются при первом сжатом ответе, а не при старте
+    encoders = {}
+    for name, module, encoder in (("zstd", "zstandard", _Zstd), ("br", "brotli", _Brotli)):
+        if find_spec(module) is not None:
+            encoders[name] = encoder
+    encoders["gzip"] = _Gzip
+    return encoders
+
+
+# Порядок — предпочтение сервера при равных q
+ENCODERS = _available_encoders()
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Лучшая поддерживаемая кодировка из Accept-Encoding (с учётом q) или None."""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            weights[name.strip().lower()] = q
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for name in ENCODERS:
+        q = weights.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class CompressionMiddleware:
+    """Чистое ASGI-middleware сжатия ответов."""
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
+
+
+class _CompressingSend:
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body":
+            return await self.send(message)
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is None:
+            if self.passthrough:
+                return await self.send(message)
+            return await self._send_compressed(body, more_body)
+
+        start, self.start_message = self.start_message, None
+        headers = MutableHeaders(raw=start["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        self.passthrough = not self._should_compress(start["status"], headers, body, more_body)
+        if self.passthrough:
+            await self.send(start)
+            return await self.send(message)
+
+        self.compressor = ENCODERS[self.encoding]()
+        headers["Content-Encoding"] = self.encoding
+        # Сжатое представление отличается побайтно, поэтому сильный ETag становится слабым
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = "W/" + etag
+        if more_body:
+            del headers["Content-Length"]
+            await self.send(start)
+            return await self._send_compressed(body, more_body)
+        data = self.compressor.finish(body)
+        headers["Content-Length"] = str(len(data))
+        await self.send(start)
+        await self.send({"type": "http.response.body", "body": data})
+
+    def _should_compress(self, status: int, headers: MutableHeaders, body: bytes, more_body: bool) -> bool:
+        return not (
+            "content-encoding" in headers
+            or status in (204, 304)
+            or headers.get("content-type", "").startswith(_SKIP_CONTENT_TYPES)
+            or (not more_body and len(body) < self.minimum_size)
+        )
+
+    async def _send_compressed(self, body: bytes, more_body: bool) -> None:
+        if more_body:
+            data = self.compressor.compress(body)
+            if data:
+                await self.send({"type": "http.response.body", "body": data, "more_body": True})
+        else:
+            await self.send({"type": "http.response.body", "body": self.compressor.finish(body)})
@@ -0,0 +1,61 @@
+"""Условные HTTP-запросы: ETag, If-None-Match, If-Modified-Since и If-Match."""
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request, Response
+
+
+def book_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def list_etag(version: int, variant: str | None = None) -> str:
+    # Слабый: один и тот же список может отдаваться разными сериализаторами.
+    # variant различает форматы (CSV, MessagePack...), отдаваемые по одному URL
+    return f'W/"{version}-{variant}"' if variant else f'W/"{version}"'
+
+
+def _entity_tags(header: str) -> list[str]:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def _opaque_tags(header: str) -> list[str]:
+    """Теги для слабого сравнения (If-None-Match): префикс W/ не учитывается."""
+    return [tag.removeprefix("W/") for tag in _entity_tags(header)]
+
+
+def validator_headers(etag: str, last_modified: float | None = None) -> dict[str, str]:
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: float | None = None) -> bool:
+    """Можно ли ответить 304: If-None-Match (слабое сравнение) важнее If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return if_none_match.strip() == "*" or etag.removeprefix("W/") in _opaque_tags(if_none_match)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def not_modified(headers: dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+def if_match_versions(request: Request) -> set[int] | None:
+    """Версии из If-Match; None — заголовка нет или "*" (достаточно, чтобы книга существовала).
+
+    Сравнение строгое (RFC 9110): слабый тег W/"..." — например, ETag сжатого ответа — не
+    совпадает ни с одной версией, как и нечисловые теги, и даёт 412.
+    """
+    header = request.headers.get("if-match")
+    if header is None or header.strip() == "*":
+        return None
+    tags = (tag.strip('"') for tag in _entity_tags(header) if not tag.startswith("W/"))
+    return {int(tag) for tag in tags if tag.isdigit()}
@@ -0,0 +1,171 @@
+"""Пакетная запись созданий книг (write-behind).
+
+POST /books/ кладёт книгу в ограниченную очередь; фоновая задача собирает до batch_size
+заявок или ждёт не дольше max_delay и пишет их одной транзакцией через bulk_create.
+Каждая заявка получает свой результат через future: книгу, AlreadyExistsError или
+OverloadedError, если её шард не зафиксировал пакет.
+
+Надёжность (write_durability):
+  commit — ответ после фиксации пакета, как и без пакетирования, но один commit на пакет;
+  accept — ответ 202 сразу после постановки в очередь. Конфликты и ошибки пакета клиенту
+           уже не вернуть (только журнал и метрики); при падении процесса очередь теряется.
+
+Переполнение очереди даёт OverloadedError (503) вместо неограниченного роста памяти.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from .models import Book
+from .repository import AlreadyExistsError, BookRepository, OverloadedError, make_repository, open_session
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_MODES = ("commit", "accept")
+
+
+@dataclass
+class BatchingStats:
+    batches: int = 0
+    items: int = 0
+    rejected: int = 0
+    failed: int = 0
+
+
+class CreateBatcher:
+    def __init__(self, session_factory: Callable[[], AsyncSession], batch_size: int = 500,
+                 max_delay: float = 0.005, queue_size: int = 10_000, durability: str = "commit",
+                 repository_factory: Callable[[], BookRepository] | None = None):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown write durability {durability!r}, expected one of {DURABILITY_MODES}")
+        self.session_factory = session_factory
+        # Репозиторий на пакет; при шардировании — ShardedBookRepository (make_repository)
+        self.repository_factory = repository_factory or (lambda: BookRepository(session_factory=self.session_factory))
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.durability = durability
+        self.stats = BatchingStats()
+        self._queue: asyncio.Queue[tuple[Book, asyncio.Future]] = asyncio.Queue(queue_size)
+        self._worker: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def waits_for_commit(self) -> bool:
+        return self.durability == "commit"
+
+    async def submit(self, book: Book) -> Book:
+        """Ставит создание в очередь; в режиме commit ждёт фиксации пакета."""
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((book, future))
+        except asyncio.QueueFull:
+            self.stats.rejected += 1
+            raise OverloadedError("Write queue is full, retry later")
+        if not self.waits_for_commit:
+            return book
+        # shield: отключившийся клиент не отменяет запись, уже попавшую в пакет
+        return await asyncio.shield(future)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.batch_size:
+                # Сначала забираем уже накопившееся, ждём только когда очередь пуста
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[tuple[Book, asyncio.Future]]) -> None:
+        books = [book for book, _ in batch]
+        try:
+            repo = self.repository_factory()
+            try:
+                report = await repo.bulk_create(books)
+            finally:
+                await repo.close()
+        except Exception as exc:
+            self.stats.failed += len(batch)
+            logger.exception("Write batch of %d books failed", len(batch))
+            for _, future in batch:
+                self._resolve(future, exc)
+            return
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+        self.stats.batches += 1
+        self.stats.items += len(batch)
+        for (book, future), item in zip(batch, report.items):
+            if item.status == "created":
+                self._resolve(future, book)
+                continue
+            self.stats.failed += 1
+            if not self.waits_for_commit:
+                logger.warning("Queued book %s was not created: %s", book.id, item.status)
+            if item.status == "failed":
+                # Шард не зафиксировал свою часть пакета — это сбой записи, а не конфликт
+                self._resolve(future, OverloadedError(f"Book with id {book.id} was not written, retry later"))
+            else:
+                self._resolve(future, AlreadyExistsError(f"Book with id {book.id} already exists"))
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result) -> None:
+        if future.done():
+            return
+        if isinstance(result, BaseException):
+            future.set_exception(result)
+            # В режиме accept результат никто не ждёт
+            future.exception()
+        else:
+            future.set_result(result)
+
+    async def drain(self) -> None:
+        """Дожидается записи всего, что уже в очереди (остановка процесса, тесты)."""
+        if self._worker is not None and not self._worker.done():
+            await self._queue.join()
+
+    async def close(self) -> None:
+        await self.drain()
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+
+def _make_batcher() -> CreateBatcher | None:
+    settings = get_settings()
+    if not settings.write_batching:
+        return None
+    return CreateBatcher(
+        open_session,
+        batch_size=settings.write_batch_size,
+        max_delay=settings.write_batch_delay_ms / 1000,
+        queue_size=settings.write_queue_size,
+        durability=settings.write_durability,
+        repository_factory=make_repository,
+    )
+
+
+# Общий для процесса; None, если пакетирование выключено (по умолчанию)
+create_batcher = _make_batcher()
@@ -0,0 +1,203 @@
+"""Кэш чтения для BookRepository: ограниченный LRU с TTL и сменные бэкенды."""
+import logging
+import pickle
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Отличает "нет в кэше" от закэшированного None (книга не найдена)
+MISSING = object()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+
+class CacheBackend(ABC):
+    """Хранилище ключ-значение; значения живут не дольше ttl секунд."""
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    @abstractmethod
+    async def get(self, key: str) -> Any:
+        """Значение по ключу или MISSING."""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        ...
+
+    @abstractmethod
+    async def delete_prefix(self, prefix: str) -> None:
+        ...
+
+    @abstractmethod
+    async def clear(self) -> None:
+        ...
+
+
+class MemoryCache(CacheBackend):
+    """Кэш в памяти процесса с вытеснением по LRU и сроком жизни записей."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    async def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return MISSING
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats.evictions += 1
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def delete_prefix(self, prefix: str) -> None:
+        for key in [k for k in self._data if k.startswith(prefix)]:
+            del self._data[key]
+
+    async def clear(self) -> None:
+        self._data.clear()
+
+
+class RedisCache(CacheBackend):
+    """Общий для всех воркеров кэш поверх клиента с API redis.asyncio.
+
+    LRU-вытеснение выполняет сам Redis (maxmemory-policy allkeys-lru), TTL задаётся при записи.
+    Счётчики попаданий считаются в каждом процессе отдельно.
+    """
+
+    def __init__(self, client, ttl: float = 30.0, namespace: str = "books-cache:"):
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.namespace = namespace
+
+    @classmethod
+    def from_url(cls, url: str, ttl: float = 30.0) -> "RedisCache":
+        try:
+            import redis.asyncio as redis
+        except ImportError as exc:
+            raise RuntimeError("Для BOOKS_CACHE_BACKEND=redis установите пакет redis") from exc
+        return cls(redis.from_url(url), ttl=ttl)
+
+    async def get(self, key: str) -> Any:
+        data = await self.client.get(self.namespace + key)
+        if data is None:
+            self.stats.misses += 1
+            return MISSING
+        self.stats.hits += 1
+        return pickle.loads(data)
+
+    async def set(self, key: str, value: Any) -> None:
+        await self.client.set(self.namespace + key, pickle.dumps(value), px=int(self.ttl * 1000))
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self.client.delete(*(self.namespace + key for key in keys))
+
+    async def delete_prefix(self, prefix: str) -> None:
+        keys = [key async for key in self.client.scan_iter(match=self.namespace + prefix + "*")]
+        if keys:
+            await self.client.delete(*keys)
+
+    async def clear(self) -> None:
+        await self.delete_prefix("")
+
+
+class BookCache:
+    """Схема ключей и инвалидация поверх бэкенда.
+
+    Записи по id: "book:<id>", списки: "list:<...>". Любая запись в таблицу сбрасывает
+    затронутые id и все списки. Поколение защищает от гонки, когда чтение, начатое до
+    записи, кладёт в кэш уже устаревший результат.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.generation = 0
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.backend.stats
+
+    @staticmethod
+    def book_key(book_id: int) -> str:
+        return f"book:{book_id}"
+
+    @staticmethod
+    def list_key(*parts) -> str:
+        return "list:" + ":".join(str(part) for part in parts)
+
+    async def get(self, key: str) -> Any:
+        return await self.backend.get(key)
+
+    async def set(self, key: str, value: Any, generation: int) -> None:
+        """Кладёт значение, только если с начала чтения (generation) не было записей."""
+        if generation == self.generation:
+            await self.backend.set(key, value)
+
+    async def invalidate(self, book_ids=()) -> None:
+        self.generation += 1
+        await self.backend.delete(*(self.book_key(book_id) for book_id in book_ids))
+        await self.backend.delete_prefix("list:")
+
+    async def clear(self) -> None:
+        self.generation += 1
+        await self.backend.clear()
+
+
+def make_book_cache(settings=None) -> BookCache | None:
+    settings = settings or get_settings()
+    if settings.cache_backend == "none" or settings.cache_maxsize <= 0:
+        return None
+    if settings.cache_backend == "redis":
+        return BookCache(RedisCache.from_url(settings.cache_redis_url, ttl=settings.cache_ttl))
+    if settings.cache_backend == "memory":
+        # Запись сбрасывает кэш только своего процесса: при нескольких воркерах остальные
+        # отдавали бы устаревшие книги, поэтому нужен общий бэкенд (redis) или без кэша
+        if settings.workers > 1:
+            logger.warning("Memory cache is per process, disabled for %d workers; use BOOKS_CACHE_BACKEND=redis",
+                           settings.workers)
+            return None
+        return BookCache(MemoryCache(maxsize=settings.cache_maxsize, ttl=settings.cache_ttl))
+    raise ValueError(f"Unknown cache backend: {settings.cache_backend!r}")
+
+
+book_cache = make_book_cache()
@@ -0,0 +1,92 @@
+"""Лента изменений книг: пробуждение подписчиков и догоняющее чтение журнала.
+
+Источник истины — таблица book_changes, которую BookRepository пишет в той же транзакции,
+что и саму запись. После commit репозиторий вызывает change_feed.notify(), и подписчики
+этого процесса сразу читают новые события. Записи других воркеров подписчик замечает,
+перечитывая журнал раз в poll_interval.
+"""
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable
+
+from app.config import get_settings
+from .models import BookChange
+
+# Размер порции при чтении журнала
+CHANGES_PAGE_SIZE = 500
+# Пустое событие (для SSE — комментарий keep-alive), если изменений не было столько секунд
+HEARTBEAT_INTERVAL = 15.0
+# Журнал обрезается до change_log_retention событий раз в столько записей процесса
+TRIM_EVERY = 1000
+
+Fetch = Callable[[int, int], Awaitable[list[BookChange]]]
+
+
+class ChangeFeed:
+    def __init__(self, poll_interval: float = 1.0, heartbeat: float = HEARTBEAT_INTERVAL):
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        # Растёт при каждом notify: изменение, зафиксированное между чтением журнала и
+        # ожиданием, не потеряется
+        self.generation = 0
+        self._waiters: list[asyncio.Future] = []
+        self._writes = 0
+
+    def __len__(self) -> int:
+        return len(self._waiters)
+
+    def notify(self) -> None:
+        self.generation += 1
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def count_write(self) -> bool:
+        """Учитывает запись в журнал; True — пора обрезать старые события."""
+        self._writes += 1
+        return self._writes % TRIM_EVERY == 0
+
+    async def wait(self, generation: int, timeout: float) -> bool:
+        """Ждёт notify после generation не дольше timeout; False — истёк timeout."""
+        if self.generation != generation:
+            return True
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except TimeoutError:
+            return False
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    async def follow(self, fetch: Fetch, since: int,
+                     page_size: int = CHANGES_PAGE_SIZE) -> AsyncIterator[list[BookChange]]:
+        """Бесконечный поток порций событий после since; [] — пора отправить keep-alive."""
+        idle = 0.0
+        while True:
+            generation = self.generation
+            changes = await fetch(since, page_size)
+            if changes:
+                since = changes[-1].seq
+                idle = 0.0
+                yield changes
+                continue
+            if not await self.wait(generation, self.poll_interval):
+                idle += self.poll_interval
+                if idle >= self.heartbeat:
+                    idle = 0.0
+                    yield []
+
+
+def _make_change_feed() -> ChangeFeed | None:
+    settings = get_settings()
+    # У каждого шарда свой журнал и свой seq, общего порядка событий нет
+    if not settings.change_feed or settings.database_shards:
+        return None
+    return ChangeFeed(settings.change_poll_interval)
+
+
+# Общий для процесса; журнал не пишется, если лента выключена (BOOKS_CHANGE_FEED=0 или шарды)
+change_feed = _make_change_feed()
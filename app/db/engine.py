@@ -0,0 +1,130 @@
+"""Фабрика движков: прагмы SQLite, явные размеры пулов и разделение чтения/записи."""
+from sqlalchemy import event, Select
+from sqlalchemy.engine import Dialect, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.config import Settings
+from app.metrics import instrument_engine
+from app.ratelimit import watch_db_latency
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def is_sqlite_memory(url: str) -> bool:
+    return is_sqlite(url) and make_url(url).database in (None, "", ":memory:")
+
+
+def sqlite_pragmas(settings: Settings, read_only: bool = False) -> dict[str, object]:
+    pragmas = {
+        "journal_mode": settings.sqlite_journal_mode,
+        "synchronous": settings.sqlite_synchronous,
+        "busy_timeout": settings.sqlite_busy_timeout_ms,
+        "cache_size": settings.sqlite_cache_size,
+        "mmap_size": settings.sqlite_mmap_size,
+        "temp_store": "MEMORY",
+    }
+    if read_only:
+        pragmas["query_only"] = "ON"
+    return pragmas
+
+
+def apply_sqlite_pragmas(engine: AsyncEngine, pragmas: dict[str, object]) -> None:
+    """Выполняет PRAGMA на каждом новом соединении пула."""
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def make_engine(settings: Settings, read_only: bool = False, url: str | None = None) -> AsyncEngine:
+    url = url or settings.database_url
+    kwargs = {"echo": settings.db_echo}
+    if is_sqlite(url):
+        # Кэш подготовленных выражений sqlite3 на соединение
+        kwargs["connect_args"] = {"cached_statements": settings.sqlite_statement_cache}
+    if not is_sqlite_memory(url):
+        kwargs.update(
+            pool_size=settings.db_read_pool_size if read_only else settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+        )
+
+    engine = create_async_engine(url, **kwargs)
+    if is_sqlite(url):
+        pragmas = sqlite_pragmas(settings, read_only)
+        if is_sqlite_memory(url):
+            # WAL и mmap не применимы к базе в памяти
+            pragmas.pop("journal_mode")
+            pragmas.pop("mmap_size")
+        apply_sqlite_pragmas(engine, pragmas)
+    if settings.metrics_enabled:
+        instrument_engine(engine)
+    if settings.load_shedding:
+        watch_db_latency(engine)
+    return engine
+
+
+class RoutingSession(Session):
+    """Отправляет SELECT в пул чтения, а запись — в пул записи.
+
+    После первой записи в транзакции все запросы до commit/rollback идут через писателя,
+    чтобы транзакция видела собственные изменения.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        engines = self.info["engines"]
+        if self.info.get("wrote") or self._flushing or not _is_plain_select(clause):
+            self.info["wrote"] = True
+            return engines["write"].sync_engine
+        return engines["read"].sync_engine
+
+
+def _is_plain_select(clause) -> bool:
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+@event.listens_for(RoutingSession, "after_commit")
+@event.listens_for(RoutingSession, "after_rollback")
+def _reset_routing(session):
+    session.info.pop("wrote", None)
+
+
+def make_sessionmaker(write_engine: AsyncEngine, read_engine: AsyncEngine | None = None) -> sessionmaker:
+    if read_engine is None:
+        return sessionmaker(bind=write_engine, class_=AsyncSession, expire_on_commit=False)
+    return sessionmaker(
+        class_=AsyncSession,
+        sync_session_class=RoutingSession,
+        expire_on_commit=False,
+        info={"engines": {"write": write_engine, "read": read_engine}},
+    )
+
+
+def make_engines(settings: Settings, url: str | None = None) -> tuple[AsyncEngine, AsyncEngine | None]:
+    """Движок записи и, если возможно, отдельный движок чтения.
+
+    Чтение уходит на database_read_url (реплику), а для файловой SQLite — на второй пул
+    к тому же файлу, если db_read_pool_size > 0. url — база шарда вместо database_url
+    (реплика задаётся только для основной базы).
+    """
+    write_engine = make_engine(settings, url=url)
+    url = url or settings.database_url
+    read_engine = None
+    if settings.database_read_url and url == settings.database_url:
+        read_engine = make_engine(settings, read_only=True, url=settings.database_read_url)
+    elif settings.db_read_pool_size > 0 and is_sqlite(url) and not is_sqlite_memory(url):
+        read_engine = make_engine(settings, read_only=True, url=url)
+    return write_engine, read_engine
+
+
+def session_dialect(session: AsyncSession) -> Dialect:
+    sync_session = session.sync_session
+    if sync_session.bind is not None:
+        return sync_session.bind.dialect
+    return sync_session.info["engines"]["write"].dialect
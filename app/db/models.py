@@ -1,6 +1,7 @@
-from pydantic import BaseModel, ConfigDict
-from typing import Optional
-from sqlalchemy import Column, Integer, String
+from collections import Counter
+from pydantic import BaseModel, ConfigDict, computed_field, model_validator
+from typing import Literal, Optional
+from sqlalchemy import Column, DDL, Float, Index, Integer, String, event, func, literal_column
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -12,6 +13,153 @@ class BookORM(Base):
     title = Column(String, nullable=False)
     author = Column(String, nullable=False)
     year = Column(Integer, nullable=True)
+    # Значение счётчика table_versions на момент последней записи строки (ETag книги)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # Индексы под фильтры поиска: автор (+ диапазон лет), диапазон лет, префикс названия
+    __table_args__ = (
+        Index("ix_books_author_year", "author", "year"),
+        Index("ix_books_year", "year"),
+        Index("ix_books_title", "title"),
+        Index(
+            "ix_books_title_tsv",
+            func.to_tsvector(literal_column("'simple'"), title),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+# Счётчик изменений таблицы: растёт при каждой записи, служит ETag для списков
+class TableVersionORM(Base):
+    __tablename__ = "table_versions"
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False)
+    updated_at = Column(Float, nullable=False)  # unix time, для Last-Modified
+
+
+# Журнал изменений книг для ленты /books/changes: строка на каждую созданную, изменённую
+# или удалённую книгу. seq растёт в порядке фиксации: все записи сериализуются на строке
+# table_versions, а seq выдаётся после неё
+class BookChangeORM(Base):
+    __tablename__ = "book_changes"
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    book_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)  # create | update | delete
+    version = Column(Integer, nullable=False)
+    # Состояние книги после записи; NULL для delete
+    title = Column(String, nullable=True)
+    author = Column(String, nullable=True)
+    year = Column(Integer, nullable=True)
+    changed_at = Column(Float, nullable=False)
+
+
+# Полнотекстовый поиск по названию в SQLite: внешняя FTS5-таблица поверх books,
+# синхронизируемая триггерами при любой записи (включая массовые операции)
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5("
+    "title, content='books', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN "
+    "INSERT INTO books_fts(rowid, title) VALUES (new.id, new.title); END",
+    "CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN "
+    "INSERT INTO books_fts(books_fts, rowid, title) VALUES ('delete', old.id, old.title); END",
+    "CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title ON books BEGIN "
+    "INSERT INTO books_fts(books_fts, rowid, title) VALUES ('delete', old.id, old.title); "
+    "INSERT INTO books_fts(rowid, title) VALUES (new.id, new.title); END",
+]
+
+for _statement in SQLITE_FTS_DDL:
+    event.listen(BookORM.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(
+    BookORM.__table__, "before_drop", DDL("DROP TABLE IF EXISTS books_fts").execute_if(dialect="sqlite")
+)
+
+# Сводки для GET /books/stats: число книг по автору и по году и общие счётчики
+# (total, without_year). Поддерживаются триггерами при любой записи, включая массовые,
+# поэтому статистика не зависит от размера каталога
+class AuthorStatsORM(Base):
+    __tablename__ = "book_author_stats"
+    author = Column(String, primary_key=True)
+    books = Column(Integer, nullable=False)
+
+
+class YearStatsORM(Base):
+    __tablename__ = "book_year_stats"
+    year = Column(Integer, primary_key=True)
+    books = Column(Integer, nullable=False)
+
+
+class CounterORM(Base):
+    __tablename__ = "book_counters"
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False)
+
+
+def _stats_add(row: str, sign: str) -> list[str]:
+    """Выражения, добавляющие книгу row (new/old) в сводки со знаком sign (+/-)."""
+    return [
+        f"INSERT INTO book_author_stats (author, books) VALUES ({row}.author, {sign}1) "
+        f"ON CONFLICT (author) DO UPDATE SET books = book_author_stats.books {sign} 1",
+        f"INSERT INTO book_year_stats (year, books) SELECT {row}.year, {sign}1 WHERE {row}.year IS NOT NULL "
+        f"ON CONFLICT (year) DO UPDATE SET books = book_year_stats.books {sign} 1",
+        f"INSERT INTO book_counters (name, value) SELECT 'without_year', {sign}1 WHERE {row}.year IS NULL "
+        f"ON CONFLICT (name) DO UPDATE SET value = book_counters.value {sign} 1",
+    ]
+
+
+_STATS_INSERT = _stats_add("new", "+") + [
+    "INSERT INTO book_counters (name, value) VALUES ('total', 1) "
+    "ON CONFLICT (name) DO UPDATE SET value = book_counters.value + 1",
+]
+_STATS_DELETE = _stats_add("old", "-") + [
+    "UPDATE book_counters SET value = value - 1 WHERE name = 'total'",
+]
+_STATS_CLEANUP = [
+    "DELETE FROM book_author_stats WHERE author = old.author AND books <= 0",
+    "DELETE FROM book_year_stats WHERE year = old.year AND books <= 0",
+]
+_STATS_CHANGED = "old.author IS NOT new.author OR old.year IS NOT new.year"
+
+
+def _body(statements: list[str]) -> str:
+    return " ".join(statement + ";" for statement in statements)
+
+
+SQLITE_STATS_DDL = [
+    f"CREATE TRIGGER IF NOT EXISTS books_stats_ai AFTER INSERT ON books BEGIN {_body(_STATS_INSERT)} END",
+    f"CREATE TRIGGER IF NOT EXISTS books_stats_ad AFTER DELETE ON books BEGIN "
+    f"{_body(_STATS_DELETE + _STATS_CLEANUP)} END",
+    f"CREATE TRIGGER IF NOT EXISTS books_stats_au AFTER UPDATE OF author, year ON books "
+    f"WHEN {_STATS_CHANGED} BEGIN {_body(_stats_add('old', '-') + _STATS_CLEANUP + _stats_add('new', '+'))} END",
+]
+
+POSTGRES_STATS_DDL = [
+    "CREATE OR REPLACE FUNCTION books_stats() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+    f"IF TG_OP = 'INSERT' THEN {_body(_STATS_INSERT)} "
+    f"ELSIF TG_OP = 'DELETE' THEN {_body(_STATS_DELETE + _STATS_CLEANUP)} "
+    f"ELSIF {_STATS_CHANGED.replace('IS NOT', 'IS DISTINCT FROM')} THEN "
+    f"{_body(_stats_add('old', '-') + _STATS_CLEANUP + _stats_add('new', '+'))} "
+    "END IF; RETURN NULL; END $$",
+    "DROP TRIGGER IF EXISTS books_stats ON books",
+    "CREATE TRIGGER books_stats AFTER INSERT OR DELETE OR UPDATE OF author, year ON books "
+    "FOR EACH ROW EXECUTE FUNCTION books_stats()",
+]
+
+# Пересчёт сводок с нуля через GROUP BY (при добавлении триггеров в существующую базу)
+STATS_REBUILD_SQL = [
+    "DELETE FROM book_author_stats",
+    "DELETE FROM book_year_stats",
+    "DELETE FROM book_counters",
+    "INSERT INTO book_author_stats (author, books) SELECT author, count(*) FROM books GROUP BY author",
+    "INSERT INTO book_year_stats (year, books) SELECT year, count(*) FROM books WHERE year IS NOT NULL GROUP BY year",
+    "INSERT INTO book_counters (name, value) SELECT 'total', count(*) FROM books",
+    "INSERT INTO book_counters (name, value) SELECT 'without_year', count(*) FROM books WHERE year IS NULL",
+]
+
+for _statement in SQLITE_STATS_DDL:
+    event.listen(BookORM.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+for _statement in POSTGRES_STATS_DDL:
+    event.listen(BookORM.__table__, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+
 
 # Pydantic модель
 class Book(BaseModel):
@@ -20,4 +168,86 @@ class Book(BaseModel):
     author: str
     year: Optional[int] = None
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Частичное обновление (PATCH): учитываются только переданные поля
+class BookPatch(BaseModel):
+    title: Optional[str] = None
+    author: Optional[str] = None
+    year: Optional[int] = None
+
+    @model_validator(mode="after")
+    def _check_required_columns(self):
+        for name in ("title", "author"):
+            if name in self.model_fields_set and getattr(self, name) is None:
+                raise ValueError(f"{name} cannot be null")
+        return self
+
+
+# Отчёт о массовых операциях: статус по каждому элементу запроса
+class BulkItemStatus(BaseModel):
+    id: int
+    status: Literal["created", "updated", "deleted", "conflict", "not_found", "duplicate", "failed"]
+
+
+class BulkReport(BaseModel):
+    items: list[BulkItemStatus]
+
+    @computed_field
+    @property
+    def summary(self) -> dict[str, int]:
+        return dict(Counter(item.status for item in self.items))
+
+
+# Статистика каталога (GET /books/stats)
+class AuthorCount(BaseModel):
+    author: str
+    books: int
+
+
+class DecadeCount(BaseModel):
+    decade: int  # 1960 — книги 1960–1969 годов
+    books: int
+
+
+class BookStats(BaseModel):
+    total: int
+    without_year: int
+    year_min: Optional[int] = None
+    year_max: Optional[int] = None
+    authors_total: int
+    authors: list[AuthorCount]  # самые многочисленные авторы, по убыванию
+    decades: list[DecadeCount]
+
+
+# Событие ленты изменений
+class BookChange(BaseModel):
+    seq: int
+    op: Literal["create", "update", "delete"]
+    book_id: int
+    version: int
+    book: Optional[Book] = None  # None для delete
+    changed_at: float
+
+
+class ChangePage(BaseModel):
+    changes: list[BookChange]
+    # Передайте как since в следующем запросе
+    next_since: int
+
+
+# Отчёт об импорте каталога (app/transfer.py)
+class ImportIssue(BaseModel):
+    record: int  # номер записи в файле, с 1 (без строки заголовка CSV)
+    error: str
+
+
+class ImportReport(BaseModel):
+    processed: int = 0  # записей прочитано, включая пропущенные при возобновлении
+    statuses: dict[str, int] = {}  # created / updated / conflict / duplicate
+    invalid: int = 0
+    errors: list[ImportIssue] = []
+    # Сколько записей уже зафиксировано: передайте как skip / --resume-from после сбоя
+    resume_from: int = 0
+    completed: bool = False
@@ -1,8 +1,48 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import select
-from .models import BookORM, Book, Base
+import asyncio
+import base64
+import binascii
+import heapq
+import logging
+import os
+import re
+import tempfile
+import time
+from bisect import bisect_right
+from collections import Counter
+from contextlib import AsyncExitStack, aclosing, asynccontextmanager
+from dataclasses import dataclass, field
+from operator import attrgetter, itemgetter
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from sqlalchemy import (
+    select, delete, insert, update, text, table, column, func, inspect, literal, literal_column, bindparam,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL, Row
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from .models import (
+    AuthorCount, AuthorStatsORM, BookORM, Book, BookChange, BookChangeORM, BookStats, Base, BulkItemStatus,
+    BulkReport, CounterORM, DecadeCount, TableVersionORM, YearStatsORM, POSTGRES_STATS_DDL, SQLITE_FTS_DDL,
+    SQLITE_STATS_DDL, STATS_REBUILD_SQL,
+)
 from .initial_data import initial_books
+from .engine import is_sqlite, is_sqlite_memory, make_engines, make_sessionmaker, session_dialect
+from .sharding import ShardSet, shard_urls
+from . import cache as cache_module
+from . import changes as changes_module
+from .cache import BookCache, MISSING
+from . import singleflight as singleflight_module
+from .singleflight import SingleFlight
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка не нужна, воркеры uvicorn там не форкаются
+    fcntl = None
+
+logger = logging.getLogger(__name__)
 
 class RepositoryError(Exception):
     """Базовое исключение для всех ошибок репозитория."""
@@ -16,70 +56,1101 @@ class AlreadyExistsError(RepositoryError):
     """Выбрасывается при попытке создать объект с существующим уникальным идентификатором."""
     pass
 
+class InvalidCursorError(RepositoryError):
+    """Выбрасывается, когда курсор страницы не удаётся разобрать."""
+    pass
+
+class PreconditionFailedError(RepositoryError):
+    """Выбрасывается, когда версия объекта не совпала с ожидаемой (If-Match)."""
+    pass
+
+class ChangesExpiredError(RepositoryError):
+    """Выбрасывается, когда запрошенные события уже удалены из журнала изменений."""
 
-DATABASE_URL = "sqlite+aiosqlite:///./books_di.db"
+    def __init__(self, message: str, head: int = 0):
+        super().__init__(message)
+        # seq последнего события: после повторной выгрузки каталога клиент продолжает с него
+        self.head = head
 
-engine = create_async_engine(DATABASE_URL, echo=False)
-AsyncSessionLocal = sessionmaker(
-    bind=engine, class_=AsyncSession, expire_on_commit=False
+class OverloadedError(RepositoryError):
+    """Выбрасывается, когда очередь записи переполнена и заявку нужно повторить позже."""
+    pass
+
+
+# Курсорная (keyset) пагинация по BookORM.id
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_PARTITION_SIZE = 500
+
+# Массовые операции: размер порции для IN (...) с учётом лимита параметров SQLite
+BULK_CHUNK_SIZE = 500
+# PostgreSQL: начиная с этого размера пакет загружается через COPY во временную таблицу
+COPY_THRESHOLD = 1000
+
+_BOOK_COLUMNS = (BookORM.id, BookORM.title, BookORM.author, BookORM.year)
+_STAGING_COLUMNS = (*_BOOK_COLUMNS, BookORM.version)
+_STAGING = table("books_staging", *(column(c.key) for c in _STAGING_COLUMNS))
+_FTS = table("books_fts", column("rowid"), column("books_fts"))
+
+# Выражения горячих путей строятся один раз, значения передаются параметрами
+_SELECT_VERSIONED = select(*_BOOK_COLUMNS, BookORM.version).where(BookORM.id == bindparam("book_id"))
+_SELECT_TABLE_VERSION = (
+    select(TableVersionORM.version, TableVersionORM.updated_at).where(TableVersionORM.name == "books")
+)
+_SELECT_PAGE = select(*_BOOK_COLUMNS).order_by(BookORM.id).limit(bindparam("limit"))
+_SELECT_PAGE_AFTER = _SELECT_PAGE.where(BookORM.id > bindparam("after"))
+_SELECT_ID = select(BookORM.id).where(BookORM.id == bindparam("book_id"))
+_SELECT_ANY = select(BookORM.id).limit(1)
+_SELECT_ONE = select(literal(1))
+
+# Статистика читается из сводок: размер ответа и время не зависят от числа книг
+STATS_TOP_AUTHORS = 20
+MAX_STATS_AUTHORS = 1000
+_DECADE = (YearStatsORM.year - (YearStatsORM.year % 10 + 10) % 10).label("decade")
+_SELECT_DECADES = select(_DECADE, func.sum(YearStatsORM.books).label("books")).group_by(_DECADE).order_by(_DECADE)
+_SELECT_YEAR_RANGE = select(func.min(YearStatsORM.year), func.max(YearStatsORM.year))
+_SELECT_TOP_AUTHORS = (
+    select(AuthorStatsORM.author, AuthorStatsORM.books)
+    .order_by(AuthorStatsORM.books.desc(), AuthorStatsORM.author)
+    .limit(bindparam("limit"))
 )
+_SELECT_AUTHORS_TOTAL = select(func.count()).select_from(AuthorStatsORM)
+_SELECT_AUTHOR_COUNTS = select(AuthorStatsORM.author, AuthorStatsORM.books)
+_SELECT_COUNTERS = select(CounterORM.name, CounterORM.value)
+
+
+def encode_cursor(book_id: int) -> str:
+    """Непрозрачный курсор: последний отданный id в base64."""
+    return base64.urlsafe_b64encode(str(book_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}")
+
+
+# engine — пул записи; read_engine — пул только для чтения (None, если разделение выключено).
+# Создаются не при импорте, а в lifespan (open_engines) или при первом обращении
+# к repository.engine / read_engine / AsyncSessionLocal: импорт не загружает драйвер
+# базы и не читает её настройки раньше времени
+_ENGINE_ATTRS = ("engine", "read_engine", "AsyncSessionLocal")
+
+# Шарды books (DATABASE_SHARDS); задаются в open_engines. engine, read_engine и
+# AsyncSessionLocal в этом режиме — пулы шарда 0
+shards: ShardSet | None = None
+
+
+def open_engines(settings=None) -> None:
+    """Создаёт движки и фабрику сессий процесса (повторный вызов ничего не делает)."""
+    global engine, read_engine, AsyncSessionLocal, shards
+    if "AsyncSessionLocal" in globals():
+        return
+    settings = settings or get_settings()
+    urls = shard_urls(settings)
+    if urls:
+        shards = ShardSet.from_urls(urls, settings)
+        engine, read_engine = shards[0].engine, shards[0].read_engine
+        AsyncSessionLocal = shards[0].session_factory
+        return
+    engine, read_engine = make_engines(settings)
+    AsyncSessionLocal = make_sessionmaker(engine, read_engine)
+
+
+def opened_engines() -> list[tuple[str, Any]]:
+    """Уже созданные движки ("write", "read" или по шардам) — без создания новых."""
+    if shards is not None:
+        return shards.engines()
+    names = (("write", globals().get("engine")), ("read", globals().get("read_engine")))
+    return [(name, pool_engine) for name, pool_engine in names if pool_engine is not None]
+
+
+async def dispose_engines() -> None:
+    for _, pool_engine in opened_engines():
+        await pool_engine.dispose()
+
+
+def open_session() -> AsyncSession:
+    """Новая сессия на пулах процесса."""
+    open_engines()
+    return AsyncSessionLocal()
+
+
+def __getattr__(name: str):
+    if name in _ENGINE_ATTRS:
+        open_engines()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Dependency для FastAPI
 # Теперь сессия будет передаваться в эндпойнт и завершаться при выходе из него
 async def get_session() -> AsyncSession:
-    async with AsyncSessionLocal() as session:
+    async with open_session() as session:
         yield session
 
+
+def make_repository() -> "BookRepository":
+    """Репозиторий на пулах процесса (по шардам, если они заданы); закрывается через close()."""
+    open_engines()
+    if shards is not None:
+        return ShardedBookRepository(shards)
+    return BookRepository(session_factory=open_session)
+
+
+async def get_repository() -> AsyncIterator["BookRepository"]:
+    """Репозиторий запроса: сессия открывается при первом обращении к базе.
+
+    Ответ из кэша или отказ валидации не открывают сессию и не берут соединение из пула.
+    """
+    repo = make_repository()
+    try:
+        yield repo
+    finally:
+        await repo.close()
+
 # Инициализация БД и начальные данные
+def upgrade_schema(connection) -> None:
+    """Досоздаёт колонки, индексы, FTS-таблицу и сводки статистики в базе, созданной до их появления."""
+    if "version" not in {c["name"] for c in inspect(connection).get_columns("books")}:
+        connection.exec_driver_sql("ALTER TABLE books ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    TableVersionORM.__table__.create(connection, checkfirst=True)
+    BookChangeORM.__table__.create(connection, checkfirst=True)
+    if not inspect(connection).has_table(CounterORM.__tablename__):
+        # Сводок ещё нет: создаём их вместе с триггерами и один раз считаем через GROUP BY
+        for summary in (AuthorStatsORM, YearStatsORM, CounterORM):
+            summary.__table__.create(connection, checkfirst=True)
+        stats_ddl = SQLITE_STATS_DDL if connection.dialect.name == "sqlite" else POSTGRES_STATS_DDL
+        for statement in stats_ddl + STATS_REBUILD_SQL:
+            connection.exec_driver_sql(statement)
+    for index in BookORM.__table__.indexes:
+        index.create(connection, checkfirst=True)
+    if connection.dialect.name == "sqlite" and not inspect(connection).has_table("books_fts"):
+        for statement in SQLITE_FTS_DDL:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+
+def init_lock_path(url: URL) -> str:
+    """Файл блокировки рядом с файлом SQLite, для остальных баз — во временном каталоге."""
+    rendered = url.render_as_string(hide_password=False)
+    if is_sqlite(rendered) and not is_sqlite_memory(rendered):
+        return url.database + ".init.lock"
+    return os.path.join(tempfile.gettempdir(), "books-init.lock")
+
+
+@asynccontextmanager
+async def init_lock(path: str):
+    """Межпроцессная блокировка: схему создаёт один процесс, остальные ждут и видят готовую.
+
+    Работает в пределах одного хоста; для нескольких хостов схему создаёт отдельный шаг
+    python -m app.server --init-only.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as lock_file:
+        # flock блокирует поток, а не цикл событий
+        await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    open_engines()
+    databases = [shard.engine for shard in shards] if shards is not None else [engine]
+    # Блокировка первой базы сериализует инициализацию всех шардов
+    async with init_lock(init_lock_path(databases[0].url)):
+        for database in databases:
+            async with database.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+                await conn.run_sync(upgrade_schema)
+
+        repo = make_repository()
+        try:
+            if await repo.is_empty():
+                await repo.bulk_create(initial_books)
+        finally:
+            await repo.close()
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(BookORM))
-        books = result.scalars().all()
-        if not books:
-            for book in initial_books:
-                session.add(BookORM(**book.model_dump()))
-            await session.commit()
+
+async def _prefill_pool(pool_engine) -> None:
+    """Открывает все постоянные соединения пула (прагмы SQLite выполняются сейчас, а не в запросе)."""
+    size = getattr(pool_engine.pool, "size", lambda: 1)()
+    async with AsyncExitStack() as stack:
+        for _ in range(size):
+            conn = await stack.enter_async_context(pool_engine.connect())
+            await conn.execute(_SELECT_ONE)
+
+
+async def warm_up() -> None:
+    """Прогрев до приёма трафика: соединения пулов, компиляция горячих выражений, кэш чтения."""
+    open_engines()
+    for _, pool_engine in opened_engines():
+        await _prefill_pool(pool_engine)
+    repo = make_repository()
+    try:
+        await repo.get_table_version()
+        await repo.get_page()
+        await repo.get_page_rows()
+        found = await repo.get_page(limit=1)
+        if found[0]:
+            await repo.get_versioned(found[0][0].id)
+    finally:
+        await repo.close()
 
 class BookRepository:
-    def __init__(self, session: AsyncSession):
-        self.session = session
+    def __init__(self, session: AsyncSession | None = None, cache: BookCache | None = None,
+                 flights: SingleFlight | None = None, session_factory: Callable[[], AsyncSession] | None = None):
+        # Без session сессия создаётся фабрикой при первом обращении и закрывается в close()
+        self._session = session
+        self._session_factory = session_factory
+        # По умолчанию общий кэш процесса (None, если кэш отключён настройками)
+        self.cache = cache if cache is not None else cache_module.book_cache
+        # Одновременные промахи по одному ключу ждут один запрос к базе
+        self.flights = flights if flights is not None else singleflight_module.book_flights
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._session_factory()
+        return self._session
+
+    async def close(self) -> None:
+        """Закрывает сессию, созданную фабрикой, и возвращает соединение в пул."""
+        if self._session is not None and self._session_factory is not None:
+            session, self._session = self._session, None
+            await session.close()
+
+    async def rollback(self) -> None:
+        if self._session is not None:
+            await self._session.rollback()
+
+    @property
+    def dialect(self):
+        return session_dialect(self.session)
+
+    async def ping(self) -> None:
+        """Проверка доступности базы (readiness)."""
+        await self.session.execute(_SELECT_ONE)
+
+    async def is_empty(self) -> bool:
+        # Достаточно узнать, есть ли хоть одна книга: LIMIT 1 вместо чтения всей таблицы
+        return (await self.session.execute(_SELECT_ANY)).first() is None
+
+    async def _read_through(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Берёт значение из кэша, при промахе выполняет запрос и кэширует результат.
+
+        Одновременные промахи по одному ключу объединяются: запрос выполняет первый,
+        остальные получают его результат, не занимая соединение из пула.
+        """
+        if self.cache is not None:
+            cached = await self.cache.get(key)
+            if cached is not MISSING:
+                return cached
+        if self.flights is None:
+            return await self._load(key, loader)
+        return await self.flights.do(key, lambda: self._load(key, loader))
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        if self.cache is None:
+            return await loader()
+        generation = self.cache.generation
+        value = await loader()
+        await self.cache.set(key, value, generation)
+        return value
+
+    async def _after_write(self, book_ids=()) -> None:
+        """После commit: сбрасывает кэш и загрузки по затронутым id и будит подписчиков ленты."""
+        if changes_module.change_feed is not None:
+            changes_module.change_feed.notify()
+        if self.flights is not None:
+            self.flights.forget(*(BookCache.book_key(book_id) for book_id in book_ids))
+            self.flights.forget_prefix("list:")
+        if self.cache is not None:
+            await self.cache.invalidate(book_ids)
+
+    async def _bump_version(self) -> int:
+        """Увеличивает счётчик изменений books в текущей транзакции и возвращает новое значение.
+
+        Значение пишется в version затронутых строк, поэтому версии не повторяются даже
+        после удаления и повторного создания книги.
+        """
+        now = time.time()
+        stmt = self._dialect_insert(TableVersionORM).values(name="books", version=1, updated_at=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TableVersionORM.name],
+            set_={"version": TableVersionORM.version + 1, "updated_at": now},
+        )
+        result = await self.session.execute(stmt.returning(TableVersionORM.version))
+        return result.scalar_one()
+
+    async def get_table_version(self) -> tuple[int, float | None]:
+        """Счётчик изменений books и время последней записи (0 и None для пустой истории).
+
+        Читается из базы мимо кэша: по нему строятся ETag и 304 списков, и он должен
+        видеть записи других воркеров сразу.
+        """
+        return await self._fetch_table_version()
+
+    async def _fetch_table_version(self) -> tuple[int, float | None]:
+        result = await self.session.execute(_SELECT_TABLE_VERSION)
+        row = result.one_or_none()
+        return (row.version, row.updated_at) if row is not None else (0, None)
+
+    async def _record_changes(self, version: int, changes: list[tuple[str, int, Book | None]]) -> None:
+        """Пишет события (op, id, книга после записи) в журнал в текущей транзакции."""
+        feed = changes_module.change_feed
+        if feed is None or not changes:
+            return
+        now = time.time()
+        await self.session.execute(insert(BookChangeORM), [
+            {
+                "book_id": book_id, "op": op, "version": version, "changed_at": now,
+                "title": book.title if book else None,
+                "author": book.author if book else None,
+                "year": book.year if book else None,
+            }
+            for op, book_id, book in changes
+        ])
+        if feed.count_write():
+            await self._trim_changes()
+
+    async def _trim_changes(self) -> None:
+        """Оставляет в журнале последние change_log_retention событий.
+
+        Граница удалённого запоминается в table_versions под именем book_changes, чтобы
+        отличать "событий не было" от "события уже удалены".
+        """
+        last = (await self.session.execute(select(func.max(BookChangeORM.seq)))).scalar()
+        horizon = (last or 0) - get_settings().change_log_retention
+        if horizon <= 0:
+            return
+        await self.session.execute(
+            delete(BookChangeORM).where(BookChangeORM.seq <= horizon),
+            execution_options={"synchronize_session": False},
+        )
+        stmt = self._dialect_insert(TableVersionORM).values(name="book_changes", version=horizon, updated_at=time.time())
+        await self.session.execute(stmt.on_conflict_do_update(
+            index_elements=[TableVersionORM.name], set_={"version": horizon, "updated_at": time.time()},
+        ))
+
+    async def get_changes(self, since: int = 0, limit: int = changes_module.CHANGES_PAGE_SIZE) -> list[BookChange]:
+        """События журнала с seq > since по возрастанию seq; since=0 — с самого старого хранимого.
+
+        ChangesExpiredError, если часть событий после since > 0 уже обрезана: клиенту нужно
+        заново выгрузить каталог и продолжить с head из ошибки (seq последнего события).
+        """
+        horizon = (await self.session.execute(
+            select(TableVersionORM.version).where(TableVersionORM.name == "book_changes")
+        )).scalar()
+        if horizon is not None and 0 < since < horizon:
+            head = (await self.session.execute(select(func.max(BookChangeORM.seq)))).scalar() or horizon
+            raise ChangesExpiredError(
+                f"Changes after {since} are no longer available, oldest kept is {horizon + 1}, head is {head}",
+                head=head,
+            )
+        result = await self.session.execute(
+            select(BookChangeORM).where(BookChangeORM.seq > since).order_by(BookChangeORM.seq).limit(limit)
+        )
+        return [
+            BookChange(
+                seq=row.seq, op=row.op, book_id=row.book_id, version=row.version, changed_at=row.changed_at,
+                book=Book(id=row.book_id, title=row.title, author=row.author, year=row.year)
+                if row.op != "delete" else None,
+            )
+            for row in result.scalars()
+        ]
+
+    async def get_stats(self, top_authors: int = STATS_TOP_AUTHORS) -> BookStats:
+        """Статистика каталога из сводок, которые триггеры обновляют при каждой записи."""
+        return await self._read_through(BookCache.list_key("stats", top_authors),
+                                        lambda: self._fetch_stats(top_authors))
+
+    async def _fetch_stats(self, top_authors: int) -> BookStats:
+        counters = dict((await self.session.execute(_SELECT_COUNTERS)).all())
+        year_min, year_max = (await self.session.execute(_SELECT_YEAR_RANGE)).one()
+        authors = await self.session.execute(_SELECT_TOP_AUTHORS, {"limit": top_authors})
+        decades = await self.session.execute(_SELECT_DECADES)
+        return BookStats(
+            total=counters.get("total", 0),
+            without_year=counters.get("without_year", 0),
+            year_min=year_min,
+            year_max=year_max,
+            authors_total=(await self.session.execute(_SELECT_AUTHORS_TOTAL)).scalar_one(),
+            authors=[AuthorCount(author=row.author, books=row.books) for row in authors],
+            decades=[DecadeCount(decade=row.decade, books=row.books) for row in decades],
+        )
 
     async def create(self, book: Book) -> Book:
-        db_book = BookORM(**book.model_dump())
-        self.session.add(db_book)
+        """Вставляет книгу; занятый id — AlreadyExistsError, как и при пакетной записи."""
+        try:
+            return await self._insert(book)
+        except IntegrityError:
+            await self.session.rollback()
+            raise AlreadyExistsError(f"Book with id {book.id} already exists")
+
+    async def _insert(self, book: Book) -> Book:
+        version = await self._bump_version()
+        if not self.dialect.insert_returning:
+            db_book = BookORM(**book.model_dump(), version=version)
+            self.session.add(db_book)
+            await self.session.flush()
+            await self._record_changes(version, [("create", db_book.id, Book.model_validate(db_book))])
+            await self.session.commit()
+            await self._after_write([db_book.id])
+            await self.session.refresh(db_book)
+            return Book.model_validate(db_book)
+
+        # INSERT ... RETURNING вместо commit + refresh: один запрос вместо двух
+        result = await self.session.execute(
+            insert(BookORM).values(**book.model_dump(), version=version).returning(*_BOOK_COLUMNS)
+        )
+        created = Book.model_validate(result.one())
+        await self._record_changes(version, [("create", created.id, created)])
         await self.session.commit()
-        await self.session.refresh(db_book)
-        return Book.model_validate(db_book)
+        await self._after_write([created.id])
+        return created
 
     async def get_all(self) -> list[Book]:
+        return await self._read_through(BookCache.list_key("all"), self._fetch_all)
+
+    async def _fetch_all(self) -> list[Book]:
         result = await self.session.execute(select(BookORM))
         books = result.scalars().all()
         return [Book.model_validate(b) for b in books]
 
+    async def get_page(self, limit: int = DEFAULT_PAGE_SIZE, after: str | None = None) -> tuple[list[Book], str | None]:
+        """Страница книг по возрастанию id и курсор следующей страницы (или None)."""
+        return await self._read_through(
+            BookCache.list_key("page", limit, after), lambda: self._fetch_page(limit, after)
+        )
+
+    async def _fetch_page(self, limit: int, after: str | None) -> tuple[list[Book], str | None]:
+        rows, next_cursor = await self._page_rows(limit, after)
+        return [Book.model_validate(row) for row in rows], next_cursor
+
+    async def get_page_rows(self, limit: int = DEFAULT_PAGE_SIZE,
+                            after: str | None = None) -> tuple[list[Row], str | None]:
+        """Как get_page, но строки (id, title, author, year) без построения Book."""
+        return await self._read_through(
+            BookCache.list_key("page-rows", limit, after), lambda: self._page_rows(limit, after)
+        )
+
+    async def _page_rows(self, limit: int, after: str | None) -> tuple[list[Row], str | None]:
+        """Страница всей таблицы по готовому выражению (без фильтров поиска)."""
+        if after is None:
+            result = await self.session.execute(_SELECT_PAGE, {"limit": limit + 1})
+        else:
+            result = await self.session.execute(
+                _SELECT_PAGE_AFTER, {"limit": limit + 1, "after": decode_cursor(after)}
+            )
+        return self._cut_page(result.all(), limit)
+
+    async def _keyset_page(self, stmt, limit: int, after: str | None) -> tuple[list[Book], str | None]:
+        rows, next_cursor = await self._keyset_rows(stmt, limit, after)
+        return [Book.model_validate(row) for row in rows], next_cursor
+
+    async def _keyset_rows(self, stmt, limit: int, after: str | None) -> tuple[list[Row], str | None]:
+        """Выполняет запрос страницей по id: берёт limit + 1 строк, чтобы узнать о продолжении."""
+        stmt = stmt.order_by(BookORM.id).limit(limit + 1)
+        if after is not None:
+            stmt = stmt.where(BookORM.id > decode_cursor(after))
+        result = await self.session.execute(stmt)
+        return self._cut_page(result.all(), limit)
+
+    @staticmethod
+    def _cut_page(rows: list[Row], limit: int) -> tuple[list[Row], str | None]:
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1][0])
+
+    async def stream_all(self, after: str | None = None,
+                         partition_size: int = STREAM_PARTITION_SIZE) -> AsyncIterator[list[Book]]:
+        """Отдаёт всю таблицу порциями через серверный курсор, не загружая её в память."""
+        async with aclosing(self.stream_rows(after, partition_size)) as partitions:
+            async for rows in partitions:
+                yield [Book.model_validate(row) for row in rows]
+
+    async def stream_rows(self, after: str | None = None,
+                          partition_size: int = STREAM_PARTITION_SIZE) -> AsyncIterator[list[Row]]:
+        """Как stream_all, но порции строк (id, title, author, year) без построения Book."""
+        stmt = (
+            select(*_BOOK_COLUMNS)
+            .order_by(BookORM.id)
+            .execution_options(yield_per=partition_size)
+        )
+        if after is not None:
+            stmt = stmt.where(BookORM.id > decode_cursor(after))
+        result = await self.session.stream(stmt)
+        try:
+            async for rows in result.partitions():
+                yield rows
+        finally:
+            await result.close()
+
+    async def search(
+        self,
+        author: str | None = None,
+        year_from: int | None = None,
+        year_to: int | None = None,
+        title_prefix: str | None = None,
+        q: str | None = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        after: str | None = None,
+    ) -> tuple[list[Book], str | None]:
+        """Поиск с фильтрами; страницы и курсор — как у get_page."""
+        key = BookCache.list_key("search", author, year_from, year_to, title_prefix, q, limit, after)
+        stmt = self._search_statement(author, year_from, year_to, title_prefix, q)
+        return await self._read_through(key, lambda: self._keyset_page(stmt, limit, after))
+
+    async def search_rows(self, author=None, year_from=None, year_to=None, title_prefix=None, q=None,
+                          limit: int = DEFAULT_PAGE_SIZE, after: str | None = None) -> tuple[list[Row], str | None]:
+        """Как search, но строки (id, title, author, year) без построения Book."""
+        key = BookCache.list_key("search-rows", author, year_from, year_to, title_prefix, q, limit, after)
+        stmt = self._search_statement(author, year_from, year_to, title_prefix, q)
+        return await self._read_through(key, lambda: self._keyset_rows(stmt, limit, after))
+
+    def _search_statement(self, author, year_from, year_to, title_prefix, q):
+        stmt = select(*_BOOK_COLUMNS)
+        if author is not None:
+            stmt = stmt.where(BookORM.author == author)
+        if year_from is not None:
+            stmt = stmt.where(BookORM.year >= year_from)
+        if year_to is not None:
+            stmt = stmt.where(BookORM.year <= year_to)
+        if title_prefix:
+            # Диапазон вместо LIKE, чтобы работал индекс ix_books_title
+            stmt = stmt.where(BookORM.title >= title_prefix, BookORM.title < title_prefix + "\U0010ffff")
+        if q is not None:
+            stmt = stmt.where(self._full_text_clause(q))
+        return stmt
+
+    def _full_text_clause(self, q: str):
+        """Условие полнотекстового поиска: все слова запроса, последнее — как префикс."""
+        words = re.findall(r"\w+", q)
+        if not words:
+            raise RepositoryError("Search query must contain at least one word")
+        if self.dialect.name == "postgresql":
+            terms = " & ".join(words[:-1] + [words[-1] + ":*"])
+            return func.to_tsvector(literal_column("'simple'"), BookORM.title).bool_op("@@")(
+                func.to_tsquery(literal_column("'simple'"), terms)
+            )
+        match = " ".join(f'"{word}"' for word in words) + "*"
+        return BookORM.id.in_(select(_FTS.c.rowid).where(_FTS.c.books_fts.match(match)))
+
     async def get(self, book_id: int) -> Book | None:
+        found = await self.get_versioned(book_id)
+        return found[0] if found is not None else None
+
+    async def get_versioned(self, book_id: int) -> tuple[Book, int] | None:
+        """Книга и версия её последней записи (для ETag)."""
+        return await self._read_through(BookCache.book_key(book_id), lambda: self._fetch_versioned(book_id))
+
+    async def _fetch_versioned(self, book_id: int) -> tuple[Book, int] | None:
+        result = await self.session.execute(_SELECT_VERSIONED, {"book_id": book_id})
+        row = result.one_or_none()
+        return (Book.model_validate(row), row.version) if row is not None else None
+
+    async def _fetch(self, book_id: int) -> Book | None:
         result = await self.session.execute(select(BookORM).where(BookORM.id == book_id))
         book = result.scalar_one_or_none()
         return Book.model_validate(book) if book else None
 
-    async def update(self, book_id: int, new_book: Book) -> Book:
-        result = await self.session.execute(select(BookORM).where(BookORM.id == book_id))
-        book = result.scalar_one_or_none()
-        if not book:
-            raise NotFoundError(f"Book with id {book_id} not found")
-        book.title = new_book.title
-        book.author = new_book.author
-        book.year = new_book.year
+    async def update(self, book_id: int, new_book: Book, if_match: set[int] | None = None) -> Book:
+        return await self._update_columns(
+            book_id, {"title": new_book.title, "author": new_book.author, "year": new_book.year}, if_match
+        )
+
+    async def patch(self, book_id: int, changes: dict[str, Any], if_match: set[int] | None = None) -> Book:
+        """Обновляет только переданные колонки."""
+        if not changes:
+            found = await self.get_versioned(book_id)
+            if found is None:
+                raise NotFoundError(f"Book with id {book_id} not found")
+            if if_match is not None and found[1] not in if_match:
+                raise PreconditionFailedError(f"Book with id {book_id} has changed")
+            return found[0]
+        return await self._update_columns(book_id, changes, if_match)
+
+    async def _missing_error(self, book_id: int, if_match: set[int] | None) -> RepositoryError:
+        """Почему запись не затронула строку: книги нет или её версия не из if_match."""
+        if if_match is not None:
+            result = await self.session.execute(_SELECT_ID, {"book_id": book_id})
+            if result.scalar_one_or_none() is not None:
+                return PreconditionFailedError(f"Book with id {book_id} has changed")
+        return NotFoundError(f"Book with id {book_id} not found")
+
+    async def _update_columns(self, book_id: int, values: dict[str, Any], if_match: set[int] | None = None) -> Book:
+        """Один UPDATE ... RETURNING; отсутствие книги определяется по числу затронутых строк.
+
+        if_match — допустимые версии строки (оптимистическая блокировка по If-Match).
+        """
+        version = await self._bump_version()
+        stmt = update(BookORM).where(BookORM.id == book_id).values(**values, version=version)
+        if if_match is not None:
+            stmt = stmt.where(BookORM.version.in_(if_match))
+        options = {"synchronize_session": False}
+        if self.dialect.update_returning:
+            result = await self.session.execute(stmt.returning(*_BOOK_COLUMNS), execution_options=options)
+            row = result.one_or_none()
+            found = row is not None
+        else:
+            result = await self.session.execute(stmt, execution_options=options)
+            row = None
+            found = result.rowcount > 0
+        if not found:
+            await self.session.rollback()
+            raise await self._missing_error(book_id, if_match)
+        book = Book.model_validate(row) if row is not None else await self._fetch(book_id)
+        await self._record_changes(version, [("update", book_id, book)])
         await self.session.commit()
-        await self.session.refresh(book)
-        return Book.from_orm(book)
+        await self._after_write([book_id])
+        return book
 
-    async def delete(self, book_id: int):
-        result = await self.session.execute(select(BookORM).where(BookORM.id == book_id))
-        book = result.scalar_one_or_none()
-        if not book:
-            raise NotFoundError(f"Book with id {book_id} not found")
-        await self.session.delete(book)
+    async def delete(self, book_id: int, if_match: set[int] | None = None):
+        version = await self._bump_version()
+        stmt = delete(BookORM).where(BookORM.id == book_id)
+        if if_match is not None:
+            stmt = stmt.where(BookORM.version.in_(if_match))
+        options = {"synchronize_session": False}
+        if self.dialect.delete_returning:
+            result = await self.session.execute(stmt.returning(BookORM.id), execution_options=options)
+            deleted = result.scalar_one_or_none() is not None
+        else:
+            result = await self.session.execute(stmt, execution_options=options)
+            deleted = result.rowcount > 0
+        if not deleted:
+            await self.session.rollback()
+            raise await self._missing_error(book_id, if_match)
+        await self._record_changes(version, [("delete", book_id, None)])
         await self.session.commit()
+        await self._after_write([book_id])
+
+    async def _existing_ids(self, ids: list[int]) -> set[int]:
+        existing = set()
+        for start in range(0, len(ids), BULK_CHUNK_SIZE):
+            chunk = ids[start:start + BULK_CHUNK_SIZE]
+            result = await self.session.execute(select(BookORM.id).where(BookORM.id.in_(chunk)))
+            existing.update(result.scalars())
+        return existing
+
+    def _dialect_insert(self, entity=BookORM):
+        """INSERT с поддержкой ON CONFLICT для текущего диалекта."""
+        if self.dialect.name == "postgresql":
+            return postgresql.insert(entity)
+        return sqlite.insert(entity)
+
+    async def _copy_to_staging(self, books: list[Book], version: int) -> None:
+        """PostgreSQL: загружает книги через COPY во временную таблицу books_staging."""
+        conn = await self.session.connection()
+        await conn.execute(text(
+            "CREATE TEMP TABLE IF NOT EXISTS books_staging "
+            "(LIKE books INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        ))
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            "books_staging",
+            records=[(book.id, book.title, book.author, book.year, version) for book in books],
+            columns=[c.key for c in _STAGING_COLUMNS],
+        )
+
+    async def _execute_insert(self, stmt, books: list[Book], version: int):
+        """Выполняет многострочный INSERT для пакета книг.
+
+        На PostgreSQL крупные пакеты идут через COPY и один INSERT ... SELECT из временной таблицы.
+        """
+        if self.dialect.name == "postgresql" and len(books) >= COPY_THRESHOLD:
+            await self._copy_to_staging(books, version)
+            names = [c.key for c in _STAGING_COLUMNS]
+            return await self.session.execute(stmt.from_select(names, select(*(_STAGING.c[n] for n in names))))
+        return await self.session.execute(stmt, [{**book.model_dump(), "version": version} for book in books])
+
+    async def bulk_create(self, books: list[Book]) -> BulkReport:
+        """Вставляет книги одной транзакцией; существующие id помечаются как conflict."""
+        inserted = set()
+        if books:
+            stmt = self._dialect_insert().on_conflict_do_nothing(index_elements=[BookORM.id])
+            version = await self._bump_version()
+            result = await self._execute_insert(stmt.returning(BookORM.id), books, version)
+            inserted.update(result.scalars())
+            # При повторе id в запросе вставлено первое вхождение
+            first = {}
+            for book in books:
+                first.setdefault(book.id, book)
+            await self._record_changes(version, [("create", book_id, first[book_id]) for book_id in inserted])
+            await self.session.commit()
+            await self._after_write(inserted)
+
+        items = []
+        seen = set()
+        for book in books:
+            if book.id in seen:
+                status = "duplicate"
+            elif book.id in inserted:
+                status = "created"
+            else:
+                status = "conflict"
+            seen.add(book.id)
+            items.append(BulkItemStatus(id=book.id, status=status))
+        return BulkReport(items=items)
+
+    async def bulk_upsert(self, books: list[Book]) -> BulkReport:
+        """Вставляет или обновляет книги одной транзакцией (ON CONFLICT DO UPDATE).
+
+        При повторе id в запросе побеждает последнее вхождение, остальные помечаются duplicate.
+        """
+        latest = {book.id: index for index, book in enumerate(books)}
+        existing = await self._existing_ids(list(latest))
+        if latest:
+            stmt = self._dialect_insert()
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[BookORM.id],
+                set_={
+                    "title": stmt.excluded.title,
+                    "author": stmt.excluded.author,
+                    "year": stmt.excluded.year,
+                    "version": stmt.excluded.version,
+                },
+            )
+            version = await self._bump_version()
+            await self._execute_insert(stmt, [books[index] for index in latest.values()], version)
+            await self._record_changes(version, [
+                ("update" if book_id in existing else "create", book_id, books[index])
+                for book_id, index in latest.items()
+            ])
+            await self.session.commit()
+            await self._after_write(latest)
+
+        items = []
+        for index, book in enumerate(books):
+            if latest[book.id] != index:
+                status = "duplicate"
+            elif book.id in existing:
+                status = "updated"
+            else:
+                status = "created"
+            items.append(BulkItemStatus(id=book.id, status=status))
+        return BulkReport(items=items)
+
+    async def bulk_delete(self, book_ids: list[int]) -> BulkReport:
+        """Удаляет книги по списку id одной транзакцией через DELETE ... WHERE id IN (...)."""
+        deleted = set()
+        unique_ids = list(dict.fromkeys(book_ids))
+        if unique_ids:
+            version = await self._bump_version()
+        for start in range(0, len(unique_ids), BULK_CHUNK_SIZE):
+            chunk = unique_ids[start:start + BULK_CHUNK_SIZE]
+            result = await self.session.execute(
+                delete(BookORM).where(BookORM.id.in_(chunk)).returning(BookORM.id),
+                execution_options={"synchronize_session": False},
+            )
+            deleted.update(result.scalars())
+        if unique_ids:
+            await self._record_changes(version, [("delete", book_id, None) for book_id in deleted])
+            await self.session.commit()
+            await self._after_write(deleted)
+
+        items = []
+        seen = set()
+        for book_id in book_ids:
+            if book_id in seen:
+                status = "duplicate"
+            elif book_id in deleted:
+                status = "deleted"
+            else:
+                status = "not_found"
+            seen.add(book_id)
+            items.append(BulkItemStatus(id=book_id, status=status))
+        return BulkReport(items=items)
+
+
+_row_id = itemgetter(0)
+
+
+class ShardedBookRepository(BookRepository):
+    """BookRepository поверх ShardSet: книга с id живёт в шарде shard_set.owner(id).
+
+    Чтение и запись по id идут в шард-владелец. Списки, поиск, статистика и выгрузка
+    опрашивают шарды одновременно (asyncio.gather) и сливают ответы по id; строки не
+    в своём шарде (копии, оставленные rebalance до cleanup) в ответы не попадают.
+    Кэш и single-flight общие: ключи книг по id глобальны, списки кэшируются уже слитыми.
+    Массовые операции — отдельная транзакция в каждом затронутом шарде: если шард
+    не смог зафиксировать свою часть, её элементы получают статус "failed", а части
+    остальных шардов остаются записанными.
+    """
+
+    def __init__(self, shard_set: ShardSet, cache: BookCache | None = None, flights: SingleFlight | None = None):
+        super().__init__(cache=cache, flights=flights)
+        self.shard_set = shard_set
+        self.shards = [
+            BookRepository(cache=self.cache, flights=self.flights, session_factory=shard.session_factory)
+            for shard in shard_set
+        ]
+
+    @property
+    def session(self) -> AsyncSession:
+        raise RuntimeError("ShardedBookRepository has no single session, use shards[i].session")
+
+    @property
+    def dialect(self):
+        # Диалект берётся у движка: сессия шарда ради этого не открывается
+        return self.shard_set.shards[0].engine.dialect
+
+    async def close(self) -> None:
+        for shard in self.shards:
+            await shard.close()
+
+    async def rollback(self) -> None:
+        for shard in self.shards:
+            await shard.rollback()
+
+    def _owner(self, book_id: int) -> BookRepository:
+        return self.shards[self.shard_set.owner(book_id)]
+
+    @staticmethod
+    async def _gather(calls) -> list:
+        """Выполняет вызовы одновременно; ошибка поднимается, когда завершились все остальные."""
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    def _owned(self, index: int, rows: list) -> list:
+        owner = self.shard_set.owner
+        return [row for row in rows if owner(row[0]) == index]
+
+    async def ping(self) -> None:
+        await self._gather(shard.ping() for shard in self.shards)
+
+    async def is_empty(self) -> bool:
+        return all(await self._gather(shard.is_empty() for shard in self.shards))
+
+    async def _fetch_table_version(self) -> tuple[int, float | None]:
+        versions = await self._gather(shard._fetch_table_version() for shard in self.shards)
+        # Сумма счётчиков шардов растёт при любой записи, поэтому годится как ETag списков
+        updated = [updated_at for _, updated_at in versions if updated_at is not None]
+        return sum(version for version, _ in versions), max(updated, default=None)
+
+    async def get_changes(self, since: int = 0, limit: int = changes_module.CHANGES_PAGE_SIZE) -> list[BookChange]:
+        raise RepositoryError("Change feed is not available with sharding")
+
+    @staticmethod
+    async def _shard_stats(shard: BookRepository):
+        counters = dict((await shard.session.execute(_SELECT_COUNTERS)).all())
+        year_range = (await shard.session.execute(_SELECT_YEAR_RANGE)).one()
+        authors = (await shard.session.execute(_SELECT_AUTHOR_COUNTS)).all()
+        decades = (await shard.session.execute(_SELECT_DECADES)).all()
+        return counters, year_range, authors, decades
+
+    async def _fetch_stats(self, top_authors: int) -> BookStats:
+        """Сводки шардов складываются; для точного топа читаются все строки сводки авторов."""
+        counters, authors, decades = Counter(), Counter(), Counter()
+        years = []
+        for shard_counters, year_range, shard_authors, shard_decades in \
+                await self._gather(self._shard_stats(shard) for shard in self.shards):
+            counters.update(shard_counters)
+            authors.update(dict(shard_authors))
+            decades.update(dict(shard_decades))
+            years.extend(year for year in year_range if year is not None)
+        top = sorted(authors.items(), key=lambda item: (-item[1], item[0]))[:top_authors]
+        return BookStats(
+            total=counters["total"],
+            without_year=counters["without_year"],
+            year_min=min(years, default=None),
+            year_max=max(years, default=None),
+            authors_total=len(authors),
+            authors=[AuthorCount(author=author, books=books) for author, books in top],
+            decades=[DecadeCount(decade=decade, books=books) for decade, books in sorted(decades.items())],
+        )
+
+    async def _fetch_all(self) -> list[Book]:
+        parts = await self._gather(shard._fetch_all() for shard in self.shards)
+        owner = self.shard_set.owner
+        return sorted(
+            (book for index, books in enumerate(parts) for book in books if owner(book.id) == index),
+            key=attrgetter("id"),
+        )
+
+    async def _page_rows(self, limit: int, after: str | None) -> tuple[list[Row], str | None]:
+        pages = await self._gather(shard._page_rows(limit, after) for shard in self.shards)
+        return self._merge_pages(pages, limit)
+
+    async def _keyset_rows(self, stmt, limit: int, after: str | None) -> tuple[list[Row], str | None]:
+        pages = await self._gather(shard._keyset_rows(stmt, limit, after) for shard in self.shards)
+        return self._merge_pages(pages, limit)
+
+    def _merge_pages(self, pages: list[tuple[list[Row], str | None]], limit: int) -> tuple[list[Row], str | None]:
+        """Сливает страницы шардов в одну с общим курсором.
+
+        Шард с продолжением прочитан только до своей последней строки: общая страница не
+        заходит дальше неё, иначе его следующие строки были бы пропущены.
+        """
+        rows = list(heapq.merge(*(self._owned(index, page) for index, (page, _) in enumerate(pages)), key=_row_id))
+        bound = min((page[-1][0] for page, cursor in pages if cursor is not None), default=None)
+        if bound is not None:
+            rows = rows[:bisect_right(rows, bound, key=_row_id)]
+        if len(rows) > limit:
+            return rows[:limit], encode_cursor(rows[limit - 1][0])
+        return rows, encode_cursor(bound) if bound is not None else None
+
+    async def stream_rows(self, after: str | None = None,
+                          partition_size: int = STREAM_PARTITION_SIZE) -> AsyncIterator[list[Row]]:
+        """Слияние серверных курсоров всех шардов по id.
+
+        Следующая порция каждого шарда читается заранее, пока сливается текущая. За шаг
+        отдаются строки до наименьшего из последних id в буферах: дальше него порядок
+        ещё не известен.
+        """
+        streams = [shard.stream_rows(after, partition_size) for shard in self.shards]
+        pending = [asyncio.ensure_future(anext(stream, None)) for stream in streams]
+        buffers: list[list[Row]] = [[] for _ in streams]
+
+        async def refill(index: int) -> None:
+            while not buffers[index] and pending[index] is not None:
+                rows = await pending[index]
+                if rows is None:
+                    pending[index] = None
+                    return
+                pending[index] = asyncio.ensure_future(anext(streams[index], None))
+                buffers[index] = self._owned(index, rows)
+
+        try:
+            merged: list[Row] = []
+            while True:
+                for index, buffer in enumerate(buffers):
+                    if not buffer:
+                        await refill(index)
+                active = [buffer for buffer in buffers if buffer]
+                if not active:
+                    break
+                bound = min(buffer[-1][0] for buffer in active)
+                ready = []
+                for buffer in active:
+                    cut = bisect_right(buffer, bound, key=_row_id)
+                    ready.append(buffer[:cut])
+                    del buffer[:cut]
+                merged.extend(heapq.merge(*ready, key=_row_id))
+                while len(merged) >= partition_size:
+                    yield merged[:partition_size]
+                    del merged[:partition_size]
+            if merged:
+                yield merged
+        finally:
+            for task in pending:
+                if task is not None:
+                    task.cancel()
+            await asyncio.gather(*(task for task in pending if task is not None), return_exceptions=True)
+            for stream in streams:
+                await stream.aclose()
+
+    async def get_versioned(self, book_id: int) -> tuple[Book, int] | None:
+        return await self._owner(book_id).get_versioned(book_id)
+
+    async def create(self, book: Book) -> Book:
+        return await self._owner(book.id).create(book)
+
+    async def update(self, book_id: int, new_book: Book, if_match: set[int] | None = None) -> Book:
+        return await self._owner(book_id).update(book_id, new_book, if_match)
+
+    async def patch(self, book_id: int, changes: dict[str, Any], if_match: set[int] | None = None) -> Book:
+        return await self._owner(book_id).patch(book_id, changes, if_match)
+
+    async def delete(self, book_id: int, if_match: set[int] | None = None):
+        await self._owner(book_id).delete(book_id, if_match)
+
+    async def _split(self, ids: list[int], items: list, call) -> BulkReport:
+        """Раскладывает массовую операцию по шардам-владельцам, отчёт — в исходном порядке."""
+        positions: dict[int, list[int]] = {}
+        for position, book_id in enumerate(ids):
+            positions.setdefault(self.shard_set.owner(book_id), []).append(position)
+        owners = list(positions)
+        reports = await asyncio.gather(
+            *(call(self.shards[owner], [items[position] for position in positions[owner]]) for owner in owners),
+            return_exceptions=True,
+        )
+        statuses: list[BulkItemStatus | None] = [None] * len(ids)
+        for owner, report in zip(owners, reports):
+            if isinstance(report, Exception):
+                # Остальные шарды уже зафиксированы: отчёт честно показывает частичный результат
+                logger.error("Bulk operation failed on shard %d", owner, exc_info=report)
+                await self.shards[owner].rollback()
+                for position in positions[owner]:
+                    statuses[position] = BulkItemStatus(id=ids[position], status="failed")
+                continue
+            if isinstance(report, BaseException):
+                raise report
+            for position, item in zip(positions[owner], report.items):
+                statuses[position] = item
+        return BulkReport(items=statuses)
+
+    async def bulk_create(self, books: list[Book]) -> BulkReport:
+        return await self._split([book.id for book in books], books, BookRepository.bulk_create)
+
+    async def bulk_upsert(self, books: list[Book]) -> BulkReport:
+        return await self._split([book.id for book in books], books, BookRepository.bulk_upsert)
+
+    async def bulk_delete(self, book_ids: list[int]) -> BulkReport:
+        return await self._split(book_ids, book_ids, BookRepository.bulk_delete)
+
+
+@dataclass
+class RebalanceReport:
+    scanned: int = 0
+    copied: int = 0
+    deleted: int = 0
+    # (из шарда, в шард) -> книг
+    moves: Counter = field(default_factory=Counter)
+
+
+async def rebalance_shards(shard_set: ShardSet, cleanup: bool = False, batch_size: int = BULK_CHUNK_SIZE,
+                           on_progress: Callable[[RebalanceReport], None] | None = None) -> RebalanceReport:
+    """Переносит книги к шардам-владельцам после добавления шардов в DATABASE_SHARDS.
+
+    Первый проход (cleanup=False) копирует книги владельцам через upsert и оставляет их
+    на старом месте: воркеры со старым списком шардов читают прежние строки, с новым —
+    строки владельца, копии в ответы не попадают. Запись на это время останавливается.
+    После перезапуска воркеров с новым списком cleanup удаляет копии; книгу, которой
+    у владельца нет, он сначала вставляет, не перезаписывая изменённые после переключения.
+    Оба прохода можно повторять после сбоя.
+    """
+    report = RebalanceReport()
+    for shard in shard_set:
+        source = BookRepository(session_factory=shard.session_factory)
+        after = None
+        try:
+            while True:
+                rows, after = await source._page_rows(batch_size, after)
+                report.scanned += len(rows)
+                misplaced: dict[int, list[Book]] = {}
+                for row in rows:
+                    owner = shard_set.owner(row.id)
+                    if owner != shard.index:
+                        misplaced.setdefault(owner, []).append(Book.model_validate(row))
+                # Соединение не держится между порциями, транзакция чтения не растёт
+                await source.close()
+                for owner, books in misplaced.items():
+                    target = BookRepository(session_factory=shard_set[owner].session_factory)
+                    try:
+                        copied = await (target.bulk_create(books) if cleanup else target.bulk_upsert(books))
+                    finally:
+                        await target.close()
+                    report.copied += copied.summary.get("created", 0) + copied.summary.get("updated", 0)
+                    report.moves[(shard.index, owner)] += len(books)
+                if cleanup and misplaced:
+                    deleted = await source.bulk_delete([book.id for books in misplaced.values() for book in books])
+                    report.deleted += deleted.summary.get("deleted", 0)
+                    await source.close()
+                if on_progress is not None:
+                    on_progress(report)
+                if after is None:
+                    break
+        finally:
+            await source.close()
+    return report
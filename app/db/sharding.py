@@ -0,0 +1,82 @@
+"""Горизонтальное разбиение books по нескольким базам (DATABASE_SHARDS).
+
+Книга с id живёт в шарде jump_hash(id, N) — jump consistent hash (Lamping, Veach):
+ключи распределяются равномерно без таблицы соответствия, а при добавлении шарда
+N -> N+1 переезжает только ~1/(N+1) книг, и все — в новый шард. Каждый шард — отдельная
+база со своей схемой, триггерами сводок, пулами и блокировкой писателя SQLite, поэтому
+запись в разные шарды идёт параллельно.
+
+Маршрутизацию и scatter-gather выполняет ShardedBookRepository (app/db/repository.py),
+перенос книг после добавления шарда — python -m app.cli rebalance.
+"""
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.config import Settings
+from .engine import make_engines, make_sessionmaker
+
+_MASK = (1 << 64) - 1
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Номер шарда для ключа из [0, buckets)."""
+    key &= _MASK
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & _MASK
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_urls(settings: Settings) -> list[str]:
+    return [url.strip() for url in settings.database_shards.split(",") if url.strip()]
+
+
+@dataclass
+class Shard:
+    index: int
+    url: str
+    engine: AsyncEngine
+    read_engine: AsyncEngine | None
+    session_factory: Callable[[], AsyncSession]
+
+
+class ShardSet:
+    """Шарды в порядке DATABASE_SHARDS; порядок определяет размещение книг и не меняется."""
+
+    def __init__(self, shards: list[Shard]):
+        if not shards:
+            raise ValueError("At least one shard is required")
+        self.shards = shards
+
+    @classmethod
+    def from_urls(cls, urls: list[str], settings: Settings) -> "ShardSet":
+        shards = []
+        for index, url in enumerate(urls):
+            engine, read_engine = make_engines(settings, url)
+            shards.append(Shard(index, url, engine, read_engine, make_sessionmaker(engine, read_engine)))
+        return cls(shards)
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    def __iter__(self):
+        return iter(self.shards)
+
+    def __getitem__(self, index: int) -> Shard:
+        return self.shards[index]
+
+    def owner(self, book_id: int) -> int:
+        return jump_hash(book_id, len(self.shards))
+
+    def engines(self) -> list[tuple[str, AsyncEngine]]:
+        """Пулы всех шардов с именами для метрик: shard0:write, shard0:read, ..."""
+        named = []
+        for shard in self.shards:
+            named.append((f"shard{shard.index}:write", shard.engine))
+            if shard.read_engine is not None:
+                named.append((f"shard{shard.index}:read", shard.read_engine))
+        return named
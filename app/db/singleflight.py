@@ -0,0 +1,80 @@
+"""Объединение одинаковых одновременных чтений (single-flight).
+
+Первый запрос по ключу (ведущий) выполняет загрузку сам, остальные ждут его результат
+или исключение. Если ведущего отменили (клиент отключился), ожидающие не получают
+CancelledError чужого запроса: один из них становится новым ведущим и повторяет загрузку.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable
+
+from app.config import get_settings
+
+
+@dataclass
+class SingleFlightStats:
+    leaders: int = 0
+    shared: int = 0
+    retries: int = 0
+
+
+class _LeaderCancelled(Exception):
+    pass
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.stats = SingleFlightStats()
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        while (future := self._calls.get(key)) is not None:
+            self.stats.shared += 1
+            try:
+                # shield: отмена ожидающего не должна отменять общий результат
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                self.stats.retries += 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.stats.leaders += 1
+        try:
+            result = await loader()
+        except asyncio.CancelledError:
+            self._fail(future, _LeaderCancelled())
+            raise
+        except BaseException as exc:
+            self._fail(future, exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    @staticmethod
+    def _fail(future: asyncio.Future, exc: BaseException) -> None:
+        future.set_exception(exc)
+        # Помечает исключение полученным, если ожидающих не было
+        future.exception()
+
+    def forget(self, *keys: Hashable) -> None:
+        """Следующие запросы по ключам начнут новую загрузку, не присоединяясь к текущей.
+
+        Вызывается после записи: загрузка, начатая до неё, может вернуть устаревшие данные.
+        """
+        for key in keys:
+            self._calls.pop(key, None)
+
+    def forget_prefix(self, prefix: str) -> None:
+        for key in [k for k in self._calls if isinstance(k, str) and k.startswith(prefix)]:
+            del self._calls[key]
+
+
+# Общий для процесса; None, если объединение отключено (BOOKS_SINGLEFLIGHT=0)
+book_flights = SingleFlight() if get_settings().singleflight else None
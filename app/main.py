@@ -1,38 +1,116 @@
+import time
+from app.startup import startup_report
+# Фаза import: всё, что загружает модуль приложения (FastAPI, SQLAlchemy, маршруты)
+_import_started = time.perf_counter()
+
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
+from app.compression import CompressionMiddleware
+from app.config import get_settings
+from app.metrics import MetricsMiddleware
+from app.profiling import ProfilerMiddleware
+from app.ratelimit import RateLimitMiddleware
 from app.routers.books import router as books_router
-from app.db.repository import init_db, RepositoryError, NotFoundError, AlreadyExistsError
+from app.routers.changes import router as changes_router
+from app.routers.health import router as health_router
+from app.routers.metrics import router as metrics_router
+from app.routers.profiling import router as profiling_router
+from app.db import batching, repository
+from app.schema import load_schema
+from app.db.repository import (
+    init_db, open_engines, warm_up, RepositoryError, NotFoundError, AlreadyExistsError, PreconditionFailedError,
+    OverloadedError, ChangesExpiredError, InvalidCursorError,
+)
 import traceback
 import logging
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Действия при запуске приложения
-    await init_db()
+    # Действия при запуске приложения; uvicorn не принимает запросы, пока они не завершатся
+    settings = get_settings()
+    with startup_report.phase("engines"):
+        open_engines(settings)
+    if settings.init_on_startup:
+        with startup_report.phase("init_db"):
+            await init_db()
+    if settings.warm_up:
+        with startup_report.phase("warm_up"):
+            await warm_up()
+    # Готовая схема из файла сборки; без неё — построение при прогреве, а не на первом /docs
+    with startup_report.phase("openapi"):
+        if not (settings.openapi_path and load_schema(app, settings.openapi_path)) and settings.warm_up:
+            app.openapi()
+    startup_report.log()
+    app.state.ready = True
     yield
+    # Остановка: сначала /ready отвечает 503, затем соединения закрываются
+    app.state.ready = False
+    if batching.create_batcher is not None:
+        await batching.create_batcher.close()
+    await repository.dispose_engines()
 
 app = FastAPI(title="Books Async DI API", lifespan=lifespan)
 
 # Подключаем роутеры
+app.include_router(changes_router)
 app.include_router(books_router)
+app.include_router(health_router)
+app.include_router(profiling_router)
+if get_settings().metrics_enabled:
+    app.include_router(metrics_router)
+
+# Ошибки репозитория -> HTTP-коды. Обработчики зарегистрированы в приложении, а не в
+# @app.middleware("http"): BaseHTTPMiddleware добавляет задачу и поток на каждый запрос
+# и буферизует потоковые ответы. Обработчик ищется по MRO, поэтому подклассы
+# RepositoryError без своего кода получают 400
+REPOSITORY_ERRORS = {
+    AlreadyExistsError: (400, None),
+    NotFoundError: (404, None),
+    InvalidCursorError: (400, None),
+    PreconditionFailedError: (412, None),
+    ChangesExpiredError: (410, None),
+    OverloadedError: (503, {"Retry-After": "1"}),
+    RepositoryError: (400, None),
+}
+
+
+def _repository_error_handler(status: int, headers: dict[str, str] | None):
+    async def handler(request: Request, exc: RepositoryError):
+        content = {"detail": str(exc)}
+        if isinstance(exc, ChangesExpiredError):
+            # С этого seq клиент продолжает чтение ленты после повторной выгрузки каталога
+            content["head"] = exc.head
+        return JSONResponse(status_code=status, content=content, headers=headers)
+    return handler
+
+
+for _error, (_status, _headers) in REPOSITORY_ERRORS.items():
+    app.add_exception_handler(_error, _repository_error_handler(_status, _headers))
+
+
+@app.exception_handler(Exception)
+async def internal_error_handler(request: Request, exc: Exception):
+    # Трассировка уходит в лог сервера (исключение пробрасывается дальше после ответа),
+    # клиенту — только в режиме отладки
+    content = {"detail": "Internal Server Error"}
+    if get_settings().debug:
+        content["error"] = str(exc)
+        content["trace"] = "".join(traceback.format_exception(exc))
+    return JSONResponse(status_code=500, content=content)
+
+
+if get_settings().compression:
+    app.add_middleware(CompressionMiddleware, minimum_size=get_settings().compression_min_size)
+
+# Снаружи сжатия: отказ не доходит до маршрутизации и базы
+app.add_middleware(RateLimitMiddleware)
+
+# Снаружи остальных: в профиль попадают ограничения, сжатие и отправка ответа
+app.add_middleware(ProfilerMiddleware)
+
+# Добавлено последним, поэтому внешнее: видит коды ответов, выставленные обработчиками ошибок
+if get_settings().metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
 
-@app.middleware("http")
-async def catch_exceptions_middleware(request: Request, call_next):
-    try:
-        return await call_next(request)
-    except AlreadyExistsError as ae:
-        return JSONResponse(status_code=400, content={"detail": str(ae)})
-    except NotFoundError as ne:
-        return JSONResponse(status_code=404, content={"detail": str(ne)})
-    except RepositoryError as re:
-        return JSONResponse(status_code=400, content={"detail": str(re)})
-    except Exception as e:
-        return JSONResponse(
-            status_code=500,
-            content={
-                "detail": "Internal Server Error",
-                "error": str(e),
-                "trace": traceback.format_exc()
-            }
-        )
+startup_report.record("import", time.perf_counter() - _import_started)
@@ -0,0 +1,273 @@
+"""Метрики запросов и БД в текстовом формате Prometheus.
+
+Middleware считает задержки по маршрутам, коды ответов и запросы в работе. События
+движка SQLAlchemy считают выражения и время запросов в рамках HTTP-запроса и отмечают
+N+1: одно и то же выражение, выполненное в запросе N_PLUS_ONE_THRESHOLD раз и больше.
+События пула замеряют, сколько запрос держит соединение: по этой гистограмме и
+загрузке пулов подбирается число воркеров под базу.
+Запись метрики — пара операций со словарём; текст собирается только при чтении /metrics.
+"""
+import logging
+import time
+from bisect import bisect_left
+from collections import Counter as _Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Iterable
+from weakref import WeakKeyDictionary, WeakSet
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+N_PLUS_ONE_THRESHOLD = 10
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+
+    def samples(self) -> Iterable[str]:
+        for values, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, values)} {value}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels) -> None:
+        self.inc(*labels, amount=-1)
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными границами; накопительные суммы считаются при выводе."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        # labels -> [счётчики по корзинам..., +Inf, сумма]
+        self._series: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def samples(self) -> Iterable[str]:
+        for values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series[:-1]):
+                cumulative += count
+                labels = _format_labels((*self.labels, "le"), (*values, bound))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, values)
+            yield f"{self.name}_sum{labels} {series[-1]}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+        # Функции, возвращающие готовые строки на момент чтения (кэш, пулы)
+        self.collectors: list[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        parts = [metric.render() for metric in self.metrics]
+        for collector in self.collectors:
+            parts.extend(collector())
+        return "\n".join(parts) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "books_http_requests_total", "HTTP-запросы по маршруту и коду ответа", ("method", "route", "status")))
+http_duration = registry.register(Histogram(
+    "books_http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route")))
+http_in_flight = registry.register(Gauge(
+    "books_http_requests_in_flight", "HTTP-запросы в работе"))
+db_statements = registry.register(Counter(
+    "books_db_statements_total", "SQL-выражения по маршруту", ("route",)))
+db_duration = registry.register(Histogram(
+    "books_db_query_duration_seconds", "Время выполнения SQL-выражения", ("route",), QUERY_BUCKETS))
+db_statements_per_request = registry.register(Histogram(
+    "books_db_statements_per_request", "SQL-выражений на HTTP-запрос", ("route",), STATEMENT_BUCKETS))
+db_n_plus_one = registry.register(Counter(
+    "books_db_n_plus_one_total", "Запросы, повторившие одно выражение N_PLUS_ONE_THRESHOLD раз", ("route",)))
+db_connection_hold = registry.register(Histogram(
+    "books_db_connection_hold_seconds", "Время от выдачи соединения из пула до возврата", ("route",)))
+
+
+@dataclass
+class RequestStats:
+    """Счётчики БД одного HTTP-запроса; маршрут известен только после маршрутизации."""
+    scope: dict
+    statements: int = 0
+    shapes: _Counter = field(default_factory=_Counter)
+    flagged: bool = False
+
+    @property
+    def route(self) -> str:
+        return route_label(self.scope)
+
+
+_current: ContextVar[RequestStats | None] = ContextVar("books_request_stats", default=None)
+
+
+def route_label(scope: dict) -> str:
+    # FastAPI кладёт найденный маршрут в scope; шаблон пути не раздувает число рядов
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Чистое ASGI-middleware: время, код ответа и счётчики БД каждого HTTP-запроса."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec()
+            _current.reset(token)
+            route = stats.route
+            http_requests.inc(scope["method"], route, status)
+            http_duration.observe(elapsed, scope["method"], route)
+            db_statements_per_request.observe(stats.statements, route)
+
+
+# Подписчики на время SQL-выражений по движкам: одна пара событий на движок, сколько бы
+# подписчиков (метрики, сброс нагрузки) ни было
+_statement_observers: WeakKeyDictionary = WeakKeyDictionary()
+
+
+def observe_statements(engine: AsyncEngine, observer: Callable[[str, float], None]) -> None:
+    """Вызывает observer(statement, elapsed) после каждого SQL-выражения движка.
+
+    Время начала хранится в контексте выполнения, а не в conn.info: при ошибке выражения
+    after_cursor_execute не вызывается, и начало уходит вместе с контекстом.
+    """
+    sync_engine = engine.sync_engine
+    observers = _statement_observers.get(sync_engine)
+    if observers is None:
+        observers = _statement_observers[sync_engine] = []
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            context._books_start = time.perf_counter()
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - context._books_start
+            for notify in observers:
+                notify(statement, elapsed)
+
+    observers.append(observer)
+
+
+_instrumented: WeakSet = WeakSet()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Подписывает движок на события выполнения SQL (повторный вызов ничего не делает)."""
+    sync_engine = engine.sync_engine
+    if sync_engine in _instrumented:
+        return
+    _instrumented.add(sync_engine)
+
+    @event.listens_for(sync_engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        stats = _current.get()
+        route = stats.route if stats is not None else "background"
+        connection_record.info["books_checkout"] = (time.perf_counter(), route)
+
+    @event.listens_for(sync_engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        checkout = connection_record.info.pop("books_checkout", None)
+        if checkout is not None:
+            db_connection_hold.observe(time.perf_counter() - checkout[0], checkout[1])
+
+    def _statement(statement: str, elapsed: float) -> None:
+        stats = _current.get()
+        route = stats.route if stats is not None else "background"
+        db_statements.inc(route)
+        db_duration.observe(elapsed, route)
+        if stats is None:
+            return
+        stats.statements += 1
+        stats.shapes[statement] += 1
+        if not stats.flagged and stats.shapes[statement] >= N_PLUS_ONE_THRESHOLD:
+            stats.flagged = True
+            db_n_plus_one.inc(route)
+            logger.warning("Possible N+1 on %s: %d x %s", route, stats.shapes[statement], statement[:200])
+
+    observe_statements(engine, _statement)
@@ -0,0 +1,322 @@
+"""Профилирование отдельных запросов по требованию.
+
+Выключено, пока не задан BOOKS_PROFILE_SECRET или BOOKS_PROFILE_SAMPLE_RATE. Запрос
+профилируется, если в нём есть заголовок X-Profile с действующей подписью
+(python -m app.profiling token) или он попал в случайную выборку.
+
+Поток-сэмплер раз в interval снимает стек потока цикла событий. Пока задача запроса
+выполняется, берётся её стек вместе с кодом SQLAlchemy в greenlet (загрузка ORM,
+валидация, сериализация). Пока задача ждёт, берётся цепочка await до ожидаемого
+объекта. Так ожидание потока aiosqlite видно как [await Future] под Connection._execute,
+а очередь к занятому циклу — как [ready: loop busy].
+
+Стеки пишутся в формате collapsed (flamegraph.pl, inferno, speedscope), по файлу на
+запрос. /debug/profiles показывает самые медленные недавние запросы по маршрутам.
+"""
+import asyncio
+import hashlib
+import hmac
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import asdict, dataclass, field
+from itertools import count
+from pathlib import Path
+
+import greenlet
+
+from app.config import get_settings
+from app.metrics import route_label
+
+HEADER = b"x-profile"
+# Служебные маршруты не профилируются; /debug/profiles принимает X-Profile как пропуск
+SKIP_PATHS = ("/health", "/ready", "/metrics", "/debug/")
+
+
+def sign_token(secret: str, ttl: float = 300.0, now: float | None = None) -> str:
+    """Значение X-Profile: срок действия и HMAC-SHA256 от него."""
+    expires = str(int((time.time() if now is None else now) + ttl))
+    return f"{expires}.{hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()}"
+
+
+def verify_token(secret: str, token: str, now: float | None = None) -> bool:
+    """Проверка X-Profile; любое искажённое значение — False, а не исключение."""
+    expires, _, signature = token.partition(".")
+    # isdigit() без isascii() пропускает "²", который не разбирает int()
+    if not secret or not (expires.isascii() and expires.isdigit()):
+        return False
+    expected = hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    # Заголовок декодирован как latin-1: байты сравниваются без ошибки для любых символов
+    if not hmac.compare_digest(signature.encode("latin-1", "replace"), expected.encode()):
+        return False
+    return int(expires) >= (time.time() if now is None else now)
+
+
+def _label(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_qualname}"
+
+
+def _await_chain(coro) -> list:
+    """Кадры приостановленной цепочки корутин, от внешней к ожидающей."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    # SQLAlchemy ждёт драйвер в greenlet_spawn, а синхронная часть стека (курсор aiosqlite,
+    # загрузка ORM) остаётся в приостановленном дочернем greenlet
+    if frames and frames[-1].f_code.co_name == "greenlet_spawn":
+        child = frames[-1].f_locals.get("context")
+        if isinstance(child, greenlet.greenlet) and child.gr_frame is not None:
+            frames += _frames_until(child.gr_frame, None)[0]
+    return frames
+
+
+def _frames_until(frame, root) -> tuple[list, bool]:
+    """Кадры от root до frame (от внешнего к внутреннему) и признак, что root найден."""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        if frame is root:
+            return frames[::-1], True
+        frame = frame.f_back
+    return frames[::-1], False
+
+
+def _waiting_label(task: asyncio.Task) -> str:
+    """Чего ждёт приостановленная задача.
+
+    Ожидаемый future хранится только в закрытом атрибуте Task._fut_waiter; если его нет
+    (другая реализация задач), причина ожидания не уточняется.
+    """
+    if not hasattr(task, "_fut_waiter"):
+        return "[suspended]"
+    waiter = task._fut_waiter
+    return "[ready: loop busy]" if waiter is None else f"[await {type(waiter).__name__}]"
+
+
+@dataclass
+class ProfileSession:
+    """Профиль одного запроса; stacks пополняет поток-сэмплер."""
+    id: str
+    reason: str
+    thread_id: int
+    task: asyncio.Task
+    # greenlet цикла: пока SQLAlchemy выполняет синхронный код в дочернем greenlet,
+    # стек задачи доступен только через его gr_frame
+    hub: greenlet.greenlet
+    stacks: Counter = field(default_factory=Counter)
+
+    def sample(self, frames: dict) -> None:
+        root = self.task.get_coro().cr_frame
+        if root is None:
+            return
+        # Задача выполняется, если её корневой кадр есть в стеке потока цикла, либо в стеке
+        # приостановленного greenlet цикла, пока SQLAlchemy работает в дочернем greenlet
+        stack, running = _frames_until(frames.get(self.thread_id), root)
+        if not running and self.hub.gr_frame is not None:
+            outer, running = _frames_until(self.hub.gr_frame, root)
+            stack = outer + stack
+        if running:
+            labels = [_label(frame) for frame in stack]
+        else:
+            labels = [_label(frame) for frame in _await_chain(self.task.get_coro())]
+            labels.append(_waiting_label(self.task))
+        if labels:
+            self.stacks[";".join(labels)] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {samples}\n" for stack, samples in self.stacks.most_common())
+
+
+@dataclass
+class ProfiledRequest:
+    id: str
+    method: str
+    route: str
+    status: int
+    duration_ms: float
+    samples: int
+    reason: str
+    at: float
+
+
+@dataclass
+class ProfilerStats:
+    header: int = 0
+    sample: int = 0
+    rejected: int = 0
+    samples: int = 0
+
+
+class RequestProfiler:
+    """Отбор запросов, поток-сэмплер, файлы профилей и сводка по маршрутам."""
+
+    def __init__(self, directory: str | Path, secret: str = "", sample_rate: float = 0.0,
+                 interval: float = 0.005, keep: int = 20, max_files: int = 500):
+        self.directory = Path(directory)
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.keep = keep
+        self.max_files = max_files
+        self.stats = ProfilerStats()
+        self._sessions: list[ProfileSession] = []
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._ids = count(1)
+        self._files: dict[str, Path] = {}
+        self._recent: dict[str, deque[ProfiledRequest]] = {}
+
+    def authorized(self, scope: dict) -> bool:
+        for name, value in scope.get("headers", ()):
+            if name == HEADER:
+                return verify_token(self.secret, value.decode("latin-1"))
+        return False
+
+    def select(self, scope: dict) -> str | None:
+        """Причина профилировать запрос: header, sample или None."""
+        if any(name == HEADER for name, _ in scope.get("headers", ())):
+            if self.authorized(scope):
+                self.stats.header += 1
+                return "header"
+            self.stats.rejected += 1
+        if self.sample_rate and random.random() < self.sample_rate:
+            self.stats.sample += 1
+            return "sample"
+        return None
+
+    def start(self, reason: str) -> ProfileSession:
+        """Вызывается из задачи запроса; поток-сэмплер запускается по первому профилю."""
+        session = ProfileSession(
+            id=f"{int(time.time())}-{next(self._ids)}", reason=reason,
+            thread_id=threading.get_ident(), task=asyncio.current_task(), hub=greenlet.getcurrent(),
+        )
+        with self._lock:
+            self._sessions.append(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="books-profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session: ProfileSession) -> None:
+        with self._lock:
+            self._sessions.remove(session)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                sessions = list(self._sessions)
+                if not sessions:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for session in sessions:
+                session.sample(frames)
+            self.stats.samples += len(sessions)
+            del frames
+
+    def save(self, session: ProfileSession, scope: dict, status: int, duration: float) -> ProfiledRequest:
+        # Файл — несколько килобайт; пишется в цикле, профилируются единичные запросы
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{session.id}.collapsed"
+        path.write_text(session.collapsed(), encoding="utf-8")
+        self._files[session.id] = path
+        while len(self._files) > self.max_files:
+            oldest = next(iter(self._files))
+            self._files.pop(oldest).unlink(missing_ok=True)
+
+        record = ProfiledRequest(
+            id=session.id, method=scope["method"], route=route_label(scope), status=status,
+            duration_ms=round(duration * 1000, 3), samples=sum(session.stacks.values()),
+            reason=session.reason, at=time.time(),
+        )
+        self._recent.setdefault(record.route, deque(maxlen=self.keep)).append(record)
+        return record
+
+    def path(self, profile_id: str) -> Path | None:
+        return self._files.get(profile_id)
+
+    def slowest(self) -> list[dict]:
+        """Недавние профили по маршрутам, самые медленные маршруты и запросы первыми."""
+        routes = [
+            {"route": route, "requests": [asdict(r) for r in sorted(records, key=lambda r: -r.duration_ms)]}
+            for route, records in self._recent.items()
+        ]
+        return sorted(routes, key=lambda item: -item["requests"][0]["duration_ms"])
+
+
+class ProfilerMiddleware:
+    """Чистое ASGI-middleware: профилирует выбранные запросы целиком, вместе с сжатием.
+
+    Номер профиля приходит в заголовке X-Profile-Id. Профилировщик берётся из модуля
+    при каждом запросе, чтобы его можно было подменить.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        profiler = request_profiler
+        if profiler is None or scope["type"] != "http" or scope["path"].startswith(SKIP_PATHS):
+            return await self.app(scope, receive, send)
+        reason = profiler.select(scope)
+        if reason is None:
+            return await self.app(scope, receive, send)
+
+        status = 500
+        session = profiler.start(reason)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", ()), (b"x-profile-id", session.id.encode())]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop(session)
+            profiler.save(session, scope, status, time.perf_counter() - start)
+
+
+def make_profiler(settings=None) -> RequestProfiler | None:
+    settings = settings or get_settings()
+    if not settings.profile_secret and not settings.profile_sample_rate:
+        return None
+    return RequestProfiler(
+        settings.profile_dir or Path(tempfile.gettempdir()) / "books-profiles",
+        secret=settings.profile_secret,
+        sample_rate=settings.profile_sample_rate,
+        interval=settings.profile_interval_ms / 1000,
+        keep=settings.profile_keep,
+        max_files=settings.profile_max_files,
+    )
+
+
+request_profiler = make_profiler()
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != "token" or len(argv) > 2:
+        print("usage: python -m app.profiling token [ttl_seconds]", file=sys.stderr)
+        return 2
+    secret = get_settings().profile_secret
+    if not secret:
+        print("BOOKS_PROFILE_SECRET is not set", file=sys.stderr)
+        return 2
+    print(sign_token(secret, float(argv[1]) if len(argv) == 2 else 300.0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""Ограничение частоты по клиентам и сброс нагрузки.
+
+Каждый клиент (X-API-Key или адрес) получает два token bucket: на чтение (GET/HEAD)
+и на запись. Исчерпанный бюджет — 429 с Retry-After до появления токена.
+
+Независимо от клиентов запрос отклоняется с 503, если одновременно обрабатывается
+больше max_concurrency запросов. Когда сглаженная задержка SQL-выражений выше порога,
+предел снижается до degraded_concurrency: очередь к единственному писателю SQLite
+не растёт, а запросы, которые всё же проходят, продолжают измерять задержку.
+"""
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from weakref import WeakSet
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.responses import JSONResponse
+
+from app.config import get_settings
+from app.metrics import observe_statements
+
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+# Служебные маршруты не ограничиваются: пробы и сбор метрик должны работать при перегрузке
+EXEMPT_PATHS = ("/health", "/ready", "/metrics", "/debug/")
+# Подписки на ленту держат запрос открытым часами и не занимают слот конкурентности
+LONG_LIVED_PATHS = ("/books/changes/stream",)
+# Вес нового замера в сглаженной задержке
+LATENCY_SMOOTHING = 0.2
+# Замер старше этого считается неактуальным (база давно не отвечала медленно)
+LATENCY_STALE_AFTER = 5.0
+
+
+@dataclass
+class Budget:
+    """Token bucket: rate токенов в секунду, не больше burst накопленных."""
+    name: str
+    rate: float
+    burst: float
+
+
+@dataclass
+class LimiterStats:
+    allowed: int = 0
+    limited: int = 0
+
+
+class RateLimiter(ABC):
+    """Хранилище корзин; take возвращает 0, если токен выдан, иначе секунды до следующего."""
+
+    def __init__(self, read: Budget, write: Budget):
+        self.read = read
+        self.write = write
+        self.stats = LimiterStats()
+
+    def budget(self, method: str) -> Budget:
+        return self.read if method in READ_METHODS else self.write
+
+    async def acquire(self, key: str, budget: Budget) -> float:
+        wait = await self.take(f"{budget.name}:{key}", budget)
+        if wait:
+            self.stats.limited += 1
+        else:
+            self.stats.allowed += 1
+        return wait
+
+    @abstractmethod
+    async def take(self, key: str, budget: Budget) -> float:
+        ...
+
+
+class MemoryRateLimiter(RateLimiter):
+    """Корзины в памяти процесса; при нескольких воркерах бюджет у каждого свой."""
+
+    def __init__(self, read: Budget, write: Budget, max_clients: int = 100_000):
+        super().__init__(read, write)
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def take(self, key: str, budget: Budget) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (budget.burst, now))
+        tokens = min(budget.burst, tokens + (now - updated) * budget.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / budget.rate
+        self._buckets[key] = (tokens, now)
+        # Давно не приходившие клиенты вытесняются первыми (их корзины и так полны)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+# Атомарное списание токена на стороне Redis: общий бюджет для всех воркеров и хостов
+_REDIS_TAKE = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """Общие для всех воркеров корзины поверх клиента с API redis.asyncio."""
+
+    def __init__(self, read: Budget, write: Budget, client, namespace: str = "books-ratelimit:"):
+        super().__init__(read, write)
+        self.client = client
+        self.namespace = namespace
+        self._take = client.register_script(_REDIS_TAKE)
+
+    @classmethod
+    def from_url(cls, read: Budget, write: Budget, url: str) -> "RedisRateLimiter":
+        try:
+            import redis.asyncio as redis
+        except ImportError as exc:
+            raise RuntimeError("Для BOOKS_RATE_LIMIT_BACKEND=redis установите пакет redis") from exc
+        return cls(read, write, redis.from_url(url))
+
+    async def take(self, key: str, budget: Budget) -> float:
+        wait = await self._take(keys=[self.namespace + key], args=[budget.rate, budget.burst, time.time()])
+        return float(wait)
+
+
+@dataclass
+class SheddingStats:
+    concurrency: int = 0
+    db_latency: int = 0
+
+
+class LoadShedder:
+    """Предел одновременных запросов, снижаемый при медленной базе."""
+
+    def __init__(self, max_concurrency: int = 256, degraded_concurrency: int = 16,
+                 latency_threshold: float = 0.25):
+        self.max_concurrency = max_concurrency
+        self.degraded_concurrency = degraded_concurrency
+        self.latency_threshold = latency_threshold
+        self.in_flight = 0
+        self.db_latency = 0.0
+        self._measured_at = 0.0
+        self.stats = SheddingStats()
+
+    def observe(self, seconds: float) -> None:
+        """Замер времени SQL-выражения (экспоненциальное сглаживание)."""
+        self.db_latency += LATENCY_SMOOTHING * (seconds - self.db_latency)
+        self._measured_at = time.monotonic()
+
+    @property
+    def degraded(self) -> bool:
+        fresh = time.monotonic() - self._measured_at < LATENCY_STALE_AFTER
+        return fresh and self.db_latency > self.latency_threshold
+
+    @property
+    def limit(self) -> int:
+        return self.degraded_concurrency if self.degraded else self.max_concurrency
+
+    def admit(self) -> str | None:
+        """Занимает слот или возвращает причину отказа."""
+        if self.in_flight >= self.limit:
+            reason = "db_latency" if self.degraded else "concurrency"
+            setattr(self.stats, reason, getattr(self.stats, reason) + 1)
+            return reason
+        self.in_flight += 1
+        return None
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+
+_watched: WeakSet = WeakSet()
+
+
+def watch_db_latency(engine: AsyncEngine) -> None:
+    """Передаёт время каждого SQL-выражения движка в load_shedder.
+
+    Время замеряет общая с метриками пара событий движка (observe_statements), а не своя.
+    """
+    sync_engine = engine.sync_engine
+    if sync_engine in _watched:
+        return
+    _watched.add(sync_engine)
+
+    def _observe(statement: str, elapsed: float) -> None:
+        if load_shedder is not None:
+            load_shedder.observe(elapsed)
+
+    observe_statements(engine, _observe)
+
+
+def client_key(scope: dict) -> str:
+    """Клиент по X-API-Key, иначе по адресу (uvicorn с proxy_headers берёт его из X-Forwarded-For)."""
+    for name, value in scope.get("headers", ()):
+        if name == b"x-api-key":
+            return "key:" + value.decode("latin-1")
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+def _reject(status: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=status, content={"detail": detail},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class RateLimitMiddleware:
+    """Чистое ASGI-middleware: квоты клиентов (429) и сброс нагрузки (503) до маршрутизации.
+
+    Ограничители берутся из модуля при каждом запросе, чтобы их можно было подменить.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PATHS):
+            return await self.app(scope, receive, send)
+
+        limiter = rate_limiter
+        if limiter is not None:
+            budget = limiter.budget(scope["method"])
+            wait = await limiter.acquire(client_key(scope), budget)
+            if wait:
+                return await _reject(429, f"Rate limit exceeded ({budget.name})", wait)(scope, receive, send)
+
+        shedder = load_shedder
+        if shedder is None or scope["path"].startswith(LONG_LIVED_PATHS):
+            return await self.app(scope, receive, send)
+        reason = shedder.admit()
+        if reason is not None:
+            return await _reject(503, f"Server overloaded ({reason})", 1)(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            shedder.release()
+
+
+def make_rate_limiter(settings=None) -> RateLimiter | None:
+    settings = settings or get_settings()
+    if not settings.rate_limit:
+        return None
+    read = Budget("read", settings.rate_limit_read_rps, settings.rate_limit_read_burst)
+    write = Budget("write", settings.rate_limit_write_rps, settings.rate_limit_write_burst)
+    if settings.rate_limit_backend == "redis":
+        return RedisRateLimiter.from_url(read, write, settings.rate_limit_redis_url)
+    if settings.rate_limit_backend == "memory":
+        return MemoryRateLimiter(read, write)
+    raise ValueError(f"Unknown rate limit backend: {settings.rate_limit_backend!r}")
+
+
+def make_load_shedder(settings=None) -> LoadShedder | None:
+    settings = settings or get_settings()
+    if not settings.load_shedding:
+        return None
+    return LoadShedder(
+        max_concurrency=settings.shed_max_concurrency,
+        degraded_concurrency=settings.shed_degraded_concurrency,
+        latency_threshold=settings.shed_db_latency_ms / 1000,
+    )
+
+
+rate_limiter = make_rate_limiter()
+load_shedder = make_load_shedder()
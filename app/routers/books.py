@@ -1,39 +1,246 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.models import Book
-from app.db.repository import BookRepository, get_session, NotFoundError
+from typing import Annotated, AsyncIterator, Literal
+from fastapi import APIRouter, Body, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from app.conditional import (
+    book_etag, if_match_versions, is_not_modified, list_etag, not_modified, validator_headers,
+)
+from app.config import get_settings
+from app.db import batching as batching_module
+from app.db.models import Book, BookPatch, BookStats, BulkReport, ImportReport
+from app.db.repository import (
+    BookRepository, decode_cursor, get_repository, NotFoundError, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, MAX_STATS_AUTHORS,
+    STATS_TOP_AUTHORS,
+)
+from app.serialization import BookRowsResponse, RowFormat, negotiate_format
+from app.transfer import EXPORT_FORMATS, FileFormat, ImportMode, export_books, import_books
 
 router = APIRouter(prefix="/books", tags=["books"])
 
+# Сессия закрывается сразу после обработчика: соединение возвращается в пул до отправки ответа
+Repository = Annotated[BookRepository, Depends(get_repository, scope="function")]
+# Потоковым ответам база нужна, пока отправляется тело: сессия закрывается после ответа
+StreamingRepository = Annotated[BookRepository, Depends(get_repository)]
+
+# Ограничение размера одного массового запроса
+MAX_BULK_ITEMS = 50_000
+
+
+def _rows_page(rows, next_cursor: str | None, headers: dict[str, str], fmt: RowFormat | None = None) -> Response:
+    """Страница прямо из строк запроса: JSON (BOOKS_FAST_JSON) или формат из Accept."""
+    if next_cursor is not None:
+        headers = {**headers, "X-Next-Cursor": next_cursor}
+    if fmt is not None:
+        return Response(fmt.page(rows), media_type=fmt.media_type, headers=headers)
+    return BookRowsResponse(rows, headers=headers)
+
+
+async def _list_validators(repo: BookRepository, request: Request,
+                           fmt: RowFormat | None) -> tuple[dict[str, str], bool]:
+    """ETag и Last-Modified списка по счётчику изменений таблицы и признак "не изменился".
+
+    Счётчик читается до самих данных: если запись вклинится между ними, клиент получит
+    свежие данные со старым ETag и просто скачает их ещё раз, но не наоборот.
+    """
+    version, modified = await repo.get_table_version()
+    etag = list_etag(version, fmt.media_type.rsplit("/", 1)[-1] if fmt else None)
+    headers = {**validator_headers(etag, modified), "Vary": "Accept"}
+    return headers, is_not_modified(request, etag, modified)
+
+
+def _check_cursor(after: str | None) -> None:
+    """Разбирает курсор до потокового ответа: после отправки заголовков ошибка уже не станет 400."""
+    if after is not None:
+        decode_cursor(after)
+
+
+async def _ndjson(partitions: AsyncIterator[list[Book]]) -> AsyncIterator[str]:
+    async for books in partitions:
+        yield "".join(book.model_dump_json() + "\n" for book in books)
+
+
+async def _json_array(partitions: AsyncIterator[list[Book]]) -> AsyncIterator[str]:
+    yield "["
+    first = True
+    async for books in partitions:
+        if not books:
+            continue
+        chunk = ",".join(book.model_dump_json() for book in books)
+        yield chunk if first else "," + chunk
+        first = False
+    yield "]"
+
 
 @router.post("/", response_model=Book)
-async def create_book(book: Book, session: AsyncSession = Depends(get_session)):
-    repo = BookRepository(session)
-    return await repo.create(book)
+async def create_book(book: Book, response: Response, repo: Repository):
+    batcher = batching_module.create_batcher
+    if batcher is None:
+        return await repo.create(book)
+    # BOOKS_WRITE_BATCHING: запись идёт пакетом вместе с соседними запросами
+    created = await batcher.submit(book)
+    if not batcher.waits_for_commit:
+        response.status_code = 202
+    return created
 
 
 @router.get("/", response_model=list[Book])
-async def get_books(session: AsyncSession = Depends(get_session)):
-    repo = BookRepository(session)
-    return await repo.get_all()
+async def get_books(
+    request: Request,
+    response: Response,
+    repo: Repository,
+    # Сессия открывается при первом обращении, поэтому без stream этот репозиторий ничего не держит
+    stream_repo: StreamingRepository,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: str | None = Query(None, description="Курсор из заголовка X-Next-Cursor"),
+    stream: Literal["ndjson", "json"] | None = Query(
+        None, description="Потоковая выгрузка всей таблицы; с Accept: text/csv, application/msgpack "
+                          "или application/vnd.apache.arrow.stream — в этом формате"),
+):
+    fmt = negotiate_format(request.headers.get("accept"))
+    if stream is not None:
+        _check_cursor(after)
+    headers, unchanged = await _list_validators(repo, request, fmt)
+    if unchanged:
+        return not_modified(headers)
+    if fmt is not None:
+        if stream is not None:
+            return StreamingResponse(fmt.stream(stream_repo.stream_rows(after)), media_type=fmt.media_type,
+                                     headers=headers)
+        return _rows_page(*await repo.get_page_rows(limit, after), headers, fmt)
+    if stream == "ndjson":
+        return StreamingResponse(_ndjson(stream_repo.stream_all(after)), media_type="application/x-ndjson",
+                                 headers=headers)
+    if stream == "json":
+        return StreamingResponse(_json_array(stream_repo.stream_all(after)), media_type="application/json",
+                                 headers=headers)
+
+    if get_settings().fast_json:
+        return _rows_page(*await repo.get_page_rows(limit, after), headers)
+    response.headers.update(headers)
+
+    books, next_cursor = await repo.get_page(limit, after)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return books
+
+
+@router.get("/search", response_model=list[Book])
+async def search_books(
+    request: Request,
+    response: Response,
+    repo: Repository,
+    author: str | None = Query(None, description="Точное совпадение автора"),
+    year_from: int | None = Query(None),
+    year_to: int | None = Query(None),
+    title_prefix: str | None = Query(None, min_length=1),
+    q: str | None = Query(None, min_length=1, description="Полнотекстовый поиск по названию"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: str | None = Query(None, description="Курсор из заголовка X-Next-Cursor"),
+):
+    fmt = negotiate_format(request.headers.get("accept"))
+    headers, unchanged = await _list_validators(repo, request, fmt)
+    if unchanged:
+        return not_modified(headers)
+    if fmt is not None or get_settings().fast_json:
+        return _rows_page(*await repo.search_rows(author, year_from, year_to, title_prefix, q, limit, after),
+                          headers, fmt)
+    response.headers.update(headers)
+
+    books, next_cursor = await repo.search(author, year_from, year_to, title_prefix, q, limit, after)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return books
+
+
+@router.get("/stats", response_model=BookStats)
+async def get_stats(
+    request: Request,
+    response: Response,
+    repo: Repository,
+    top_authors: int = Query(STATS_TOP_AUTHORS, ge=0, le=MAX_STATS_AUTHORS),
+):
+    """Число книг по авторам и десятилетиям, диапазон годов и итоги (из сводок, без обхода каталога)."""
+    version, modified = await repo.get_table_version()
+    headers = validator_headers(list_etag(version, "stats"), modified)
+    if is_not_modified(request, headers["ETag"], modified):
+        return not_modified(headers)
+    response.headers.update(headers)
+    return await repo.get_stats(top_authors)
+
+
+# Массовые операции объявлены до /{book_id}, иначе "bulk" попадёт в путь как book_id
+@router.post("/bulk", response_model=BulkReport)
+async def bulk_create_books(
+    books: Annotated[list[Book], Body(max_length=MAX_BULK_ITEMS)],
+    repo: Repository,
+):
+    return await repo.bulk_create(books)
+
+
+@router.put("/bulk", response_model=BulkReport)
+async def bulk_upsert_books(
+    books: Annotated[list[Book], Body(max_length=MAX_BULK_ITEMS)],
+    repo: Repository,
+):
+    return await repo.bulk_upsert(books)
+
+
+@router.delete("/bulk", response_model=BulkReport)
+async def bulk_delete_books(
+    book_ids: Annotated[list[int], Body(max_length=MAX_BULK_ITEMS)],
+    repo: Repository,
+):
+    return await repo.bulk_delete(book_ids)
+
+
+@router.post("/import", response_model=ImportReport)
+async def import_catalogue(
+    request: Request,
+    repo: Repository,
+    format: FileFormat = Query("ndjson"),
+    mode: ImportMode = Query("upsert"),
+    skip: int = Query(0, ge=0, description="Продолжить после сбоя: resume_from из прошлого отчёта"),
+):
+    """Тело запроса — NDJSON или CSV (с заголовком id,title,author,year), читается потоком."""
+    return await import_books(repo, request.stream(), format, mode, skip)
+
+
+@router.get("/export")
+async def export_catalogue(
+    repo: StreamingRepository,
+    format: FileFormat = Query("ndjson"),
+    after: str | None = Query(None, description="Курсор: выгрузить книги после него"),
+):
+    return StreamingResponse(
+        export_books(repo, format, after),
+        media_type=EXPORT_FORMATS[format].media_type,
+        headers={"Content-Disposition": f'attachment; filename="books.{format}"'},
+    )
 
 
 @router.get("/{book_id}", response_model=Book)
-async def get_book(book_id: int, session: AsyncSession = Depends(get_session)):
-    repo = BookRepository(session)
-    book = await repo.get(book_id)
-    if not book:
+async def get_book(book_id: int, request: Request, response: Response, repo: Repository):
+    found = await repo.get_versioned(book_id)
+    if not found:
         raise NotFoundError(f"Book with id={book_id} not found")
+    book, version = found
+    headers = validator_headers(book_etag(version))
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified(headers)
+    response.headers.update(headers)
     return book
 
+# If-Match с ETag из GET /books/{book_id}: запись пройдёт, только если книгу с тех пор не меняли (иначе 412)
 @router.put("/{book_id}", response_model=Book)
-async def update_book(book_id: int, book: Book, session: AsyncSession = Depends(get_session)):
-    repo = BookRepository(session)
-    return await repo.update(book_id, book)
+async def update_book(book_id: int, book: Book, request: Request, repo: Repository):
+    return await repo.update(book_id, book, if_match=if_match_versions(request))
+
+
+@router.patch("/{book_id}", response_model=Book)
+async def patch_book(book_id: int, changes: BookPatch, request: Request, repo: Repository):
+    return await repo.patch(book_id, changes.model_dump(exclude_unset=True), if_match=if_match_versions(request))
 
 
 @router.delete("/{book_id}", response_model=dict)
-async def delete_book(book_id: int, session: AsyncSession = Depends(get_session)):
-    repo = BookRepository(session)
-    await repo.delete(book_id)
+async def delete_book(book_id: int, request: Request, repo: Repository):
+    await repo.delete(book_id, if_match=if_match_versions(request))
     return {"message": "Book deleted"}
@@ -0,0 +1,104 @@
+"""Лента изменений: догоняющее чтение, SSE и websocket.
+
+Клиент выгружает каталог, запоминает seq последнего события (GET /books/changes) и дальше
+получает только изменения. После разрыва поток продолжается с since (или Last-Event-ID
+для SSE) без пропусков; если события уже обрезаны — 410 с head (seq последнего события):
+каталог выгружается заново, и чтение продолжается с head. since=0 начинает с самого
+старого хранимого события и 410 не получает.
+"""
+import asyncio
+from typing import Annotated, AsyncIterator
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, WebSocket
+from fastapi.responses import StreamingResponse
+
+from app.db import changes as changes_module
+from app.db.models import BookChange, ChangePage
+from app.db.repository import BookRepository, ChangesExpiredError, get_repository
+
+# Объявлен до роутера книг, иначе /books/changes попадёт в /books/{book_id}
+router = APIRouter(prefix="/books/changes", tags=["changes"])
+
+StreamingRepository = Annotated[BookRepository, Depends(get_repository)]
+
+# Код закрытия websocket, если события после since уже обрезаны (аналог HTTP 410)
+WS_CLOSE_EXPIRED = 4410
+
+
+def _feed() -> changes_module.ChangeFeed:
+    if changes_module.change_feed is None:
+        raise HTTPException(status_code=404, detail="Change feed is disabled")
+    return changes_module.change_feed
+
+
+def _follow(repo: BookRepository, since: int) -> AsyncIterator[list[BookChange]]:
+    async def fetch(after: int, limit: int) -> list[BookChange]:
+        try:
+            return await repo.get_changes(after, limit)
+        finally:
+            # Подписчик не держит соединение между опросами и видит свежий снимок базы
+            await repo.close()
+
+    return _feed().follow(fetch, since)
+
+
+def _sse_events(changes: list[BookChange]) -> str:
+    if not changes:
+        return ": keep-alive\n\n"
+    return "".join(f"id: {c.seq}\nevent: {c.op}\ndata: {c.model_dump_json()}\n\n" for c in changes)
+
+
+@router.get("", response_model=ChangePage)
+async def get_changes(
+    repo: StreamingRepository,
+    since: int = Query(0, ge=0, description="seq последнего полученного события"),
+    limit: int = Query(changes_module.CHANGES_PAGE_SIZE, ge=1, le=10_000),
+):
+    _feed()
+    changes = await repo.get_changes(since, limit)
+    return ChangePage(changes=changes, next_since=changes[-1].seq if changes else since)
+
+
+@router.get("/stream")
+async def stream_changes(
+    repo: StreamingRepository,
+    since: int = Query(0, ge=0),
+    last_event_id: int | None = Header(None, description="Передаётся EventSource при переподключении"),
+):
+    """Server-sent events: id — seq, event — create/update/delete, data — BookChange."""
+    since = last_event_id if last_event_id is not None else since
+    # Проверяем горизонт до начала ответа, чтобы отдать 410, а не оборванный поток
+    await repo.get_changes(since, 1)
+
+    async def events():
+        async for changes in _follow(repo, since):
+            yield _sse_events(changes)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.websocket("/ws")
+async def changes_websocket(websocket: WebSocket, repo: StreamingRepository, since: int = Query(0, ge=0)):
+    """Каждое событие — текстовое сообщение с BookChange в JSON."""
+    await websocket.accept()
+
+    async def pump():
+        async for changes in _follow(repo, since):
+            for change in changes:
+                await websocket.send_text(change.model_dump_json())
+
+    async def wait_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(pump()), asyncio.create_task(wait_disconnect())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    except ChangesExpiredError as exc:
+        await websocket.close(code=WS_CLOSE_EXPIRED, reason=str(exc)[:120])
+    finally:
+        for task in tasks:
+            task.cancel()
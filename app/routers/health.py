@@ -0,0 +1,35 @@
+"""Проверки для оркестратора: /health — процесс жив, /ready — можно слать трафик."""
+import asyncio
+import logging
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import JSONResponse
+
+from app.db.repository import BookRepository, get_repository
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["health"])
+
+# Дольше этого база считается недоступной, и воркер выводится из балансировки
+READY_TIMEOUT = 2.0
+
+
+@router.get("/health", include_in_schema=False)
+async def health():
+    return {"status": "ok"}
+
+
+@router.get("/ready", include_in_schema=False)
+async def ready(request: Request, repo: Annotated[BookRepository, Depends(get_repository, scope="function")]):
+    # Флаг выставляет lifespan после создания схемы и прогрева и снимает при остановке
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    try:
+        await asyncio.wait_for(repo.ping(), READY_TIMEOUT)
+    except Exception:
+        # Причина только в журнале: эндпойнт открыт, а текст ошибки содержит адреса и пути базы
+        logger.exception("Readiness check failed")
+        return JSONResponse(status_code=503, content={"status": "unavailable"})
+    return {"status": "ready"}
@@ -0,0 +1,106 @@
+from fastapi import APIRouter, Response
+
+from app import metrics, profiling, ratelimit
+from app.startup import startup_report
+from app.db import batching as batching_module
+from app.db import cache as cache_module
+from app.db import repository
+from app.db import singleflight as singleflight_module
+
+router = APIRouter(tags=["metrics"])
+
+
+def _cache_metrics():
+    cache = cache_module.book_cache
+    if cache is None:
+        return
+    for name, value in vars(cache.stats).items():
+        yield f"# TYPE books_cache_{name}_total counter\nbooks_cache_{name}_total {value}"
+
+
+def _singleflight_metrics():
+    flights = singleflight_module.book_flights
+    if flights is None:
+        return
+    yield "# TYPE books_singleflight_requests_total counter"
+    for name, value in vars(flights.stats).items():
+        yield f'books_singleflight_requests_total{{role="{name}"}} {value}'
+    yield f"# TYPE books_singleflight_in_flight gauge\nbooks_singleflight_in_flight {len(flights)}"
+
+
+def _batching_metrics():
+    batcher = batching_module.create_batcher
+    if batcher is None:
+        return
+    yield "# TYPE books_write_batching_total counter"
+    for name, value in vars(batcher.stats).items():
+        yield f'books_write_batching_total{{kind="{name}"}} {value}'
+    yield f"# TYPE books_write_queue_depth gauge\nbooks_write_queue_depth {len(batcher)}"
+
+
+def _limiter_metrics():
+    limiter = ratelimit.rate_limiter
+    if limiter is not None:
+        yield "# TYPE books_rate_limit_requests_total counter"
+        for name, value in vars(limiter.stats).items():
+            yield f'books_rate_limit_requests_total{{result="{name}"}} {value}'
+    shedder = ratelimit.load_shedder
+    if shedder is not None:
+        yield "# TYPE books_shed_requests_total counter"
+        for name, value in vars(shedder.stats).items():
+            yield f'books_shed_requests_total{{reason="{name}"}} {value}'
+        yield f"# TYPE books_shed_in_flight gauge\nbooks_shed_in_flight {shedder.in_flight}"
+        yield f"# TYPE books_shed_limit gauge\nbooks_shed_limit {shedder.limit}"
+        yield f"# TYPE books_db_latency_smoothed_seconds gauge\nbooks_db_latency_smoothed_seconds {shedder.db_latency:.6f}"
+
+
+def _profiler_metrics():
+    profiler = profiling.request_profiler
+    if profiler is None:
+        return
+    yield "# TYPE books_profiled_requests_total counter"
+    for reason in ("header", "sample"):
+        yield f'books_profiled_requests_total{{reason="{reason}"}} {getattr(profiler.stats, reason)}'
+    yield f"# TYPE books_profile_rejected_total counter\nbooks_profile_rejected_total {profiler.stats.rejected}"
+    yield f"# TYPE books_profile_samples_total counter\nbooks_profile_samples_total {profiler.stats.samples}"
+
+
+def _pool_metrics():
+    utilization = []
+    yield "# TYPE books_db_pool_connections gauge"
+    for name, engine in repository.opened_engines():
+        pool = getattr(engine, "pool", None)
+        # StaticPool и пулы in-memory SQLite не ведут счётчиков
+        if pool is None or not hasattr(pool, "checkedout"):
+            continue
+        yield f'books_db_pool_connections{{pool="{name}",state="checked_out"}} {pool.checkedout()}'
+        yield f'books_db_pool_connections{{pool="{name}",state="idle"}} {pool.checkedin()}'
+        yield f'books_db_pool_connections{{pool="{name}",state="size"}} {pool.size()}'
+        yield f'books_db_pool_connections{{pool="{name}",state="overflow"}} {pool.overflow()}'
+        capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+        utilization.append(f'books_db_pool_utilization{{pool="{name}"}} {pool.checkedout() / capacity:.3f}')
+    if utilization:
+        yield "# TYPE books_db_pool_utilization gauge"
+        yield from utilization
+
+
+def _startup_metrics():
+    if not startup_report.phases:
+        return
+    yield "# TYPE books_startup_seconds gauge"
+    for phase, seconds in startup_report.phases.items():
+        yield f'books_startup_seconds{{phase="{phase}"}} {seconds:.6f}'
+
+
+metrics.registry.add_collector(_cache_metrics)
+metrics.registry.add_collector(_singleflight_metrics)
+metrics.registry.add_collector(_batching_metrics)
+metrics.registry.add_collector(_limiter_metrics)
+metrics.registry.add_collector(_profiler_metrics)
+metrics.registry.add_collector(_pool_metrics)
+metrics.registry.add_collector(_startup_metrics)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,31 @@
+"""Сводка профилей запросов и файлы .collapsed (app/profiling.py)."""
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from app import profiling
+
+router = APIRouter(prefix="/debug/profiles", tags=["profiling"])
+
+
+def _profiler(request: Request) -> profiling.RequestProfiler:
+    profiler = profiling.request_profiler
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    # Сводка открывается тем же подписанным X-Profile, что и профилирование; без секрета
+    # (только случайная выборка) она недоступна: пути и времена запросов не для всех
+    if not profiler.authorized(request.scope):
+        raise HTTPException(status_code=403, detail="Valid X-Profile token required")
+    return profiler
+
+
+@router.get("", include_in_schema=False)
+async def list_profiles(request: Request):
+    return _profiler(request).slowest()
+
+
+@router.get("/{profile_id}", include_in_schema=False)
+async def get_profile(profile_id: str, request: Request):
+    path = _profiler(request).path(profile_id)
+    if path is None or not path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(path.read_text(encoding="utf-8"))
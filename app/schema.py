@@ -0,0 +1,52 @@
+"""Готовая OpenAPI-схема: собирается при сборке образа, воркер только читает файл.
+
+    python -m app.schema openapi.json     # при сборке (схема зависит только от кода)
+    BOOKS_OPENAPI_PATH=openapi.json python -m app.server
+
+Без файла FastAPI строит схему при первом /openapi.json (или при прогреве) в каждом воркере.
+"""
+import json
+import logging
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI
+
+logger = logging.getLogger(__name__)
+
+
+def build_schema(app: FastAPI, path: str | Path) -> dict:
+    schema = app.openapi()
+    Path(path).write_text(json.dumps(schema, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    return schema
+
+
+def load_schema(app: FastAPI, path: str | Path) -> bool:
+    """Подставляет схему из файла; если файла нет или он битый — схема будет построена как обычно."""
+    try:
+        schema = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError) as exc:
+        logger.warning("OpenAPI artifact %s is not usable (%s), schema will be generated", path, exc)
+        return False
+    if schema.get("info", {}).get("title") != app.title:
+        logger.warning("OpenAPI artifact %s was built for another app, schema will be generated", path)
+        return False
+    # FastAPI.openapi() возвращает готовый openapi_schema и не строит его заново
+    app.openapi_schema = schema
+    return True
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("usage: python -m app.schema <output.json>", file=sys.stderr)
+        return 2
+    from app.main import app
+
+    schema = build_schema(app, argv[0])
+    print(f"{argv[0]}: {len(schema.get('paths', {}))} paths", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
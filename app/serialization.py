@@ -0,0 +1,205 @@
+"""Быстрая сериализация книг: строки запроса (id, title, author, year) сразу в байты.
+
+Минует ORM-объекты, Book.model_validate и повторную валидацию response_model в FastAPI;
+схема сериализатора собирается один раз при импорте. Кроме JSON — компактные форматы для
+выгрузок (CSV, MessagePack, Arrow IPC), выбираемые по заголовку Accept.
+"""
+import csv
+import importlib.util
+import io
+from typing import AsyncIterator, Iterable, Optional, Sequence
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+from typing_extensions import TypedDict
+
+
+class BookRow(TypedDict):
+    id: int
+    title: str
+    author: str
+    year: Optional[int]
+
+
+_book_rows_adapter = TypeAdapter(list[BookRow])
+_book_row_adapter = TypeAdapter(BookRow)
+
+
+def book_rows_to_dicts(rows: Iterable[Sequence]) -> list[dict]:
+    return [{"id": row[0], "title": row[1], "author": row[2], "year": row[3]} for row in rows]
+
+
+def dump_book_rows(rows: Iterable[Sequence]) -> bytes:
+    return _book_rows_adapter.dump_json(book_rows_to_dicts(rows))
+
+
+class BookRowsResponse(Response):
+    """JSON-ответ со списком книг, построенный напрямую из строк запроса."""
+
+    media_type = "application/json"
+
+    def render(self, content: Iterable[Sequence]) -> bytes:
+        return dump_book_rows(content)
+
+
+# ----------------------------------------------------------------------
+# Компактные форматы: страница целиком (page) или поток порций строк (stream)
+# ----------------------------------------------------------------------
+_COLUMNS = list(BookRow.__annotations__)
+
+
+class RowFormat:
+    media_type: str
+    # Модуль, без которого формат недоступен
+    requires: str | None = None
+
+    @classmethod
+    def available(cls) -> bool:
+        return cls.requires is None or importlib.util.find_spec(cls.requires) is not None
+
+    def page(self, rows: Sequence[Sequence]) -> bytes:
+        raise NotImplementedError
+
+    async def stream(self, partitions: AsyncIterator[Sequence[Sequence]]) -> AsyncIterator[bytes]:
+        async for rows in partitions:
+            yield self.page(rows)
+
+
+class CsvFormat(RowFormat):
+    media_type = "text/csv"
+
+    def _encode(self, rows: Iterable[Sequence], header: bool) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        if header:
+            writer.writerow(_COLUMNS)
+        writer.writerows(row[:4] for row in rows)
+        return buffer.getvalue().encode()
+
+    def page(self, rows):
+        return self._encode(rows, header=True)
+
+    async def stream(self, partitions):
+        header = True
+        async for rows in partitions:
+            yield self._encode(rows, header)
+            header = False
+
+
+class NdjsonFormat(RowFormat):
+    media_type = "application/x-ndjson"
+
+    def page(self, rows):
+        return b"".join(_book_row_adapter.dump_json(item) + b"\n" for item in book_rows_to_dicts(rows))
+
+
+class MsgpackFormat(RowFormat):
+    """Страница — массив словарей; поток — последовательность словарей (msgpack.Unpacker)."""
+    media_type = "application/msgpack"
+    requires = "msgpack"
+
+    def page(self, rows):
+        import msgpack
+        return msgpack.packb(book_rows_to_dicts(rows))
+
+    async def stream(self, partitions):
+        import msgpack
+        packer = msgpack.Packer()
+        async for rows in partitions:
+            yield b"".join(packer.pack(item) for item in book_rows_to_dicts(rows))
+
+
+class ArrowFormat(RowFormat):
+    """Arrow IPC stream: по одному record batch на порцию строк."""
+    media_type = "application/vnd.apache.arrow.stream"
+    requires = "pyarrow"
+
+    @staticmethod
+    def _schema():
+        import pyarrow as pa
+        return pa.schema([
+            ("id", pa.int64()), ("title", pa.string()), ("author", pa.string()), ("year", pa.int64()),
+        ])
+
+    @staticmethod
+    def _batch(schema, rows):
+        import pyarrow as pa
+        columns = list(zip(*rows)) if rows else [[] for _ in _COLUMNS]
+        return pa.record_batch([pa.array(columns[i], type=field.type) for i, field in enumerate(schema)],
+                               schema=schema)
+
+    def page(self, rows):
+        import pyarrow as pa
+        schema = self._schema()
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, schema) as writer:
+            writer.write_batch(self._batch(schema, [row[:4] for row in rows]))
+        return sink.getvalue().to_pybytes()
+
+    async def stream(self, partitions):
+        import pyarrow as pa
+        schema = self._schema()
+        buffer = io.BytesIO()
+        with pa.ipc.new_stream(buffer, schema) as writer:
+            async for rows in partitions:
+                writer.write_batch(self._batch(schema, [row[:4] for row in rows]))
+                # Отдаём записанное и освобождаем буфер: память не растёт с размером выгрузки
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+
+ROW_FORMATS: dict[str, RowFormat] = {
+    fmt.media_type: fmt for fmt in (NdjsonFormat(), CsvFormat(), MsgpackFormat(), ArrowFormat())
+}
+_ALIASES = {"application/x-msgpack": "application/msgpack"}
+JSON = "application/json"
+
+
+def negotiate_format(accept: str | None) -> RowFormat | None:
+    """Формат по заголовку Accept: None — JSON (по умолчанию), иначе один из ROW_FORMATS.
+
+    Если ни один из названных форматов не поддерживается, отдаётся JSON; 406 — только когда
+    JSON исключён явно (application/json;q=0 или */*;q=0 без разрешённого JSON).
+    """
+    if not accept:
+        return None
+    candidates = []
+    weights: dict[str, float] = {}
+    for position, item in enumerate(accept.split(",")):
+        media_type, _, params = item.strip().partition(";")
+        media_type = media_type.strip().lower()
+        media_type = _ALIASES.get(media_type, media_type)
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+        if not media_type:
+            continue
+        weights.setdefault(media_type, q)
+        if q > 0:
+            candidates.append((-q, position, media_type))
+    # Вес JSON — по самому точному диапазону, в который он попадает (RFC 9110, 12.5.1)
+    json_q = next((weights[m] for m in (JSON, "application/*", "*/*") if m in weights), None)
+    for _, _, media_type in sorted(candidates):
+        if media_type in (JSON, "application/*", "*/*"):
+            if json_q:
+                return None
+            continue
+        fmt = ROW_FORMATS.get(media_type)
+        if fmt is not None and fmt.available():
+            return fmt
+        if media_type == "text/*":
+            return ROW_FORMATS["text/csv"]
+    if json_q != 0:
+        return None
+    raise HTTPException(
+        status_code=406,
+        detail=f"Supported: {JSON}, " + ", ".join(m for m, f in ROW_FORMATS.items() if f.available()),
+    )
@@ -0,0 +1,97 @@
+"""Запуск в продакшене: uvicorn с несколькими воркерами, uvloop и httptools.
+
+    python -m app.server [--workers N] [--host 0.0.0.0] [--port 8000]
+    python -m app.server --init-only      # только схема и начальные данные (шаг миграции)
+
+Схема и начальные данные создаются один раз в главном процессе, до запуска воркеров;
+воркеры получают BOOKS_INIT_ON_STARTUP=0 и только прогреваются. Если воркеры запущены
+иначе (uvicorn --workers, gunicorn), init_db в каждом из них выполняется под файловой
+блокировкой. Воркер начинает принимать запросы после прогрева; /ready для балансировщика.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from importlib.util import find_spec
+
+import uvicorn
+
+from app.config import Settings, get_settings
+
+# Сколько ждать завершения запросов в работе после SIGTERM
+GRACEFUL_SHUTDOWN_TIMEOUT = 30
+
+
+def default_workers() -> int:
+    """Число ядер, доступных процессу (с учётом taskset/cpuset), а не всех ядер машины."""
+    try:
+        return max(len(os.sched_getaffinity(0)), 1)
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def uvicorn_options(settings: Settings, workers: int | None = None) -> dict:
+    return {
+        "host": settings.host,
+        "port": settings.port,
+        "workers": workers or settings.workers or default_workers(),
+        "loop": "uvloop" if find_spec("uvloop") else "asyncio",
+        "http": "httptools" if find_spec("httptools") else "h11",
+        "lifespan": "on",
+        "proxy_headers": True,
+        "timeout_graceful_shutdown": GRACEFUL_SHUTDOWN_TIMEOUT,
+        # Запросы и задержки считает /metrics, построчный журнал только тормозит воркер
+        "access_log": False,
+    }
+
+
+def worker_environment(settings: Settings, workers: int) -> dict[str, str]:
+    """Переменные окружения, которые наследуют воркеры.
+
+    Кэш memory сбрасывается только в воркере, выполнившем запись, поэтому при нескольких
+    воркерах он выключается: общий кэш — BOOKS_CACHE_BACKEND=redis.
+    """
+    env = {"BOOKS_INIT_ON_STARTUP": "0", "BOOKS_WORKERS": str(workers)}
+    if workers > 1 and settings.cache_backend == "memory":
+        env["BOOKS_CACHE_BACKEND"] = "none"
+    return env
+
+
+async def prepare_database() -> None:
+    from app.db.repository import dispose_engines, init_db
+
+    await init_db()
+    # Соединения привязаны к циклу событий этого вызова: воркеры откроют свои
+    await dispose_engines()
+
+
+def main(argv=None) -> int:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(prog="python -m app.server", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.host)
+    parser.add_argument("--port", type=int, default=settings.port)
+    parser.add_argument("--workers", type=int, help=f"по умолчанию BOOKS_WORKERS или {default_workers()}")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--init-only", action="store_true", help="создать схему и начальные данные и выйти")
+    args = parser.parse_args(argv)
+
+    if settings.init_on_startup:
+        asyncio.run(prepare_database())
+    if args.init_only:
+        return 0
+
+    options = {**uvicorn_options(settings, args.workers), "host": args.host, "port": args.port}
+    env = worker_environment(settings, options["workers"])
+    if env.get("BOOKS_CACHE_BACKEND") == "none":
+        print(f"memory cache is per process, disabled for {options['workers']} workers "
+              "(BOOKS_CACHE_BACKEND=redis shares it)", file=sys.stderr)
+    # Наследуется воркерами; в процессе с одним воркером настройки перечитываются
+    os.environ.update(env)
+    get_settings.cache_clear()
+    uvicorn.run("app.main:app", log_level=args.log_level, **options)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
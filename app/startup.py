@@ -0,0 +1,43 @@
+"""Время холодного старта по фазам: импорт приложения и шаги lifespan.
+
+Отчёт пишется в лог, когда воркер готов, и отдаётся на /metrics
+(books_startup_seconds{phase}). Разбивку импорта по пакетам и сравнение с прошлым
+прогоном даёт python -m benchmarks.bench_startup.
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+# uvicorn настраивает вывод только для своих логгеров: так отчёт виден в логе воркера
+logger = logging.getLogger("uvicorn.error")
+
+
+class StartupReport:
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @property
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+    def summary(self) -> str:
+        parts = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases.items())
+        return f"startup {self.total * 1000:.0f} ms: {parts}"
+
+    def log(self) -> None:
+        logger.info(self.summary())
+
+
+# Один на процесс: фазу import записывает app.main, остальные — lifespan
+startup_report = StartupReport()
@@ -0,0 +1,223 @@
+"""Потоковый импорт и экспорт каталога в NDJSON и CSV.
+
+Вход читается порциями байтов и разбирается построчно, записи проверяются и пишутся
+пакетами по batch_size через bulk_upsert / bulk_create — память не зависит от размера
+файла. Каждый пакет — отдельная транзакция; после сбоя импорт продолжается с
+report.resume_from (уже зафиксированные записи пропускаются). Невалидные записи не
+останавливают импорт, а попадают в отчёт с номером записи.
+"""
+import csv
+import json
+from typing import AsyncIterator, Callable, Literal
+
+from pydantic import TypeAdapter, ValidationError
+
+from app.db.models import Book, ImportIssue, ImportReport
+from app.db.repository import BookRepository, decode_cursor
+from app.serialization import CsvFormat, NdjsonFormat, RowFormat
+
+IMPORT_BATCH_SIZE = 5000
+EXPORT_PARTITION_SIZE = 5000
+# В отчёт попадают только первые ошибки, остальные лишь считаются
+MAX_REPORTED_ERRORS = 100
+
+FileFormat = Literal["ndjson", "csv"]
+ImportMode = Literal["upsert", "create"]
+
+EXPORT_FORMATS: dict[str, RowFormat] = {"ndjson": NdjsonFormat(), "csv": CsvFormat()}
+
+_books_adapter = TypeAdapter(list[Book])
+
+
+def _decode(line: bytes) -> str | UnicodeDecodeError:
+    try:
+        return line.rstrip(b"\r").decode()
+    except UnicodeDecodeError as exc:
+        return exc
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str | UnicodeDecodeError]:
+    """Строки из потока байтов произвольной нарезки (без завершающего перевода строки).
+
+    Строка не в UTF-8 приходит как исключение: она становится ошибкой записи, а не всего импорта.
+    """
+    tail = b""
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            yield _decode(line)
+    if tail:
+        yield _decode(tail)
+
+
+async def iter_file(file, chunk_size: int = 1 << 16) -> AsyncIterator[bytes]:
+    while chunk := file.read(chunk_size):
+        yield chunk
+
+
+async def _ndjson_records(lines: AsyncIterator[str | Exception]) -> AsyncIterator[dict | Exception]:
+    async for line in lines:
+        if isinstance(line, Exception):
+            yield line
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as exc:
+            yield exc
+
+
+async def _csv_records(lines: AsyncIterator[str | Exception]) -> AsyncIterator[dict | Exception]:
+    header = None
+    pending = ""
+    async for line in lines:
+        if isinstance(line, Exception):
+            # Запись с нечитаемой строкой отбрасывается целиком, вместе с её началом
+            pending = ""
+            yield line
+            continue
+        # Поле в кавычках может содержать перевод строки: копим строки до чётного числа кавычек
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            continue
+        record, pending = pending, ""
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = values
+            continue
+        if len(values) != len(header):
+            yield ValueError(f"expected {len(header)} fields, got {len(values)}")
+            continue
+        row = dict(zip(header, values))
+        if row.get("year") == "":
+            row["year"] = None
+        yield row
+    if pending:
+        yield ValueError("unterminated quoted field")
+
+
+def _validate(batch: list[dict]) -> tuple[list[Book], dict[int, str]]:
+    """Проверяет пакет одним вызовом; при ошибках возвращает валидные книги и ошибки по индексам."""
+    try:
+        return _books_adapter.validate_python(batch), {}
+    except ValidationError as exc:
+        errors = {}
+        for error in exc.errors():
+            index = error["loc"][0]
+            field = ".".join(str(part) for part in error["loc"][1:])
+            errors.setdefault(index, f"{field}: {error['msg']}" if field else error["msg"])
+    return [Book.model_validate(item) for i, item in enumerate(batch) if i not in errors], errors
+
+
+async def import_books(
+    repo: BookRepository,
+    chunks: AsyncIterator[bytes],
+    file_format: FileFormat = "ndjson",
+    mode: ImportMode = "upsert",
+    skip: int = 0,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    on_progress: Callable[[ImportReport], None] | None = None,
+) -> ImportReport:
+    """Импортирует книги из потока байтов; первые skip записей пропускаются (возобновление)."""
+    parse = _ndjson_records if file_format == "ndjson" else _csv_records
+    write = repo.bulk_upsert if mode == "upsert" else repo.bulk_create
+    report = ImportReport(resume_from=skip)
+    batch: list[dict] = []
+    numbers: list[int] = []
+
+    # Ошибки копятся до конца пакета и попадают в отчёт по порядку записей, с общим пределом
+    pending: list[ImportIssue] = []
+
+    def add_issue(record: int, message: str) -> None:
+        pending.append(ImportIssue(record=record, error=message))
+        # Файл из одних нечитаемых строк не доходит до пакета: лишние ошибки отбрасываются сразу
+        if len(pending) > 2 * MAX_REPORTED_ERRORS:
+            trim_pending()
+
+    def add_error(record: int, message: str) -> None:
+        report.invalid += 1
+        add_issue(record, message)
+
+    def trim_pending() -> None:
+        pending.sort(key=lambda issue: issue.record)
+        del pending[MAX_REPORTED_ERRORS - len(report.errors):]
+
+    def report_errors() -> None:
+        trim_pending()
+        report.errors.extend(pending)
+        pending.clear()
+
+    async def flush() -> bool:
+        books, errors = _validate(batch)
+        for index, message in errors.items():
+            add_error(numbers[index], message)
+        try:
+            result = await write(books)
+        except Exception as exc:
+            await repo.rollback()
+            add_issue(numbers[0], f"batch failed: {exc}")
+            report_errors()
+            return False
+        # Шард не зафиксировал свою часть пакета: остальные части записаны, но пакет
+        # повторяется целиком с resume_from (upsert это переносит, create отметит дубликаты)
+        valid = [numbers[i] for i in range(len(batch)) if i not in errors]
+        failed = [record for record, item in zip(valid, result.items) if item.status == "failed"]
+        if failed:
+            await repo.rollback()
+            add_issue(failed[0], f"batch failed: {len(failed)} books were not written")
+            report_errors()
+            return False
+        report_errors()
+        for status, count in result.summary.items():
+            report.statuses[status] = report.statuses.get(status, 0) + count
+        report.resume_from = report.processed
+        batch.clear()
+        numbers.clear()
+        if on_progress is not None:
+            on_progress(report)
+        return True
+
+    async for record in parse(iter_lines(chunks)):
+        report.processed += 1
+        if report.processed <= skip:
+            continue
+        if isinstance(record, Exception):
+            add_error(report.processed, str(record))
+            continue
+        batch.append(record)
+        numbers.append(report.processed)
+        if len(batch) >= batch_size and not await flush():
+            return report
+
+    if batch and not await flush():
+        return report
+    report_errors()
+    report.resume_from = report.processed
+    report.completed = True
+    return report
+
+
+def export_books(repo: BookRepository, file_format: FileFormat = "ndjson", after: str | None = None,
+                 partition_size: int = EXPORT_PARTITION_SIZE) -> AsyncIterator[bytes]:
+    """Поток байтов всего каталога (по возрастанию id, начиная после курсора after).
+
+    Курсор разбирается сразу (InvalidCursorError), а не при первом чтении потока, когда
+    заголовки ответа уже отправлены.
+    """
+    if after is not None:
+        decode_cursor(after)
+    return EXPORT_FORMATS[file_format].stream(repo.stream_rows(after, partition_size))
+
+
+def format_from_name(path: str, default: FileFormat = "ndjson") -> FileFormat:
+    return "csv" if path.lower().endswith(".csv") else default
+
+
+def progress_line(report: ImportReport, elapsed: float) -> str:
+    rate = report.processed / elapsed if elapsed else 0.0
+    statuses = " ".join(f"{k}={v}" for k, v in sorted(report.statuses.items()))
+    return f"{report.processed} records, {rate:,.0f}/s, invalid={report.invalid} {statuses}"
@@ -0,0 +1,47 @@
+"""Замер массовой вставки/upsert/удаления через BookRepository на файловой SQLite.
+
+Запуск: python -m benchmarks.bench_bulk --rows 50000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import Base, Book
+from app.db.repository import BookRepository
+
+
+async def main(rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+        books = [Book(id=i, title=f"Book {i}", author=f"Author {i % 100}", year=1900 + i % 120)
+                 for i in range(1, rows + 1)]
+
+        for name in ("bulk_create", "bulk_upsert"):
+            async with session_factory() as session:
+                start = time.perf_counter()
+                await getattr(BookRepository(session), name)(books)
+                elapsed = time.perf_counter() - start
+            print(f"{name:12} {rows} rows in {elapsed:.2f}s -> {rows / elapsed:,.0f} rows/s")
+
+        async with session_factory() as session:
+            start = time.perf_counter()
+            await BookRepository(session).bulk_delete([b.id for b in books])
+            elapsed = time.perf_counter() - start
+        print(f"{'bulk_delete':12} {rows} rows in {elapsed:.2f}s -> {rows / elapsed:,.0f} rows/s")
+
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000)
+    asyncio.run(main(parser.parse_args().rows))
@@ -0,0 +1,104 @@
+"""Сравнение пропускной способности: движок по умолчанию против настроенного профиля.
+
+Смешанная нагрузка (читатели страниц + пакетные писатели) на файловую SQLite из нескольких
+процессов, как у uvicorn с несколькими воркерами; кэш отключён.
+Запуск: python -m benchmarks.bench_engine --processes 4 --rows 100000 --seconds 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import Settings
+from app.db import cache as cache_module
+from app.db.engine import make_engines, make_sessionmaker
+from app.db.models import Base, Book
+from app.db.repository import BookRepository, encode_cursor
+
+
+def build_engines(profile: str, url: str):
+    if profile == "default":
+        return create_async_engine(url), None
+    return make_engines(Settings(database_url=url))
+
+
+async def seed(profile: str, url: str, rows: int) -> None:
+    write_engine, read_engine = build_engines(profile, url)
+    async with write_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with make_sessionmaker(write_engine, read_engine)() as session:
+        await BookRepository(session).bulk_upsert(
+            [Book(id=i, title=f"Book {i}", author="A", year=2000) for i in range(1, rows + 1)]
+        )
+    await write_engine.dispose()
+
+
+async def worker(profile: str, url: str, args) -> dict[str, int]:
+    cache_module.book_cache = None
+    write_engine, read_engine = build_engines(profile, url)
+    session_factory = make_sessionmaker(write_engine, read_engine)
+    counts = {"reads": 0, "writes": 0, "locked": 0}
+    deadline = time.perf_counter() + args.seconds
+
+    async def reader():
+        while time.perf_counter() < deadline:
+            after = encode_cursor(random.randint(0, args.rows))
+            try:
+                async with session_factory() as session:
+                    await BookRepository(session).get_page(args.page_size, after)
+                counts["reads"] += 1
+            except OperationalError:
+                counts["locked"] += 1
+
+    async def writer():
+        while time.perf_counter() < deadline:
+            start = random.randint(1, args.rows)
+            books = [Book(id=i, title=f"Book {time.time()}", author="A", year=2000)
+                     for i in range(start, start + args.batch_size)]
+            try:
+                async with session_factory() as session:
+                    await BookRepository(session).bulk_upsert(books)
+                counts["writes"] += 1
+            except OperationalError:
+                counts["locked"] += 1
+
+    await asyncio.gather(*[reader() for _ in range(args.readers)], *[writer() for _ in range(args.writers)])
+    await write_engine.dispose()
+    if read_engine is not None:
+        await read_engine.dispose()
+    return counts
+
+
+def run_worker(profile: str, url: str, args) -> dict[str, int]:
+    return asyncio.run(worker(profile, url, args))
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in ("default", "tuned"):
+            url = f"sqlite+aiosqlite:///{os.path.join(tmp, profile + '.db')}"
+            asyncio.run(seed(profile, url, args.rows))
+            with ProcessPoolExecutor(args.processes) as pool:
+                results = list(pool.map(run_worker, *zip(*[(profile, url, args)] * args.processes)))
+            total = {key: sum(r[key] for r in results) for key in results[0]}
+            print(f"{profile:8} page reads/s={total['reads'] / args.seconds:8,.0f} "
+                  f"batch writes/s={total['writes'] / args.seconds:6,.0f} "
+                  f"locked errors={total['locked']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--readers", type=int, default=16, help="читателей на процесс")
+    parser.add_argument("--writers", type=int, default=2, help="писателей на процесс")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=200)
+    main(parser.parse_args())
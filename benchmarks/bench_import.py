@@ -0,0 +1,65 @@
+"""Замер потокового импорта и экспорта каталога (app.transfer) на файловой SQLite.
+
+Запуск: python -m benchmarks.bench_import --rows 200000 [--format csv]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.repository import BookRepository, upgrade_schema
+from app.db.models import Base
+from app.transfer import export_books, import_books, iter_file
+
+
+def write_source(path: str, rows: int, file_format: str) -> None:
+    with open(path, "w", encoding="utf-8") as file:
+        if file_format == "csv":
+            file.write("id,title,author,year\n")
+        for i in range(1, rows + 1):
+            if file_format == "csv":
+                file.write(f'{i},"Book, {i}",Author {i % 100},{1900 + i % 120}\n')
+            else:
+                file.write(json.dumps({"id": i, "title": f"Book {i}", "author": f"Author {i % 100}",
+                                       "year": 1900 + i % 120}) + "\n")
+
+
+async def main(rows: int, file_format: str):
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, f"books.{file_format}")
+        write_source(source, rows, file_format)
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(upgrade_schema)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+        async with session_factory() as session:
+            start = time.perf_counter()
+            with open(source, "rb") as file:
+                report = await import_books(BookRepository(session), iter_file(file), file_format)
+            elapsed = time.perf_counter() - start
+        assert report.completed and report.statuses.get("created") == rows, report
+        print(f"{'import':7} {rows} rows in {elapsed:.2f}s -> {rows / elapsed:,.0f} rows/s")
+
+        async with session_factory() as session:
+            start = time.perf_counter()
+            written = 0
+            async for chunk in export_books(BookRepository(session), file_format):
+                written += len(chunk)
+            elapsed = time.perf_counter() - start
+        print(f"{'export':7} {rows} rows in {elapsed:.2f}s -> {rows / elapsed:,.0f} rows/s ({written:,} bytes)")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.format))
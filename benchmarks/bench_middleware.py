@@ -0,0 +1,96 @@
+"""Замер GET /books/{id}: обработчики ошибок приложения против @app.middleware("http").
+
+Запросы подаются прямо в ASGI-приложение, без сети: разница — накладные расходы стека
+middleware. Вариант "base_http" добавляет прежний catch_exceptions_middleware
+(BaseHTTPMiddleware) самым внутренним, как он был зарегистрирован раньше.
+
+Запуск: python -m benchmarks.bench_middleware --requests 20000 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+
+def _asgi_get(app, path: str):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def run() -> int:
+        status = 0
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        await app(scope, receive, send)
+        return status
+
+    return run
+
+
+async def measure(app, requests: int, concurrency: int) -> float:
+    get = _asgi_get(app, "/books/1")
+    per_worker = requests // concurrency
+
+    async def worker():
+        for _ in range(per_worker):
+            assert await get() == 200
+
+    await worker()  # прогрев: кэш, компиляция маршрутов
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return per_worker * concurrency / (time.perf_counter() - start)
+
+
+async def main(requests: int, concurrency: int, rounds: int):
+    from starlette.middleware import Middleware
+    from starlette.middleware.base import BaseHTTPMiddleware
+    from app.main import app, lifespan
+
+    async def catch_exceptions(request, call_next):
+        # Прежняя обёртка: try/except вокруг call_next
+        try:
+            return await call_next(request)
+        except Exception:
+            raise
+
+    async with lifespan(app):
+        results = {"handlers": [], "base_http": []}
+        for _ in range(rounds):
+            for variant in results:
+                legacy = Middleware(BaseHTTPMiddleware, dispatch=catch_exceptions)
+                if variant == "base_http":
+                    app.user_middleware.append(legacy)
+                app.middleware_stack = None  # стек пересобирается при следующем вызове
+                results[variant].append(await measure(app, requests, concurrency))
+                if variant == "base_http":
+                    app.user_middleware.pop()
+        app.middleware_stack = None
+
+    best = {variant: max(values) for variant, values in results.items()}
+    for variant, rps in best.items():
+        print(f"{variant:10} {rps:8,.0f} req/s")
+    print(f"gain       {best['handlers'] / best['base_http'] - 1:+.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    # Временная база с начальными данными; метрики и квоты не искажают замер
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        os.environ.setdefault("BOOKS_METRICS", "0")
+        os.environ.setdefault("BOOKS_LOAD_SHEDDING", "0")
+        asyncio.run(main(args.requests, args.concurrency, args.rounds))
@@ -0,0 +1,73 @@
+"""Микробенчмарк сериализации списка книг: текущий путь против быстрого режима.
+
+Текущий путь: ORM-объекты -> Book.model_validate -> повторная валидация response_model
+-> json.dumps (так работает FastAPI с response_model=list[Book]).
+Быстрый путь: строки select(id, title, author, year) -> TypeAdapter(list[BookRow]).dump_json.
+
+Запуск: python -m benchmarks.bench_serialization --rows 10000 50000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import Base, Book, BookORM
+from app.serialization import dump_book_rows
+
+_response_adapter = TypeAdapter(list[Book])
+
+
+async def current_path(session) -> bytes:
+    result = await session.execute(select(BookORM).order_by(BookORM.id))
+    books = [Book.model_validate(b) for b in result.scalars()]
+    validated = _response_adapter.validate_python(books)
+    content = _response_adapter.dump_python(validated, mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+async def fast_path(session) -> bytes:
+    result = await session.execute(
+        select(BookORM.id, BookORM.title, BookORM.author, BookORM.year).order_by(BookORM.id)
+    )
+    return dump_book_rows(result.all())
+
+
+async def measure(session_factory, path, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        async with session_factory() as session:
+            start = time.perf_counter()
+            await path(session)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def main(sizes: list[int], repeat: int):
+    for rows in sizes:
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(BookORM.__table__.insert(), [
+                {"id": i, "title": f"Книга {i}", "author": f"Автор {i % 100}", "year": 1900 + i % 120}
+                for i in range(1, rows + 1)
+            ])
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+        current = await measure(session_factory, current_path, repeat)
+        fast = await measure(session_factory, fast_path, repeat)
+        print(f"{rows:>8} rows: current {current * 1000:8.1f} ms | fast {fast * 1000:8.1f} ms "
+              f"| x{current / fast:.1f}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -0,0 +1,70 @@
+"""Замер шардирования: одиночные создания и выгрузка на 1 и на N файлах SQLite.
+
+Каждый шард — своя блокировка писателя, поэтому создания в разные шарды фиксируются
+параллельно; выгрузка сливает серверные курсоры всех шардов.
+
+Запуск: python -m benchmarks.bench_sharding --shards 4 --requests 3000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from app.config import Settings
+from app.db.cache import BookCache, MemoryCache
+from app.db.models import Base, Book
+from app.db.repository import ShardedBookRepository, upgrade_schema
+from app.db.sharding import ShardSet
+from app.db.singleflight import SingleFlight
+
+
+async def run(tmp: str, shard_count: int, requests: int, concurrency: int, synchronous: str) -> None:
+    settings = Settings(sqlite_synchronous=synchronous, metrics_enabled=False)
+    urls = [f"sqlite+aiosqlite:///{os.path.join(tmp, f'{shard_count}-{i}.db')}" for i in range(shard_count)]
+    shard_set = ShardSet.from_urls(urls, settings)
+    for shard in shard_set:
+        async with shard.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(upgrade_schema)
+    cache, flights = BookCache(MemoryCache()), SingleFlight()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def create_one(i: int):
+        async with semaphore:
+            repo = ShardedBookRepository(shard_set, cache=cache, flights=flights)
+            try:
+                await repo.create(Book(id=i, title=f"Book {i}", author="Author", year=2000))
+            finally:
+                await repo.close()
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(create_one(i) for i in range(1, requests + 1)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    failed = sum(isinstance(r, Exception) for r in results)
+
+    repo = ShardedBookRepository(shard_set, cache=cache, flights=flights)
+    start = time.perf_counter()
+    exported = sum([len(rows) async for rows in repo.stream_rows()])
+    export_elapsed = time.perf_counter() - start
+    await repo.close()
+    print(f"{shard_count} shard(s): {requests} creates in {elapsed:.2f}s -> {requests / elapsed:,.0f}/s, "
+          f"{failed} failed; export {exported} rows in {export_elapsed * 1000:.0f} ms")
+    for _, engine in shard_set.engines():
+        await engine.dispose()
+
+
+async def main(shards: int, requests: int, concurrency: int, synchronous: str):
+    with tempfile.TemporaryDirectory() as tmp:
+        for shard_count in sorted({1, shards}):
+            await run(tmp, shard_count, requests, concurrency, synchronous)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--synchronous", default="NORMAL", help="PRAGMA synchronous")
+    args = parser.parse_args()
+    asyncio.run(main(args.shards, args.requests, args.concurrency, args.synchronous))
@@ -0,0 +1,120 @@
+"""Холодный старт воркера: импорт по пакетам (python -X importtime) и фазы lifespan.
+
+Каждый прогон — новый процесс интерпретатора, берётся медиана. С --compare сравнивает
+с прошлым JSON и завершается с кодом 1, если фаза или импорт пакета замедлились
+больше чем на --threshold (и больше чем на --min-ms, чтобы не ловить шум).
+
+    python -m benchmarks.bench_startup --runs 5 --output startup.json
+    python -m benchmarks.bench_startup --openapi --compare startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+from benchmarks.harness import git_commit
+
+# Выполняется в дочернем процессе: импорт приложения и полный lifespan
+_CHILD = """
+import asyncio, json
+from app.main import app, lifespan
+from app.startup import startup_report
+
+async def run():
+    async with lifespan(app):
+        pass
+
+asyncio.run(run())
+print(json.dumps(startup_report.phases))
+"""
+
+
+def import_breakdown(stderr: str) -> dict[str, float]:
+    """Собственное время импорта по пакетам верхнего уровня, секунды (app.* — по модулям)."""
+    totals: dict[str, float] = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        package = name if name.startswith("app.") else name.split(".")[0]
+        totals[package] += int(self_us) / 1e6
+    return totals
+
+
+def run_once(env: dict) -> tuple[dict[str, float], dict[str, float]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    phases = json.loads(result.stdout.strip().splitlines()[-1])
+    return phases, import_breakdown(result.stderr)
+
+
+def median_by_key(samples: list[dict[str, float]]) -> dict[str, float]:
+    keys = dict.fromkeys(key for sample in samples for key in sample)
+    return {key: statistics.median(sample.get(key, 0.0) for sample in samples) for key in keys}
+
+
+def compare(current: dict, baseline: dict, threshold: float, min_seconds: float) -> list[str]:
+    regressions = []
+    for section in ("phases", "imports"):
+        for name, seconds in current[section].items():
+            base = baseline.get(section, {}).get(name)
+            if base is None:
+                continue
+            if seconds > base * (1 + threshold) and seconds - base > min_seconds:
+                regressions.append(f"{section}.{name}: {base * 1000:.1f} -> {seconds * 1000:.1f} ms")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12, help="сколько пакетов показать")
+    parser.add_argument("--openapi", action="store_true", help="со схемой, собранной python -m app.schema")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--min-ms", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"}
+        if args.openapi:
+            env["BOOKS_OPENAPI_PATH"] = os.path.join(tmp, "openapi.json")
+            subprocess.run([sys.executable, "-m", "app.schema", env["BOOKS_OPENAPI_PATH"]], env=env, check=True)
+        samples = [run_once(env) for _ in range(args.runs)]
+
+    phases = median_by_key([phase for phase, _ in samples])
+    imports = median_by_key([imported for _, imported in samples])
+    print(f"{'phase':12} {'ms':>8}")
+    for name, seconds in phases.items():
+        print(f"{name:12} {seconds * 1000:8.1f}")
+    print(f"\n{'import':28} {'ms':>8}")
+    for name, seconds in sorted(imports.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:28} {seconds * 1000:8.1f}")
+
+    report = {
+        "meta": {"commit": git_commit(), "runs": args.runs, "openapi_artifact": args.openapi},
+        "phases": phases,
+        "imports": imports,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, sort_keys=True))
+        print(f"saved {args.output}")
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.threshold, args.min_ms / 1000)
+        for line in regressions:
+            print("REGRESSION", line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""Замер всплеска одиночных созданий: по commit на запрос против пакетной записи (CreateBatcher).
+
+Запуск: python -m benchmarks.bench_write_batching --requests 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.config import Settings
+from app.db.batching import CreateBatcher
+from app.db.engine import make_engine
+from app.db.models import Base, Book
+from app.db.repository import BookRepository, upgrade_schema
+
+
+async def burst(create, requests: int, concurrency: int, offset: int) -> tuple[float, int]:
+    """Время всплеска и число неудачных созданий (database is locked после busy_timeout)."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            await create(Book(id=offset + i, title=f"Book {i}", author="Author", year=2000))
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(requests)), return_exceptions=True)
+    return time.perf_counter() - start, sum(isinstance(r, Exception) for r in results)
+
+
+async def main(requests: int, concurrency: int, synchronous: str):
+    with tempfile.TemporaryDirectory() as tmp:
+        settings = Settings(database_url=f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}",
+                            sqlite_synchronous=synchronous, metrics_enabled=False)
+        engine = make_engine(settings)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(upgrade_schema)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+        async def create_one(book: Book):
+            async with session_factory() as session:
+                await BookRepository(session).create(book)
+
+        elapsed, failed = await burst(create_one, requests, concurrency, 0)
+        print(f"{'per-request':12} {requests} creates in {elapsed:.2f}s -> {requests / elapsed:,.0f}/s, "
+              f"{failed} failed")
+
+        batcher = CreateBatcher(session_factory)
+        elapsed, failed = await burst(batcher.submit, requests, concurrency, requests)
+        await batcher.close()
+        print(f"{'batched':12} {requests} creates in {elapsed:.2f}s -> {requests / elapsed:,.0f}/s, "
+              f"{failed} failed ({batcher.stats.batches} transactions)")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--synchronous", default="FULL", help="PRAGMA synchronous (FULL — fsync на каждый commit)")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.synchronous))
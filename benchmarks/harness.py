@@ -0,0 +1,308 @@
+"""Нагрузочный прогон всех эндпойнтов /books с отчётом о задержках.
+
+Засевает N книг во временную файловую SQLite, гоняет каждый сценарий с заданной
+конкурентностью через ASGITransport (в процессе) или через настоящий uvicorn и
+считает p50/p95/p99, пропускную способность, ошибки и RSS. Результат пишется в JSON;
+--compare сравнивает его с прошлым прогоном и завершается с кодом 1 при регрессии.
+
+Примеры:
+    python -m benchmarks.harness --rows 100000 --concurrency 32 --output bench.json
+    python -m benchmarks.harness --mode uvicorn --workers 2 --compare bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+import httpx
+
+SEED_BATCH = 5000
+BULK_ITEMS = 100
+
+
+# ----------------------------------------------------------------------
+# Сценарии: функция (ctx, i) -> (method, url, kwargs для httpx)
+# ----------------------------------------------------------------------
+@dataclass
+class Context:
+    rows: int
+    created_ids: list[int] = field(default_factory=list)
+    next_id: int = 0
+
+    def __post_init__(self):
+        self.next_id = self.rows + 1
+
+    def random_id(self) -> int:
+        return random.randint(1, self.rows)
+
+    def new_id(self) -> int:
+        self.next_id += 1
+        return self.next_id
+
+
+def _book(book_id: int) -> dict:
+    return {"id": book_id, "title": f"Bench {book_id}", "author": f"Author {book_id % 100}", "year": 2000}
+
+
+def _list_page(ctx, i):
+    from app.db.repository import encode_cursor
+    return "GET", "/books/", {"params": {"limit": 100, "after": encode_cursor(random.randint(0, ctx.rows))}}
+
+
+def _create(ctx, i):
+    book_id = ctx.new_id()
+    ctx.created_ids.append(book_id)
+    return "POST", "/books/", {"json": _book(book_id)}
+
+
+def _delete(ctx, i):
+    book_id = ctx.created_ids.pop() if ctx.created_ids else ctx.new_id()
+    return "DELETE", f"/books/{book_id}", {}
+
+
+def _bulk(method):
+    def scenario(ctx, i):
+        ids = [ctx.new_id() for _ in range(BULK_ITEMS)]
+        payload = ids if method == "DELETE" else [_book(book_id) for book_id in ids]
+        return method, "/books/bulk", {"json": payload}
+    return scenario
+
+
+SCENARIOS: dict[str, tuple[Callable, float]] = {
+    # имя: (генератор запроса, доля от --requests)
+    "get_book": (lambda ctx, i: ("GET", f"/books/{ctx.random_id()}", {}), 1.0),
+    "list_page": (_list_page, 1.0),
+    "search_author": (lambda ctx, i: ("GET", "/books/search",
+                                      {"params": {"author": f"Author {ctx.random_id() % 100}", "limit": 20}}), 0.5),
+    "search_text": (lambda ctx, i: ("GET", "/books/search", {"params": {"q": "Bench", "limit": 20}}), 0.5),
+    "stream_ndjson": (lambda ctx, i: ("GET", "/books/", {"params": {"stream": "ndjson"}}), 0.01),
+    "create": (_create, 0.5),
+    "update": (lambda ctx, i: ("PUT", f"/books/{(book_id := ctx.random_id())}", {"json": _book(book_id)}), 0.5),
+    "patch": (lambda ctx, i: ("PATCH", f"/books/{ctx.random_id()}", {"json": {"year": 1999}}), 0.5),
+    "delete": (_delete, 0.5),
+    "bulk_create": (_bulk("POST"), 0.05),
+    "bulk_upsert": (_bulk("PUT"), 0.05),
+    "bulk_delete": (_bulk("DELETE"), 0.05),
+}
+
+
+# ----------------------------------------------------------------------
+# Статистика
+# ----------------------------------------------------------------------
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Перцентиль q (0..100) по отсортированному списку, с линейной интерполяцией."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Список регрессий: p95 выросла или пропускная способность упала больше чем на threshold."""
+    regressions = []
+    for name, stats in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        if base["p95_ms"] and stats["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {stats['p95_ms']} ms")
+        if base["throughput_rps"] and stats["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {base['throughput_rps']} -> {stats['throughput_rps']} rps")
+    return regressions
+
+
+def rss_bytes(pid: int) -> int:
+    """RSS процесса и всех его потомков (Linux /proc); 0, если недоступно."""
+    total = 0
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+        for task in Path(f"/proc/{pid}/task").iterdir():
+            children = (task / "children").read_text().split()
+            total += sum(rss_bytes(int(child)) for child in children)
+    except OSError:
+        pass
+    return total
+
+
+# ----------------------------------------------------------------------
+# Прогон
+# ----------------------------------------------------------------------
+async def seed(rows: int) -> None:
+    from app.db.models import Book
+    from app.db.repository import AsyncSessionLocal, BookRepository, engine, init_db
+
+    await init_db()
+    for start in range(1, rows + 1, SEED_BATCH):
+        stop = min(start + SEED_BATCH, rows + 1)
+        async with AsyncSessionLocal() as session:
+            await BookRepository(session).bulk_upsert([Book(**_book(i)) for i in range(start, stop)])
+    await engine.dispose()
+
+
+async def run_scenario(client: httpx.AsyncClient, ctx: Context, name: str, requests: int,
+                       concurrency: int) -> dict:
+    make_request = SCENARIOS[name][0]
+    latencies, errors = [], 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, kwargs = make_request(ctx, i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def run_all(client, args, server_pid: int) -> dict:
+    ctx = Context(rows=args.rows)
+    results = {}
+    for name in args.scenarios:
+        requests = max(1, int(args.requests * SCENARIOS[name][1]))
+        results[name] = await run_scenario(client, ctx, name, requests, args.concurrency)
+        results[name]["rss_bytes"] = rss_bytes(server_pid)
+        print(f"{name:14} {results[name]}")
+    return results
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_uvicorn(args, env: dict) -> dict:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app.server", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env={**os.environ, **env},
+    )
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            for _ in range(200):
+                try:
+                    if (await client.get("/ready")).status_code == 200:
+                        break
+                    await asyncio.sleep(0.1)
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not start")
+            return await run_all(client, args, server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+async def run_inprocess(args) -> dict:
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        return await run_all(client, args, os.getpid())
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000, help="книг в базе (10^3..10^6)")
+    parser.add_argument("--requests", type=int, default=2000, help="запросов на сценарий (с учётом доли)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="переменные окружения для приложения, например BOOKS_CACHE_BACKEND=none")
+    parser.add_argument("--output", type=Path, help="куда сохранить JSON с результатами")
+    parser.add_argument("--compare", type=Path, help="JSON прошлого прогона для поиска регрессий")
+    parser.add_argument("--threshold", type=float, default=0.15, help="допустимое ухудшение (доля)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(item.split("=", 1) for item in args.env)
+        env["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        # Приложение читает настройки при импорте, поэтому окружение задаётся до него
+        os.environ.update(env)
+
+        started = time.perf_counter()
+        asyncio.run(seed(args.rows))
+        print(f"seeded {args.rows} books in {time.perf_counter() - started:.1f}s")
+
+        if args.mode == "uvicorn":
+            scenarios = asyncio.run(run_uvicorn(args, env))
+        else:
+            scenarios = asyncio.run(run_inprocess(args))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "rows": args.rows,
+            "mode": args.mode,
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+            "env": {k: v for k, v in env.items() if k != "DATABASE_URL"},
+        },
+        "scenarios": scenarios,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"saved {args.output}")
+
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.threshold)
+        for line in regressions:
+            print("REGRESSION", line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,7 @@
 import asyncio
+import os
+from pathlib import Path
+import aiosqlite
 import pytest
 import pytest_asyncio
 from unittest.mock import AsyncMock, MagicMock
@@ -6,10 +9,12 @@ from fastapi.testclient import TestClient
 from httpx import AsyncClient, ASGITransport
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
+from sqlalchemy.pool import StaticPool
+from sqlalchemy import create_engine, event
 
+from app.db import cache as cache_module
 from app.db.models import Base, Book
-from app.db.repository import BookRepository, get_session
+from app.db.repository import BookRepository, get_repository, upgrade_schema
 from app.main import app
 
 # ==============================================================================
@@ -50,40 +55,16 @@ def create_book(async_client):
     return _create
 
 # ==============================================================================
-# Моки: сессия и репозиторий
+# Мок репозитория для тестов API без БД
 # ==============================================================================
-@pytest.fixture
-def mock_session():
-    """Мок AsyncSession"""
-    session = AsyncMock()
-    session.add = AsyncMock()
-    session.commit = AsyncMock()
-    session.refresh = AsyncMock()
-    session.delete = AsyncMock()
-    session.execute = AsyncMock()
-
-    session.get_all_result = [
-        {"id": 1, "title": "Mock Book", "author": "John", "pages": 100}
-    ]
-    session.get_result = {
-        "id": 1, "title": "Mock Book", "author": "John", "pages": 100,
-    }
-
-    return session
-
 @pytest.fixture(autouse=True)
-def override_get_session(mock_session):
-    """Все эндпоинты используют мок-сессию"""
-    async def _override():
-        yield mock_session
+def mock_repo(request):
+    """Мок BookRepository с внутренним списком книг, подставленный через dependency_overrides"""
+    if not {"async_client", "client"} & set(request.fixturenames):
+        # Мок нужен только тестам API без БД, остальные работают с настоящим репозиторием
+        yield None
+        return
 
-    app.dependency_overrides[get_session] = _override
-    yield
-    app.dependency_overrides.clear()
-
-@pytest.fixture(autouse=True)
-def mock_repo():
-    """Мок BookRepository с внутренним списком книг"""
     books = []
     repo = MagicMock(spec=BookRepository)
 
@@ -94,17 +75,27 @@ def mock_repo():
     async def get_all():
         return books
 
+    async def get_page(limit: int = 100, after: str | None = None):
+        return books[:limit], None
+
     async def get(book_id: int):
         return next((b for b in books if b.id == book_id), None)
 
-    async def update(book_id: int, book: Book):
+    async def get_versioned(book_id: int):
+        book = await get(book_id)
+        return (book, 1) if book is not None else None
+
+    async def get_table_version():
+        return len(books), None
+
+    async def update(book_id: int, book: Book, if_match=None):
         for i, b in enumerate(books):
             if b.id == book_id:
                 books[i] = book
                 return book
         return None
 
-    async def delete(book_id: int):
+    async def delete(book_id: int, if_match=None):
         for i, b in enumerate(books):
             if b.id == book_id:
                 books.pop(i)
@@ -112,12 +103,17 @@ def mock_repo():
 
     repo.create = AsyncMock(side_effect=create)
     repo.get_all = AsyncMock(side_effect=get_all)
+    repo.get_page = AsyncMock(side_effect=get_page)
     repo.get = AsyncMock(side_effect=get)
+    repo.get_versioned = AsyncMock(side_effect=get_versioned)
+    repo.get_table_version = AsyncMock(side_effect=get_table_version)
     repo.update = AsyncMock(side_effect=update)
     repo.delete = AsyncMock(side_effect=delete)
 
-    BookRepository.__new__ = lambda cls, session: repo
-    yield
+    # Обработчики получают репозиторий только через get_repository
+    app.dependency_overrides[get_repository] = lambda: repo
+    yield repo
+    app.dependency_overrides.pop(get_repository, None)
 
 # ==============================================================================
 # Тестовые данные
@@ -141,30 +137,116 @@ def sample_books():
     ]
 
 # ==============================================================================
-# Реальная in-memory SQLite база (для интеграционных тестов)
+# Реальная база для интеграционных тестов: in-memory SQLite и, если задан
+# TEST_POSTGRES_URL (например, контейнер из docker-compose.yml), PostgreSQL.
+#
+# Каждый тест идёт во внешней транзакции, которая откатывается в конце; commit
+# репозитория и маршрутов фиксирует только SAVEPOINT внутри неё. Поэтому тестам
+# не нужна очистка таблиц, а воркеры pytest-xdist (pytest -n auto) не мешают друг
+# другу: у каждого своя копия базы.
 # ==============================================================================
-TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
+TEST_DATABASE_URL = "sqlite+aiosqlite://"
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+TEST_DATABASE_URLS = {"sqlite": TEST_DATABASE_URL}
+if TEST_POSTGRES_URL:
+    TEST_DATABASE_URLS["postgresql"] = TEST_POSTGRES_URL
+
+# "gw0", "gw1"... под pytest-xdist, "main" без него
+WORKER_ID = os.getenv("PYTEST_XDIST_WORKER", "main")
+
+
+def _build_template(path: Path) -> None:
+    """Файл SQLite со схемой: таблицы, индексы, FTS и триггеры статистики."""
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn)
+        upgrade_schema(conn)
+    engine.dispose()
+
 
-@pytest_asyncio.fixture(scope="session")
-async def db_engine():
-    engine = create_async_engine(TEST_DATABASE_URL, echo=False, future=True)
+@pytest.fixture(scope="session")
+def sqlite_template(tmp_path_factory) -> Path:
+    """Шаблон строится один раз на прогон; при xdist — общий для всех воркеров."""
+    root = tmp_path_factory.getbasetemp()
+    if WORKER_ID != "main":
+        root = root.parent
+    template = root / "books-template.db"
+    if not template.exists():
+        # Воркеры могут строить шаблон одновременно: атомарная замена оставит любой из одинаковых
+        building = root / f"books-template.{WORKER_ID}.db"
+        _build_template(building)
+        os.replace(building, template)
+    return template
+
+
+def _sqlite_engine(template: Path):
+    """База воркера в памяти — копия шаблона через backup API, без выполнения DDL."""
+    async def clone():
+        connection = await aiosqlite.connect(":memory:", isolation_level=None)
+        async with aiosqlite.connect(template) as source:
+            await source.backup(connection)
+        return connection
+
+    engine = create_async_engine(TEST_DATABASE_URL, async_creator=clone, poolclass=StaticPool)
+
+    # pysqlite сам открывает и закрывает транзакции, из-за чего SAVEPOINT не работают;
+    # транзакцией управляет SQLAlchemy (рецепт из документации диалекта)
+    @event.listens_for(engine.sync_engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    return engine
+
+
+async def _postgres_engine(url: str):
+    """Своя схема на воркер: параллельные прогоны не делят таблицы и строки."""
+    schema = f"test_{WORKER_ID}"
+    admin = create_async_engine(url)
+    async with admin.begin() as conn:
+        await conn.exec_driver_sql(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        await conn.exec_driver_sql(f"CREATE SCHEMA {schema}")
+    await admin.dispose()
+    engine = create_async_engine(url, connect_args={"server_settings": {"search_path": schema}})
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+    return engine
+
+
+@pytest_asyncio.fixture(scope="session", params=list(TEST_DATABASE_URLS))
+async def db_engine(request, sqlite_template):
+    if request.param == "sqlite":
+        engine = _sqlite_engine(sqlite_template)
+    else:
+        engine = await _postgres_engine(TEST_DATABASE_URLS[request.param])
     yield engine
     await engine.dispose()
 
 @pytest_asyncio.fixture
-async def db_session(db_engine):
-    async_session = sessionmaker(
-        bind=db_engine,
+async def db_connection(db_engine):
+    """Соединение с внешней транзакцией теста, откатывается после него."""
+    async with db_engine.connect() as connection:
+        transaction = await connection.begin()
+        yield connection
+        if transaction.is_active:
+            await transaction.rollback()
+
+@pytest.fixture
+def session_factory(db_connection):
+    """Сессии внутри транзакции теста: commit фиксирует только SAVEPOINT."""
+    return sessionmaker(
+        bind=db_connection,
         class_=AsyncSession,
         expire_on_commit=False,
+        join_transaction_mode="create_savepoint",
     )
-    async with async_session() as session:
-        await session.execute(text("DELETE FROM books"))
-        await session.commit()
+
+@pytest_asyncio.fixture
+async def db_session(session_factory):
+    if cache_module.book_cache is not None:
+        await cache_module.book_cache.clear()
+    async with session_factory() as session:
         yield session
-        await session.rollback()
 
 @pytest_asyncio.fixture
 async def repository(db_session):
@@ -175,10 +257,8 @@ async def repository(db_session):
 # ==============================================================================
 @pytest_asyncio.fixture
 async def override_get_db(db_session):
-    async def _override():
-        yield db_session
-
-    app.dependency_overrides[get_session] = _override
+    # Репозиторий на сессии теста: она не закрывается после каждого запроса
+    app.dependency_overrides[get_repository] = lambda: BookRepository(db_session)
     yield
     app.dependency_overrides.clear()
 
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from app.db import batching as batching_module
+from app.db.batching import CreateBatcher
+from app.db.models import Book
+from app.db.repository import AlreadyExistsError, OverloadedError
+
+
+def book(book_id: int) -> Book:
+    return Book(id=book_id, title=f"Книга {book_id}", author="Автор", year=2000)
+
+
+async def test_concurrent_creates_share_one_transaction(session_factory, repository):
+    batcher = CreateBatcher(session_factory, max_delay=0.05)
+    results = await asyncio.gather(
+        *(batcher.submit(book(i)) for i in (1, 2, 3, 2)), return_exceptions=True
+    )
+    await batcher.close()
+
+    assert results[:3] == [book(1), book(2), book(3)]
+    assert isinstance(results[3], AlreadyExistsError)
+    assert (batcher.stats.batches, batcher.stats.items, batcher.stats.failed) == (1, 4, 1)
+    assert [b.id for b in (await repository.get_page())[0]] == [1, 2, 3]
+
+
+async def test_batches_are_capped_by_size(session_factory):
+    batcher = CreateBatcher(session_factory, batch_size=2, max_delay=0.05)
+    await asyncio.gather(*(batcher.submit(book(i)) for i in range(1, 6)))
+    await batcher.close()
+    assert batcher.stats.batches == 3
+
+
+async def test_accept_mode_and_back_pressure(session_factory, repository):
+    batcher = CreateBatcher(session_factory, queue_size=2, durability="accept")
+    assert await batcher.submit(book(1)) == book(1)
+    await batcher.submit(book(2))
+    with pytest.raises(OverloadedError):
+        await batcher.submit(book(3))
+    assert batcher.stats.rejected == 1
+
+    await batcher.drain()
+    assert await repository.get(2) is not None
+    await batcher.close()
+
+
+async def test_failed_batch_is_reported_to_every_request(session_factory, monkeypatch):
+    async def broken_bulk_create(self, books):
+        raise RuntimeError("disk I/O error")
+
+    monkeypatch.setattr("app.db.repository.BookRepository.bulk_create", broken_bulk_create)
+    batcher = CreateBatcher(session_factory, max_delay=0.01)
+    results = await asyncio.gather(batcher.submit(book(1)), batcher.submit(book(2)), return_exceptions=True)
+    await batcher.close()
+    assert [str(r) for r in results] == ["disk I/O error"] * 2
+
+
+def test_unknown_durability_is_rejected(session_factory):
+    with pytest.raises(ValueError):
+        CreateBatcher(session_factory, durability="eventually")
+
+
+async def test_create_endpoint_uses_batcher(async_client_with_db, session_factory, monkeypatch):
+    batcher = CreateBatcher(session_factory, durability="accept")
+    monkeypatch.setattr(batching_module, "create_batcher", batcher)
+
+    resp = await async_client_with_db.post("/books/", json=book(1).model_dump())
+    assert resp.status_code == 202 and resp.json()["id"] == 1
+    await batcher.drain()
+    assert (await async_client_with_db.get("/books/1")).status_code == 200
+
+    async def overloaded(book):
+        raise OverloadedError("Write queue is full, retry later")
+
+    monkeypatch.setattr(batcher, "submit", overloaded)
+    resp = await async_client_with_db.post("/books/", json=book(2).model_dump())
+    assert resp.status_code == 503 and resp.headers["retry-after"] == "1"
+    await batcher.close()
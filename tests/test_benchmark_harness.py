@@ -0,0 +1,19 @@
+from benchmarks.harness import compare, percentile, summarize
+
+
+def test_percentile_interpolates():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.5
+    assert percentile(values, 99) == 99.01
+    assert percentile([], 95) == 0.0
+
+
+def test_compare_reports_regressions_beyond_threshold():
+    baseline = {"scenarios": {"get_book": summarize([0.010] * 10, 0, 1.0)}}
+    same = {"scenarios": {"get_book": summarize([0.011] * 10, 0, 1.0)}}
+    slower = {"scenarios": {"get_book": summarize([0.020] * 5, 0, 1.0), "new": summarize([0.1], 0, 1.0)}}
+
+    assert compare(same, baseline, threshold=0.15) == []
+    regressions = compare(slower, baseline, threshold=0.15)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("get_book: p95")
@@ -0,0 +1,127 @@
+import fnmatch
+import pytest
+from app.config import Settings
+from app.db.cache import BookCache, MemoryCache, RedisCache, MISSING, make_book_cache
+from app.db.models import Book
+from app.db.repository import BookRepository
+
+
+class FakeRedis:
+    """Локальная замена redis.asyncio-клиента: только используемые кэшем команды."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, px=None):
+        self.data[key] = value
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def scan_iter(self, match="*"):
+        for key in list(self.data):
+            if fnmatch.fnmatch(key, match):
+                yield key
+
+
+# ----------------------------------------------------------------------
+# Бэкенды
+# ----------------------------------------------------------------------
+async def test_memory_cache_lru_eviction():
+    cache = MemoryCache(maxsize=2, ttl=60)
+    await cache.set("a", 1)
+    await cache.set("b", 2)
+    assert await cache.get("a") == 1  # "a" становится самым свежим
+    await cache.set("c", 3)
+
+    assert await cache.get("b") is MISSING
+    assert await cache.get("a") == 1
+    assert await cache.get("c") == 3
+    assert cache.stats.evictions == 1
+    assert cache.stats.hits == 3
+    assert cache.stats.misses == 1
+
+
+async def test_memory_cache_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.db.cache.time.monotonic", lambda: now[0])
+    cache = MemoryCache(maxsize=10, ttl=5)
+    await cache.set("a", None)
+    assert await cache.get("a") is None
+
+    now[0] += 6
+    assert await cache.get("a") is MISSING
+    assert cache.stats.expirations == 1
+
+
+async def test_redis_cache_with_stand_in():
+    cache = RedisCache(FakeRedis(), ttl=5)
+    await cache.set("list:all", [Book(id=1, title="T", author="A")])
+    await cache.set("book:1", None)
+    assert (await cache.get("list:all"))[0].id == 1
+    assert await cache.get("book:1") is None
+
+    await cache.delete_prefix("list:")
+    assert await cache.get("list:all") is MISSING
+    assert await cache.get("book:1") is None
+
+
+async def test_book_cache_skips_stale_fill():
+    cache = BookCache(MemoryCache())
+    generation = cache.generation
+    await cache.invalidate([1])  # запись завершилась во время чтения
+    await cache.set(cache.book_key(1), "stale", generation)
+    assert await cache.get(cache.book_key(1)) is MISSING
+
+
+def test_memory_cache_is_off_with_several_workers():
+    assert isinstance(make_book_cache(Settings(workers=1)).backend, MemoryCache)
+    assert make_book_cache(Settings(workers=4)) is None
+    assert make_book_cache(Settings(workers=4, cache_backend="none")) is None
+
+
+# ----------------------------------------------------------------------
+# Read-through и инвалидация в репозитории
+# ----------------------------------------------------------------------
+@pytest.fixture
+def cached_repository(db_session):
+    return BookRepository(db_session, cache=BookCache(MemoryCache()))
+
+
+async def test_get_served_from_cache(cached_repository):
+    await cached_repository.create(Book(id=1, title="Book1", author="A", year=2000))
+    await cached_repository.get(1)
+    await cached_repository.get(1)
+    assert cached_repository.cache.stats.hits == 1
+    assert cached_repository.cache.stats.misses == 1
+
+
+async def test_writes_invalidate_cache(cached_repository):
+    assert await cached_repository.get(1) is None  # отсутствие тоже кэшируется
+    await cached_repository.create(Book(id=1, title="Old", author="A", year=2000))
+    assert (await cached_repository.get(1)).title == "Old"
+    assert [b.title for b in await cached_repository.get_all()] == ["Old"]
+
+    await cached_repository.update(1, Book(id=1, title="New", author="A", year=2000))
+    assert (await cached_repository.get(1)).title == "New"
+    assert [b.title for b in await cached_repository.get_all()] == ["New"]
+
+    await cached_repository.bulk_upsert([Book(id=1, title="Bulk", author="A", year=2000)])
+    assert (await cached_repository.get(1)).title == "Bulk"
+
+    await cached_repository.delete(1)
+    assert await cached_repository.get(1) is None
+    assert await cached_repository.get_all() == []
+
+
+async def test_table_version_is_not_cached(db_session):
+    # Два воркера со своими кэшами: версия для ETag видна второму сразу после записи первого
+    writer = BookRepository(db_session, cache=BookCache(MemoryCache()))
+    reader = BookRepository(db_session, cache=BookCache(MemoryCache()))
+    version, _ = await reader.get_table_version()
+    await writer.create(Book(id=1, title="Book1", author="A", year=2000))
+    assert (await reader.get_table_version())[0] == version + 1
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.config import get_settings
+from app.db.changes import ChangeFeed
+from app.db.models import Book, BookChange
+from app.db.repository import BookRepository, ChangesExpiredError
+from app.routers.changes import WS_CLOSE_EXPIRED, _sse_events
+
+
+def book(book_id: int, title: str = "Книга") -> Book:
+    return Book(id=book_id, title=title, author="Автор", year=2000)
+
+
+async def test_every_write_is_logged(repository):
+    await repository.create(book(1))
+    await repository.patch(1, {"title": "Новая"})
+    await repository.bulk_upsert([book(1, "Третья"), book(2)])
+    await repository.bulk_create([book(2), book(3)])
+    await repository.delete(3)
+    await repository.bulk_delete([1, 2, 99])
+
+    changes = await repository.get_changes()
+    assert [c.seq for c in changes] == sorted(c.seq for c in changes)
+    assert [(c.op, c.book_id) for c in changes[:6]] == [
+        ("create", 1), ("update", 1), ("update", 1), ("create", 2), ("create", 3), ("delete", 3),
+    ]
+    # Порядок внутри одной массовой записи не определён
+    assert sorted((c.op, c.book_id) for c in changes[6:]) == [("delete", 1), ("delete", 2)]
+    assert changes[1].book == book(1, "Новая")
+    assert changes[5].book is None
+    # Версия события совпадает с версией строки (ETag книги)
+    assert changes[0].version < changes[1].version
+
+    page = await repository.get_changes(since=changes[2].seq, limit=2)
+    assert [c.seq for c in page] == [changes[3].seq, changes[4].seq]
+
+
+async def test_trimmed_log_requires_resync(repository, monkeypatch):
+    monkeypatch.setattr(get_settings(), "change_log_retention", 2)
+    for i in range(1, 5):
+        await repository.create(book(i))
+    await repository._trim_changes()
+    await repository.session.commit()
+
+    with pytest.raises(ChangesExpiredError) as expired:
+        await repository.get_changes(since=1)
+    head = expired.value.head
+    assert head == (await repository.get_changes(since=2))[-1].seq
+    changes = await repository.get_changes(since=2)
+    assert [c.book_id for c in changes] == [3, 4]
+    # Новый клиент начинает с самого старого хранимого события
+    assert [c.book_id for c in await repository.get_changes(since=0)] == [3, 4]
+    assert await repository.get_changes(since=head) == []
+
+
+async def test_follow_wakes_on_notify_and_sends_heartbeats():
+    log = []
+    feed = ChangeFeed(poll_interval=0.01, heartbeat=0.02)
+
+    async def fetch(since, limit):
+        return [c for c in log if c.seq > since][:limit]
+
+    stream = feed.follow(fetch, since=0)
+    assert await asyncio.wait_for(anext(stream), 1) == []
+
+    feed.poll_interval = 10
+    waiting = asyncio.create_task(anext(stream))
+    await asyncio.sleep(0.01)
+    log.append(BookChange(seq=1, op="delete", book_id=1, version=1, changed_at=0))
+    feed.notify()
+    assert [c.seq for c in await asyncio.wait_for(waiting, 1)] == [1]
+    await stream.aclose()
+
+
+def test_sse_event_format():
+    change = BookChange(seq=7, op="create", book_id=1, version=3, book=book(1), changed_at=0)
+    assert _sse_events([change]).startswith("id: 7\nevent: create\ndata: {")
+    assert _sse_events([]) == ": keep-alive\n\n"
+
+
+async def test_changes_endpoint(async_client_with_db, created_book, monkeypatch):
+    await created_book(book(1))
+    await created_book(book(2))
+    await async_client_with_db.delete("/books/1")
+
+    resp = await async_client_with_db.get("/books/changes", params={"since": 0, "limit": 2})
+    assert resp.status_code == 200
+    page = resp.json()
+    assert [c["op"] for c in page["changes"]] == ["create", "create"]
+    resp = await async_client_with_db.get("/books/changes", params={"since": page["next_since"]})
+    assert [(c["op"], c["book_id"], c["book"]) for c in resp.json()["changes"]] == [("delete", 1, None)]
+
+    async def expired(self, since=0, limit=1):
+        raise ChangesExpiredError("gone", head=42)
+
+    monkeypatch.setattr(BookRepository, "get_changes", expired)
+    resp = await async_client_with_db.get("/books/changes")
+    assert resp.status_code == 410 and resp.json() == {"detail": "gone", "head": 42}
+    assert (await async_client_with_db.get("/books/changes/stream")).status_code == 410
+
+
+def test_changes_websocket(client, mock_repo):
+    repo = mock_repo
+    change = BookChange(seq=5, op="update", book_id=1, version=2, book=book(1), changed_at=0)
+    repo.get_changes.side_effect = lambda since, limit: [change] if since < 5 else []
+
+    with client.websocket_connect("/books/changes/ws?since=0") as ws:
+        assert BookChange.model_validate(ws.receive_json()) == change
+
+    repo.get_changes.side_effect = ChangesExpiredError("gone")
+    with client.websocket_connect("/books/changes/ws?since=0") as ws:
+        with pytest.raises(WebSocketDisconnect) as exc:
+            ws.receive_json()
+    assert exc.value.code == WS_CLOSE_EXPIRED
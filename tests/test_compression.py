@@ -0,0 +1,76 @@
+import gzip
+import zlib
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from httpx import ASGITransport, AsyncClient
+
+from app.compression import CompressionMiddleware, choose_encoding
+
+BIG = "книга " * 1000
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.get("/big")
+    async def big():
+        return PlainTextResponse(BIG, headers={"ETag": '"7"'})
+
+    @app.get("/small")
+    async def small():
+        return PlainTextResponse("ok")
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for _ in range(3):
+                yield BIG
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+    return app
+
+
+async def fetch(path, encoding="gzip"):
+    transport = ASGITransport(app=make_app())
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get(path, headers={"Accept-Encoding": encoding})
+
+
+def test_choose_encoding_respects_q_values():
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0, identity") is None
+    assert choose_encoding("*") in ("zstd", "br", "gzip")
+    assert choose_encoding("") is None
+
+
+async def test_large_response_is_compressed():
+    resp = await fetch("/big")
+    assert resp.headers["content-encoding"] == "gzip"
+    assert int(resp.headers["content-length"]) < len(BIG.encode())
+    assert resp.headers["etag"] == 'W/"7"'
+    assert "Accept-Encoding" in resp.headers["vary"]
+    assert resp.text == BIG
+
+
+async def test_small_response_is_not_compressed():
+    resp = await fetch("/small")
+    assert "content-encoding" not in resp.headers
+    assert resp.text == "ok"
+
+
+async def test_identity_is_left_alone():
+    resp = await fetch("/big", encoding="identity")
+    assert "content-encoding" not in resp.headers
+    assert resp.headers["etag"] == '"7"'
+
+
+async def test_stream_is_compressed_incrementally():
+    transport = ASGITransport(app=make_app())
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        async with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as resp:
+            assert resp.headers["content-encoding"] == "gzip"
+            raw = b"".join([chunk async for chunk in resp.aiter_raw()])
+    assert gzip.decompress(raw).decode() == BIG * 3
+    assert zlib.decompress(raw, 31)
@@ -0,0 +1,96 @@
+import pytest_asyncio
+from sqlalchemy import text, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import Settings
+from app.db.cache import BookCache, MemoryCache
+from app.db.engine import make_engines, make_sessionmaker
+from app.db.models import Base, Book, BookORM
+from app.db.repository import BookRepository, upgrade_schema
+
+
+@pytest_asyncio.fixture
+async def engines(tmp_path):
+    settings = Settings(database_url=f"sqlite+aiosqlite:///{tmp_path / 'books.db'}", db_read_pool_size=2)
+    write_engine, read_engine = make_engines(settings)
+    async with write_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield write_engine, read_engine
+    await write_engine.dispose()
+    await read_engine.dispose()
+
+
+async def test_pragmas_applied(engines):
+    write_engine, read_engine = engines
+    async with write_engine.connect() as conn:
+        assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+        assert (await conn.execute(text("PRAGMA synchronous"))).scalar() == 1  # NORMAL
+        assert (await conn.execute(text("PRAGMA busy_timeout"))).scalar() == 5000
+        assert (await conn.execute(text("PRAGMA query_only"))).scalar() == 0
+    async with read_engine.connect() as conn:
+        assert (await conn.execute(text("PRAGMA query_only"))).scalar() == 1
+
+
+async def test_no_read_engine_for_memory_database():
+    write_engine, read_engine = make_engines(Settings(database_url="sqlite+aiosqlite:///:memory:"))
+    assert read_engine is None
+    await write_engine.dispose()
+
+
+async def test_routing_session(engines):
+    write_engine, read_engine = engines
+    session_factory = make_sessionmaker(write_engine, read_engine)
+    async with session_factory() as session:
+        assert session.sync_session.get_bind(clause=select(BookORM)) is read_engine.sync_engine
+
+        session.add(BookORM(id=1, title="T", author="A", year=2000))
+        await session.flush()
+        # после записи транзакция читает через писателя и видит свои изменения
+        assert session.sync_session.get_bind(clause=select(BookORM)) is write_engine.sync_engine
+        assert (await session.execute(select(BookORM.title))).scalar() == "T"
+
+        await session.commit()
+        assert session.sync_session.get_bind(clause=select(BookORM)) is read_engine.sync_engine
+
+
+async def test_repository_over_split_pools(engines):
+    session_factory = make_sessionmaker(*engines)
+    async with session_factory() as session:
+        repo = BookRepository(session, cache=BookCache(MemoryCache()))
+        await repo.create(Book(id=1, title="Book1", author="A", year=2000))
+        await repo.bulk_upsert([Book(id=2, title="Book2", author="B", year=2001)])
+        await repo.update(1, Book(id=1, title="New", author="A", year=2000))
+        assert [b.title for b in await repo.get_all()] == ["New", "Book2"]
+        await repo.delete(2)
+        assert await repo.get(2) is None
+
+
+async def test_upgrade_schema_adds_search_structures(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'old.db'}")
+    async with engine.begin() as conn:
+        # база, созданная до появления индексов и FTS
+        await conn.exec_driver_sql(
+            "CREATE TABLE books (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, "
+            "author VARCHAR NOT NULL, year INTEGER)"
+        )
+        await conn.exec_driver_sql("INSERT INTO books VALUES (1, 'Три товарища', 'Ремарк', 1936)")
+        await conn.run_sync(upgrade_schema)
+
+    session_factory = make_sessionmaker(engine)
+    async with session_factory() as session:
+        repo = BookRepository(session, cache=BookCache(MemoryCache()))
+        books, _ = await repo.search(q="товарищ")
+        assert [b.id for b in books] == [1]
+        # колонка version и счётчик изменений досозданы
+        assert (await repo.patch(1, {"year": 1937})).year == 1937
+        assert (await repo.get_versioned(1))[1] == 1
+
+        # сводки статистики посчитаны по уже существующим книгам
+        stats = await repo.get_stats()
+        assert (stats.total, stats.year_min, stats.authors[0].author) == (1, 1937, "Ремарк")
+
+        plan = await session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM books WHERE author = 'Ремарк' AND year > 1900"
+        ))
+        assert "ix_books_author_year" in " ".join(row[-1] for row in plan)
+    await engine.dispose()
@@ -0,0 +1,112 @@
+import pytest
+from sqlalchemy import text
+
+from app import metrics
+from app.db.repository import BookRepository
+from app.metrics import Histogram, N_PLUS_ONE_THRESHOLD, instrument_engine
+
+
+@pytest.fixture
+def instrumented(db_engine):
+    instrument_engine(db_engine)
+    return db_engine
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, "/books/")
+
+    lines = histogram.render().splitlines()
+    assert 'latency_seconds_bucket{route="/books/",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/books/",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{route="/books/",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{route="/books/"} 4' in lines
+    assert histogram.count("/books/") == 4
+
+
+async def test_requests_are_recorded_by_route_template(instrumented, created_book, async_client_with_db,
+                                                       sample_books):
+    book_id, _ = await created_book(sample_books[0])
+    route = "/books/{book_id}"
+    before = metrics.http_requests.value("GET", route, 200)
+    statements_before = metrics.db_statements.value(route)
+
+    await async_client_with_db.get(f"/books/{book_id}")
+    await async_client_with_db.get("/books/999999")
+
+    assert metrics.http_requests.value("GET", route, 200) == before + 1
+    assert metrics.http_requests.value("GET", route, 404) >= 1
+    assert metrics.db_statements.value(route) > statements_before
+    assert metrics.http_in_flight.value() == 0
+
+
+async def test_n_plus_one_is_flagged(instrumented, async_client_with_db, monkeypatch):
+    original_get = BookRepository.get_versioned
+
+    async def chatty_get(self, book_id):
+        # Имитация N+1: отдельный запрос на каждую книгу вместо одного
+        for other_id in range(N_PLUS_ONE_THRESHOLD):
+            await self.session.execute(text("SELECT id FROM books WHERE id = :id"), {"id": other_id})
+        return await original_get(self, book_id)
+
+    monkeypatch.setattr(BookRepository, "get_versioned", chatty_get)
+    before = metrics.db_n_plus_one.value("/books/{book_id}")
+
+    await async_client_with_db.get("/books/1")
+
+    assert metrics.db_n_plus_one.value("/books/{book_id}") == before + 1
+
+
+async def test_metrics_endpoint_exposes_prometheus_text(async_client_with_db):
+    await async_client_with_db.get("/books/")
+    resp = await async_client_with_db.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE books_http_request_duration_seconds histogram" in resp.text
+    assert 'books_http_requests_total{method="GET",route="/books/",status="200"}' in resp.text
+    assert "books_cache_hits_total" in resp.text
+
+
+async def test_connection_hold_time_is_recorded(instrumented):
+    before = metrics.db_connection_hold.count("background")
+    async with instrumented.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    assert metrics.db_connection_hold.count("background") == before + 1
+
+
+async def test_pool_utilization_is_exposed(async_client_with_db, monkeypatch, tmp_path):
+    from app.config import Settings
+    from app.db import repository
+    from app.db.engine import make_engine
+
+    engine = make_engine(Settings(database_url=f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", db_pool_size=4))
+    monkeypatch.setattr(repository, "engine", engine)
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        resp = await async_client_with_db.get("/metrics")
+    assert 'books_db_pool_connections{pool="write",state="checked_out"} 1' in resp.text
+    assert 'books_db_pool_utilization{pool="write"}' in resp.text
+
+    # Время удержания записывается при возврате соединения в пул
+    resp = await async_client_with_db.get("/metrics")
+    await engine.dispose()
+    assert "books_db_connection_hold_seconds_bucket" in resp.text
+
+
+async def test_failed_statement_does_not_skew_timings(tmp_path):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'timing.db'}")
+    timed = []
+    metrics.observe_statements(engine, lambda statement, elapsed: timed.append((statement, elapsed)))
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        with pytest.raises(Exception):
+            await conn.execute(text("SELECT * FROM missing"))
+        await conn.execute(text("SELECT 2"))
+        # Ничего не остаётся на соединении пула после ошибки
+        assert not [key for key in conn.info if key.startswith("books_")]
+    await engine.dispose()
+    assert [statement for statement, _ in timed] == ["SELECT 1", "SELECT 2"]
+    assert all(0 <= elapsed < 1 for _, elapsed in timed)
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+
+from app import profiling
+from app.profiling import RequestProfiler, sign_token, verify_token
+
+
+@pytest.fixture
+def profiler(tmp_path, monkeypatch):
+    profiler = RequestProfiler(tmp_path, secret="s3cret", interval=0.001)
+    monkeypatch.setattr(profiling, "request_profiler", profiler)
+    return profiler
+
+
+def _spin(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def _slow_lookup(book_id: int):
+    # Ожидание (как поток aiosqlite) и работа в цикле событий (как загрузка ORM)
+    await asyncio.sleep(0.05)
+    _spin(0.05)
+    return None
+
+
+def test_token_signature_and_expiry():
+    token = sign_token("s3cret", ttl=60, now=1000)
+    assert verify_token("s3cret", token, now=1030)
+    assert not verify_token("s3cret", token, now=1061)
+    assert not verify_token("other", token, now=1030)
+    assert not verify_token("s3cret", token.replace(".", ".0"), now=1030)
+    assert not verify_token("", token, now=1030)
+    # Искажённые значения отклоняются без исключений
+    for bad in ("9999999999.\xe9", "²." + "0" * 64, "", ".", "abc"):
+        assert not verify_token("s3cret", bad, now=1030)
+
+
+async def test_signed_request_is_profiled(async_client, mock_repo, profiler):
+    mock_repo.get_versioned.side_effect = _slow_lookup
+
+    resp = await async_client.get("/books/1", headers={"X-Profile": sign_token("s3cret")})
+    assert resp.status_code == 404
+    profile_id = resp.headers["x-profile-id"]
+
+    stacks = profiler.path(profile_id).read_text().splitlines()
+    # Формат collapsed: кадры через ';' и число выборок
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+    awaiting = [line for line in stacks if "_slow_lookup;asyncio.tasks:sleep;[await Future]" in line]
+    running = [line for line in stacks if "_slow_lookup;tests.test_profiling:_spin" in line]
+    assert awaiting and running
+    assert all("app.routers.books:get_book" in line for line in awaiting + running)
+
+    summary = (await async_client.get("/debug/profiles", headers={"X-Profile": sign_token("s3cret")})).json()
+    [entry] = summary[0]["requests"]
+    assert summary[0]["route"] == "/books/{book_id}"
+    assert (entry["id"], entry["status"], entry["reason"]) == (profile_id, 404, "header")
+    assert entry["duration_ms"] >= 100 and entry["samples"] > 0
+
+    resp = await async_client.get(f"/debug/profiles/{profile_id}", headers={"X-Profile": sign_token("s3cret")})
+    assert resp.text == profiler.path(profile_id).read_text()
+
+
+async def test_unsigned_requests_are_not_profiled(async_client, profiler):
+    assert "x-profile-id" not in (await async_client.get("/books/1")).headers
+    resp = await async_client.get("/books/1", headers={"X-Profile": sign_token("wrong")})
+    assert "x-profile-id" not in resp.headers
+    assert (await async_client.get("/debug/profiles")).status_code == 403
+    assert (profiler.stats.header, profiler.stats.rejected) == (0, 1)
+
+    resp = await async_client.get("/books/1", headers={"X-Profile": "9999999999.\xe9".encode("latin-1")})
+    assert resp.status_code == 404 and "x-profile-id" not in resp.headers
+
+    # Случайная выборка не требует заголовка
+    profiler.sample_rate = 1.0
+    assert "x-profile-id" in (await async_client.get("/books/1")).headers
+    assert profiler.stats.sample == 1
+
+    # Без секрета сводка закрыта
+    profiler.secret = ""
+    assert (await async_client.get("/debug/profiles")).status_code == 403
+
+
+async def test_old_profile_files_are_removed(async_client, profiler):
+    profiler.sample_rate, profiler.max_files, profiler.keep = 1.0, 2, 2
+    ids = [(await async_client.get("/books/1")).headers["x-profile-id"] for _ in range(3)]
+
+    assert profiler.path(ids[0]) is None
+    assert sorted(path.name for path in profiler.directory.iterdir()) == sorted(f"{i}.collapsed" for i in ids[1:])
+    assert len(profiler.slowest()[0]["requests"]) == 2
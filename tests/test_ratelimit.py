@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from app import ratelimit
+from app.ratelimit import Budget, LoadShedder, MemoryRateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_limiter(**kwargs) -> MemoryRateLimiter:
+    return MemoryRateLimiter(Budget("read", rate=2, burst=3), Budget("write", rate=1, burst=1), **kwargs)
+
+
+async def test_token_bucket_burst_and_refill(clock):
+    limiter = make_limiter()
+    budget = limiter.budget("GET")
+
+    assert [await limiter.acquire("ip:a", budget) for _ in range(3)] == [0, 0, 0]
+    assert await limiter.acquire("ip:a", budget) == pytest.approx(0.5)
+    # У другого клиента и у записи свои корзины
+    assert await limiter.acquire("ip:b", budget) == 0
+    assert await limiter.acquire("ip:a", limiter.budget("POST")) == 0
+
+    clock[0] += 0.5
+    assert await limiter.acquire("ip:a", budget) == 0
+    assert (limiter.stats.allowed, limiter.stats.limited) == (6, 1)
+
+
+async def test_memory_limiter_evicts_idle_clients(clock):
+    limiter = make_limiter(max_clients=2)
+    budget = limiter.budget("POST")
+    for client in ("a", "b", "c"):
+        await limiter.acquire(client, budget)
+    assert len(limiter) == 2
+    # Вытесненный клиент начинает с полной корзины
+    assert await limiter.acquire("a", budget) == 0
+    assert await limiter.acquire("c", budget) > 0
+
+
+def test_shedder_lowers_limit_when_database_is_slow(clock):
+    shedder = LoadShedder(max_concurrency=3, degraded_concurrency=1, latency_threshold=0.1)
+
+    assert [shedder.admit() for _ in range(4)] == [None, None, None, "concurrency"]
+    for _ in range(20):
+        shedder.observe(0.5)
+    assert shedder.limit == 1
+    assert shedder.admit() == "db_latency"
+
+    # Старый замер не держит предел сниженным, если медленных запросов больше нет
+    clock[0] += ratelimit.LATENCY_STALE_AFTER
+    assert shedder.limit == 3
+    assert (shedder.stats.concurrency, shedder.stats.db_latency) == (1, 1)
+
+
+async def test_client_quota_returns_429(async_client, monkeypatch):
+    monkeypatch.setattr(ratelimit, "rate_limiter", make_limiter())
+
+    statuses = [(await async_client.get("/books/1")).status_code for _ in range(3)]
+    assert statuses == [404, 404, 404]
+    resp = await async_client.get("/books/1")
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "1"
+
+    # Бюджет записи отдельный, а другой ключ — другой клиент
+    resp = await async_client.delete("/books/1")
+    assert resp.status_code == 200
+    assert (await async_client.get("/books/1", headers={"X-API-Key": "k"})).status_code == 404
+    # Пробы не ограничиваются
+    assert (await async_client.get("/health")).status_code == 200
+
+
+async def test_overload_returns_503(async_client, mock_repo, monkeypatch):
+    shedder = LoadShedder(max_concurrency=1)
+    monkeypatch.setattr(ratelimit, "load_shedder", shedder)
+    release = asyncio.Event()
+
+    async def slow_get(book_id):
+        await release.wait()
+        return None
+
+    mock_repo.get_versioned.side_effect = slow_get
+    first = asyncio.create_task(async_client.get("/books/1"))
+    while shedder.in_flight == 0:
+        await asyncio.sleep(0)
+
+    resp = await async_client.get("/books/2")
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+
+    release.set()
+    assert (await first).status_code == 404
+    assert shedder.in_flight == 0
+
+
+async def test_shedder_shares_statement_timing_with_metrics(tmp_path, monkeypatch):
+    from sqlalchemy import text
+
+    from app.config import Settings
+    from app.db.engine import make_engine
+
+    shedder = LoadShedder(latency_threshold=10.0)
+    monkeypatch.setattr(ratelimit, "load_shedder", shedder)
+    engine = make_engine(Settings(database_url=f"sqlite+aiosqlite:///{tmp_path / 'books.db'}"))
+    # Метрики и сброс нагрузки замеряют время одной парой событий
+    assert len(engine.sync_engine.dispatch.before_cursor_execute) == 1
+
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    assert shedder._measured_at > 0
+    await engine.dispose()
@@ -1,7 +1,8 @@
 import pytest
 from app.db.models import Book
-from app.db.repository import NotFoundError
+from app.db.repository import BookRepository, NotFoundError, PreconditionFailedError, RepositoryError
 from unittest.mock import AsyncMock, MagicMock
+from sqlalchemy import event
 
 
 async def test_create_book(repository):
@@ -70,3 +71,297 @@ async def test_delete_book_not_found():
     repository.delete = AsyncMock(side_effect=NotFoundError)
     with pytest.raises(NotFoundError):
         await repository.delete(999)
+
+
+async def test_get_page_keyset(repository):
+    for i in range(1, 6):
+        await repository.create(Book(id=i, title=f"Book{i}", author="A", year=2000 + i))
+
+    first, cursor = await repository.get_page(limit=2)
+    assert [b.id for b in first] == [1, 2]
+    assert cursor is not None
+
+    second, cursor = await repository.get_page(limit=2, after=cursor)
+    assert [b.id for b in second] == [3, 4]
+
+    last, cursor = await repository.get_page(limit=2, after=cursor)
+    assert [b.id for b in last] == [5]
+    assert cursor is None
+
+
+async def test_get_page_invalid_cursor(repository):
+    with pytest.raises(RepositoryError):
+        await repository.get_page(after="not-a-cursor!")
+
+
+async def test_stream_all_partitions(repository):
+    for i in range(1, 6):
+        await repository.create(Book(id=i, title=f"Book{i}", author="A", year=2000 + i))
+
+    partitions = [p async for p in repository.stream_all(partition_size=2)]
+    assert [len(p) for p in partitions] == [2, 2, 1]
+    assert [b.id for p in partitions for b in p] == [1, 2, 3, 4, 5]
+
+
+async def test_bulk_create(repository):
+    await repository.create(Book(id=1, title="Existing", author="A", year=2000))
+    books = [
+        Book(id=1, title="Conflict", author="A", year=2001),
+        Book(id=2, title="New", author="B", year=2002),
+        Book(id=2, title="Again", author="B", year=2003),
+    ]
+    report = await repository.bulk_create(books)
+    assert [i.status for i in report.items] == ["conflict", "created", "duplicate"]
+    assert (await repository.get(1)).title == "Existing"
+    assert (await repository.get(2)).title == "New"
+
+
+async def test_bulk_upsert(repository):
+    await repository.create(Book(id=1, title="Old", author="A", year=2000))
+    books = [
+        Book(id=1, title="Updated", author="A", year=2001),
+        Book(id=2, title="First", author="B", year=2002),
+        Book(id=2, title="Last", author="B", year=2003),
+    ]
+    report = await repository.bulk_upsert(books)
+    assert [i.status for i in report.items] == ["updated", "duplicate", "created"]
+    assert report.summary == {"updated": 1, "duplicate": 1, "created": 1}
+    assert (await repository.get(1)).title == "Updated"
+    assert (await repository.get(2)).title == "Last"
+
+
+async def test_bulk_delete(repository):
+    for i in (1, 2):
+        await repository.create(Book(id=i, title=f"Book{i}", author="A", year=2000))
+    report = await repository.bulk_delete([1, 2, 2, 3])
+    assert [i.status for i in report.items] == ["deleted", "deleted", "duplicate", "not_found"]
+    assert await repository.get_all() == []
+
+
+@pytest.fixture
+def statements(db_engine):
+    """Список SQL-выражений над books, выполненных движком за время теста.
+
+    Служебные выражения каждой записи — счётчик table_versions и журнал book_changes — и
+    SAVEPOINT транзакции теста не учитываются.
+    """
+    executed = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if not any(skip in statement for skip in ("table_versions", "book_changes", "SAVEPOINT")):
+            executed.append(statement)
+
+    event.listen(db_engine.sync_engine, "before_cursor_execute", _record)
+    yield executed
+    event.remove(db_engine.sync_engine, "before_cursor_execute", _record)
+
+
+async def test_update_single_statement(repository, statements):
+    await repository.create(Book(id=1, title="Old", author="A", year=1990))
+    statements.clear()
+
+    updated = await repository.update(1, Book(id=1, title="New", author="B", year=2000))
+    assert updated == Book(id=1, title="New", author="B", year=2000)
+    assert len(statements) == 1
+    assert statements[0].startswith("UPDATE")
+
+
+async def test_update_book_not_found_real(repository):
+    with pytest.raises(NotFoundError):
+        await repository.update(999, Book(id=999, title="X", author="Y", year=0))
+
+
+async def test_patch_book(repository):
+    await repository.create(Book(id=1, title="Old", author="A", year=1990))
+    patched = await repository.patch(1, {"year": 2001})
+    assert patched == Book(id=1, title="Old", author="A", year=2001)
+    assert await repository.patch(1, {}) == patched
+
+    with pytest.raises(NotFoundError):
+        await repository.patch(999, {"title": "X"})
+
+
+async def test_delete_single_statement(repository, statements):
+    await repository.create(Book(id=1, title="Book1", author="A", year=2000))
+    statements.clear()
+
+    await repository.delete(1)
+    assert len(statements) == 1
+    assert statements[0].startswith("DELETE")
+
+    with pytest.raises(NotFoundError):
+        await repository.delete(1)
+
+
+async def test_writes_bump_versions(repository):
+    start, _ = await repository.get_table_version()
+    created = await repository.create(Book(id=1, title="A", author="A", year=2000))
+    _, created_version = await repository.get_versioned(created.id)
+    assert created_version == start + 1
+
+    await repository.patch(1, {"year": 2001})
+    _, patched_version = await repository.get_versioned(1)
+    table_version, modified = await repository.get_table_version()
+    assert patched_version == table_version == start + 2
+    assert modified is not None
+
+    # Удаление и повторное создание не возвращают старую версию
+    await repository.delete(1)
+    await repository.create(Book(id=1, title="A", author="A", year=2000))
+    _, recreated_version = await repository.get_versioned(1)
+    assert recreated_version not in (created_version, patched_version)
+
+
+async def test_if_match_guards_writes(repository):
+    await repository.create(Book(id=1, title="A", author="A", year=2000))
+    _, version = await repository.get_versioned(1)
+
+    with pytest.raises(PreconditionFailedError):
+        await repository.update(1, Book(id=1, title="B", author="A", year=2000), if_match={version + 100})
+    updated = await repository.update(1, Book(id=1, title="B", author="A", year=2000), if_match={version})
+    assert updated.title == "B"
+
+    with pytest.raises(PreconditionFailedError):
+        await repository.delete(1, if_match={version})
+    with pytest.raises(NotFoundError):
+        await repository.patch(999, {"year": 1}, if_match={version})
+
+
+@pytest.fixture
+def catalogue():
+    return [
+        Book(id=1, title="Мастер и Маргарита", author="Михаил Булгаков", year=1967),
+        Book(id=2, title="Собачье сердце", author="Михаил Булгаков", year=1925),
+        Book(id=3, title="Преступление и наказание", author="Фёдор Достоевский", year=1866),
+        Book(id=4, title="Мастерство перевода", author="Корней Чуковский", year=1930),
+    ]
+
+
+async def test_search_filters(repository, catalogue):
+    await repository.bulk_create(catalogue)
+
+    books, _ = await repository.search(author="Михаил Булгаков")
+    assert [b.id for b in books] == [1, 2]
+
+    books, _ = await repository.search(author="Михаил Булгаков", year_from=1950)
+    assert [b.id for b in books] == [1]
+
+    books, _ = await repository.search(year_from=1900, year_to=1940)
+    assert [b.id for b in books] == [2, 4]
+
+    books, _ = await repository.search(title_prefix="Мастер")
+    assert [b.id for b in books] == [1, 4]
+
+
+async def test_search_full_text_follows_writes(repository, catalogue):
+    await repository.bulk_create(catalogue)
+
+    books, _ = await repository.search(q="маргарита")
+    assert [b.id for b in books] == [1]
+    books, _ = await repository.search(q="мастер")
+    assert [b.id for b in books] == [1, 4]
+
+    await repository.update(1, Book(id=1, title="Белая гвардия", author="Михаил Булгаков", year=1925))
+    await repository.delete(4)
+    books, _ = await repository.search(q="мастер")
+    assert books == []
+    books, _ = await repository.search(q="гвард")
+    assert [b.id for b in books] == [1]
+
+
+async def test_search_pagination(repository, catalogue):
+    await repository.bulk_create(catalogue)
+    first, cursor = await repository.search(author="Михаил Булгаков", limit=1)
+    assert [b.id for b in first] == [1]
+    second, cursor = await repository.search(author="Михаил Булгаков", limit=1, after=cursor)
+    assert [b.id for b in second] == [2]
+    assert cursor is None
+
+
+async def test_session_is_opened_lazily(session_factory, repository):
+    from app.db.cache import BookCache, MemoryCache
+
+    await repository.create(Book(id=1, title="A", author="B", year=2000))
+    opened = []
+
+    def counting_factory():
+        opened.append(session_factory())
+        return opened[-1]
+
+    cache = BookCache(MemoryCache())
+    lazy = BookRepository(cache=cache, session_factory=counting_factory)
+    assert (await lazy.get(1)).title == "A"
+    assert len(opened) == 1
+    await lazy.close()
+    assert lazy._session is None
+
+    # Попадание в кэш не открывает сессию
+    cached = BookRepository(cache=cache, session_factory=counting_factory)
+    assert (await cached.get(1)).title == "A"
+    await cached.close()
+    assert len(opened) == 1
+
+    # Переданную снаружи сессию репозиторий не закрывает
+    await repository.close()
+    assert repository.session is not None and repository.session.is_active
+
+
+async def _grouped_stats(session) -> dict:
+    """Та же статистика, посчитанная напрямую по books."""
+    from sqlalchemy import text
+
+    async def rows(sql):
+        return [tuple(row) for row in (await session.execute(text(sql))).all()]
+
+    return {
+        "authors": await rows("SELECT author, count(*) FROM books GROUP BY author ORDER BY count(*) DESC, author"),
+        "decades": await rows("SELECT year / 10 * 10, count(*) FROM books WHERE year IS NOT NULL "
+                              "GROUP BY year / 10 * 10 ORDER BY 1"),
+        "totals": await rows("SELECT count(*), count(*) - count(year), min(year), max(year) FROM books"),
+    }
+
+
+async def test_stats_follow_every_write_path(db_session, repository, catalogue):
+    await repository.bulk_create(catalogue)
+    await repository.create(Book(id=5, title="Без года", author="Аноним", year=None))
+    await repository.patch(2, {"author": "Фёдор Достоевский"})
+    await repository.update(3, Book(id=3, title="Бесы", author="Фёдор Достоевский", year=1872))
+    await repository.patch(5, {"year": 2001})
+    await repository.bulk_upsert([
+        Book(id=4, title="Мастерство перевода", author="Корней Чуковский", year=1964),
+        Book(id=6, title="Идиот", author="Фёдор Достоевский", year=1869),
+    ])
+    await repository.delete(1)
+    await repository.bulk_delete([5, 7])
+
+    stats = await repository.get_stats()
+    expected = await _grouped_stats(db_session)
+    assert [(a.author, a.books) for a in stats.authors] == expected["authors"]
+    assert [(d.decade, d.books) for d in stats.decades] == expected["decades"]
+    assert (stats.total, stats.without_year, stats.year_min, stats.year_max) == expected["totals"][0]
+    assert stats.authors_total == 2
+    # Авторы, у которых не осталось книг, из сводки удалены
+    assert [a.author for a in stats.authors] == ["Фёдор Достоевский", "Корней Чуковский"]
+
+
+async def test_stats_empty_catalogue_and_top(repository, catalogue):
+    stats = await repository.get_stats()
+    assert (stats.total, stats.year_min, stats.authors, stats.decades) == (0, None, [], [])
+
+    await repository.bulk_create(catalogue)
+    top = await repository.get_stats(top_authors=1)
+    assert [(a.author, a.books) for a in top.authors] == [("Михаил Булгаков", 2)]
+    assert top.authors_total == 3
+    assert [(d.decade, d.books) for d in top.decades] == [(1860, 1), (1920, 1), (1930, 1), (1960, 1)]
+
+
+async def test_commits_stay_inside_test_transaction(db_connection, db_session, repository):
+    from sqlalchemy import func, select
+    from app.db.models import BookORM
+
+    await repository.create(Book(id=1, title="A", author="B", year=2000))
+    # commit репозитория зафиксировал только SAVEPOINT: внешняя транзакция теста открыта
+    outer = db_connection.get_transaction()
+    assert outer is not None and outer.is_active
+    await outer.rollback()
+    assert (await db_session.execute(select(func.count()).select_from(BookORM))).scalar_one() == 0
@@ -1,4 +1,10 @@
+from unittest.mock import MagicMock
+
 import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.db.repository import get_repository
+from app.main import app
 
 # ----------------------------------------------------------------------
 # Fixture factory for creating a book
@@ -54,3 +60,63 @@ async def test_delete_book(async_client, book_data, create_book):
 
     resp = await async_client.get(f"/books/{book_id}")
     assert resp.status_code == 404
+
+
+# ----------------------------------------------------------------------
+# Ошибки
+# ----------------------------------------------------------------------
+async def test_repository_errors_map_to_status_codes(async_client, mock_repo):
+    from app.db.repository import OverloadedError, PreconditionFailedError, RepositoryError
+
+    for error, status in ((PreconditionFailedError("stale"), 412), (OverloadedError("busy"), 503),
+                          (RepositoryError("bad"), 400)):
+        mock_repo.get_versioned.side_effect = error
+        resp = await async_client.get("/books/1")
+        assert resp.status_code == status
+        assert resp.json() == {"detail": str(error)}
+    assert resp.headers.get("Retry-After") is None
+
+
+@pytest.mark.parametrize("debug", [False, True])
+async def test_internal_error_trace_only_in_debug(async_client, mock_repo, monkeypatch, debug):
+    from httpx import ASGITransport, AsyncClient
+    from app.config import get_settings
+    from app.main import app
+
+    monkeypatch.setattr(get_settings(), "debug", debug)
+    mock_repo.get_versioned.side_effect = RuntimeError("boom")
+    # Исключение пробрасывается серверу для лога уже после ответа 500
+    transport = ASGITransport(app=app, raise_app_exceptions=False)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.get("/books/1")
+
+    assert resp.status_code == 500
+    data = resp.json()
+    assert data["detail"] == "Internal Server Error"
+    assert ("trace" in data) is debug
+    if debug:
+        assert data["error"] == "boom" and "RuntimeError" in data["trace"]
+
+
+async def test_page_releases_repository_before_response(async_client, mock_repo):
+    events = []
+
+    async def tracked_repository():
+        repo = MagicMock(wraps=mock_repo)
+        repo.get_page.side_effect = lambda *args: events.append(f"read {id(repo)}") or mock_repo.get_page(*args)
+        yield repo
+        events.append(f"close {id(repo)}")
+
+    async def recording_app(scope, receive, send):
+        async def recording_send(message):
+            if message["type"] == "http.response.start":
+                events.append("response")
+            await send(message)
+        await app(scope, receive, recording_send)
+
+    app.dependency_overrides[get_repository] = tracked_repository
+    async with AsyncClient(transport=ASGITransport(app=recording_app), base_url="http://test") as client:
+        assert (await client.get("/books/")).status_code == 200
+    # Репозиторий, из которого прочитана страница, закрыт до отправки ответа
+    reader = events[0].split()[1]
+    assert events.index(f"close {reader}") < events.index("response")
@@ -1,4 +1,8 @@
+import importlib.util
+import json
 import pytest
+from app.config import get_settings
+from app.db.models import Book
 
 # ----------------------------------------------------------------------
 # CRUD tests с реальной базой
@@ -12,6 +16,14 @@ async def test_create_book(created_book, sample_books):
     assert data["year"] == book.year
 
 
+async def test_create_duplicate_book(created_book, async_client_with_db, sample_books):
+    await created_book(sample_books[0])
+    resp = await async_client_with_db.post("/books/", json=sample_books[0].model_dump())
+    # Тот же ответ, что и при пакетной записи (BOOKS_WRITE_BATCHING)
+    assert resp.status_code == 400 and "already exists" in resp.json()["detail"]
+    assert (await async_client_with_db.get(f"/books/{sample_books[0].id}")).json()["title"] == sample_books[0].title
+
+
 async def test_get_book(created_book, async_client_with_db, sample_books):
     book = sample_books[1]
     book_id, created = await created_book(book)
@@ -58,3 +70,291 @@ async def test_delete_book(created_book, async_client_with_db, sample_books):
 
     resp = await async_client_with_db.get(f"/books/{book_id}")
     assert resp.status_code == 404
+
+
+async def test_get_books_pagination(created_book, async_client_with_db, sample_books):
+    for book in sample_books:
+        await created_book(book)
+
+    resp = await async_client_with_db.get("/books/", params={"limit": 3})
+    assert resp.status_code == 200
+    assert [b["id"] for b in resp.json()] == [1, 2, 3]
+    cursor = resp.headers["X-Next-Cursor"]
+
+    resp = await async_client_with_db.get("/books/", params={"limit": 3, "after": cursor})
+    assert [b["id"] for b in resp.json()] == [4]
+    assert "X-Next-Cursor" not in resp.headers
+
+
+async def test_get_books_invalid_cursor(async_client_with_db):
+    resp = await async_client_with_db.get("/books/", params={"after": "???"})
+    assert resp.status_code == 400
+
+    # Потоковый ответ проверяет курсор до отправки заголовков
+    for stream, accept in (("ndjson", "*/*"), ("json", "*/*"), ("ndjson", "text/csv")):
+        resp = await async_client_with_db.get("/books/", params={"stream": stream, "after": "???"},
+                                              headers={"Accept": accept})
+        assert resp.status_code == 400 and "Invalid cursor" in resp.json()["detail"]
+
+
+async def test_get_books_stream_ndjson(created_book, async_client_with_db, sample_books):
+    for book in sample_books:
+        await created_book(book)
+
+    resp = await async_client_with_db.get("/books/", params={"stream": "ndjson"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [b["id"] for b in lines] == [b.id for b in sample_books]
+
+
+async def test_get_books_stream_json_array(created_book, async_client_with_db, sample_books):
+    for book in sample_books:
+        await created_book(book)
+
+    resp = await async_client_with_db.get("/books/", params={"stream": "json"})
+    assert resp.status_code == 200
+    assert [b["id"] for b in resp.json()] == [b.id for b in sample_books]
+
+
+async def test_bulk_endpoints(async_client_with_db, sample_books):
+    payload = [book.model_dump() for book in sample_books]
+    resp = await async_client_with_db.post("/books/bulk", json=payload)
+    assert resp.status_code == 200
+    assert resp.json()["summary"] == {"created": len(sample_books)}
+
+    payload[0]["title"] = "Обновлённая"
+    payload.append({"id": 10, "title": "Новая", "author": "Автор", "year": 2020})
+    resp = await async_client_with_db.put("/books/bulk", json=payload)
+    assert resp.status_code == 200
+    assert resp.json()["summary"] == {"updated": len(sample_books), "created": 1}
+
+    resp = await async_client_with_db.request("DELETE", "/books/bulk", json=[1, 10, 99])
+    assert resp.status_code == 200
+    assert [i["status"] for i in resp.json()["items"]] == ["deleted", "deleted", "not_found"]
+
+    resp = await async_client_with_db.get("/books/")
+    assert [b["id"] for b in resp.json()] == [b.id for b in sample_books[1:]]
+
+
+async def test_patch_book(created_book, async_client_with_db, sample_books):
+    book = sample_books[0]
+    book_id, _ = await created_book(book)
+    resp = await async_client_with_db.patch(f"/books/{book_id}", json={"title": "Только название"})
+    assert resp.status_code == 200
+    assert resp.json() == {"id": book_id, "title": "Только название", "author": book.author, "year": book.year}
+
+
+async def test_patch_book_validation_and_not_found(async_client_with_db):
+    resp = await async_client_with_db.patch("/books/1", json={"title": None})
+    assert resp.status_code == 422
+
+    resp = await async_client_with_db.patch("/books/999", json={"year": 2000})
+    assert resp.status_code == 404
+
+    resp = await async_client_with_db.put("/books/999", json={"id": 999, "title": "X", "author": "Y"})
+    assert resp.status_code == 404
+
+
+async def test_search_books(created_book, async_client_with_db, sample_books):
+    for book in sample_books:
+        await created_book(book)
+
+    resp = await async_client_with_db.get("/books/search", params={"year_from": 2023, "q": "книга"})
+    assert resp.status_code == 200
+    assert [b["id"] for b in resp.json()] == [2, 3]
+
+    resp = await async_client_with_db.get("/books/search", params={"q": "!!!"})
+    assert resp.status_code == 400
+
+
+@pytest.fixture
+def fast_json(monkeypatch):
+    monkeypatch.setattr(get_settings(), "fast_json", True)
+
+
+async def test_fast_json_matches_regular_response(created_book, async_client_with_db, sample_books, monkeypatch):
+    for book in sample_books:
+        await created_book(book)
+    params = {"limit": 3}
+    regular = await async_client_with_db.get("/books/", params=params)
+
+    monkeypatch.setattr(get_settings(), "fast_json", True)
+    fast = await async_client_with_db.get("/books/", params=params)
+    assert fast.status_code == 200
+    assert fast.headers["content-type"] == "application/json"
+    assert fast.json() == regular.json()
+    assert fast.headers["X-Next-Cursor"] == regular.headers["X-Next-Cursor"]
+
+
+async def test_fast_json_search(created_book, async_client_with_db, sample_books, fast_json):
+    for book in sample_books:
+        await created_book(book)
+    resp = await async_client_with_db.get("/books/search", params={"author": "Автор 2"})
+    assert resp.json() == [sample_books[1].model_dump()]
+
+
+# ----------------------------------------------------------------------
+# Условные запросы: ETag / If-None-Match / If-Match
+# ----------------------------------------------------------------------
+async def test_book_etag_and_not_modified(created_book, async_client_with_db, sample_books):
+    book_id, _ = await created_book(sample_books[0])
+    resp = await async_client_with_db.get(f"/books/{book_id}")
+    etag = resp.headers["etag"]
+
+    resp = await async_client_with_db.get(f"/books/{book_id}", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.content == b""
+
+    await async_client_with_db.patch(f"/books/{book_id}", json={"year": 1900})
+    resp = await async_client_with_db.get(f"/books/{book_id}", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+
+
+async def test_list_etag_changes_on_write(created_book, async_client_with_db, sample_books):
+    await created_book(sample_books[0])
+    resp = await async_client_with_db.get("/books/")
+    etag = resp.headers["etag"]
+    assert etag.startswith('W/"')
+    assert "last-modified" in resp.headers
+
+    for path in ("/books/", "/books/search?author=x"):
+        resp = await async_client_with_db.get(path, headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+    resp = await async_client_with_db.get("/books/", headers={"If-Modified-Since": resp.headers["last-modified"]})
+    assert resp.status_code == 304
+
+    await created_book(sample_books[1])
+    resp = await async_client_with_db.get("/books/", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert len(resp.json()) == 2
+
+
+async def test_if_match_optimistic_concurrency(created_book, async_client_with_db, sample_books):
+    book = sample_books[0]
+    book_id, _ = await created_book(book)
+    etag = (await async_client_with_db.get(f"/books/{book_id}")).headers["etag"]
+
+    payload = {**book.model_dump(), "title": "Первая правка"}
+    # If-Match сравнивает строго: слабый тег (ETag сжатого ответа) не подходит даже с верной версией
+    resp = await async_client_with_db.put(f"/books/{book_id}", json=payload, headers={"If-Match": f"W/{etag}"})
+    assert resp.status_code == 412
+    resp = await async_client_with_db.put(f"/books/{book_id}", json=payload, headers={"If-Match": etag})
+    assert resp.status_code == 200
+
+    # Тот же ETag уже устарел
+    payload["title"] = "Вторая правка"
+    resp = await async_client_with_db.put(f"/books/{book_id}", json=payload, headers={"If-Match": etag})
+    assert resp.status_code == 412
+    resp = await async_client_with_db.delete(f"/books/{book_id}", headers={"If-Match": etag})
+    assert resp.status_code == 412
+
+    resp = await async_client_with_db.delete(f"/books/{book_id}", headers={"If-Match": "*"})
+    assert resp.status_code == 200
+
+
+# ----------------------------------------------------------------------
+# Форматы по Accept: CSV, MessagePack, Arrow
+# ----------------------------------------------------------------------
+async def test_csv_page_and_stream(created_book, async_client_with_db, sample_books):
+    for book in sample_books:
+        await created_book(book)
+
+    resp = await async_client_with_db.get("/books/?limit=2", headers={"Accept": "text/csv"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/csv")
+    assert resp.headers["x-next-cursor"]
+    assert resp.text.splitlines() == ["id,title,author,year", "1,Интеграция,Автор 1,2025", "2,Вторая книга,Автор 2,2024"]
+
+    resp = await async_client_with_db.get("/books/?stream=ndjson", headers={"Accept": "text/csv"})
+    lines = resp.text.splitlines()
+    assert lines[0] == "id,title,author,year"
+    assert len(lines) == len(sample_books) + 1
+
+    etag = (await async_client_with_db.get("/books/")).headers["etag"]
+    csv_etag = (await async_client_with_db.get("/books/", headers={"Accept": "text/csv"})).headers["etag"]
+    assert etag != csv_etag
+
+
+async def test_search_csv(created_book, async_client_with_db, sample_books):
+    for book in sample_books:
+        await created_book(book)
+    resp = await async_client_with_db.get("/books/search?author=Автор 2", headers={"Accept": "text/csv"})
+    assert resp.text.splitlines()[1:] == ["2,Вторая книга,Автор 2,2024"]
+
+
+async def test_binary_formats_negotiation(created_book, async_client_with_db, sample_books):
+    await created_book(sample_books[0])
+    for media_type, module in (("application/msgpack", "msgpack"), ("application/vnd.apache.arrow.stream", "pyarrow")):
+        resp = await async_client_with_db.get("/books/", headers={"Accept": media_type})
+        if importlib.util.find_spec(module) is None:
+            # Формат недоступен: JSON, если клиент не исключил его явно
+            assert resp.headers["content-type"] == "application/json"
+            resp = await async_client_with_db.get("/books/", headers={"Accept": f"{media_type}, */*;q=0"})
+            assert resp.status_code == 406
+        else:
+            assert resp.status_code == 200
+            assert resp.headers["content-type"] == media_type
+
+    # Браузерный Accept с */* получает JSON
+    browser = "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*; q=0.8"
+    resp = await async_client_with_db.get("/books/", headers={"Accept": browser})
+    assert resp.json()[0]["id"] == sample_books[0].id
+    resp = await async_client_with_db.get("/books/", headers={"Accept": "text/html"})
+    assert resp.headers["content-type"] == "application/json"
+    resp = await async_client_with_db.get("/books/", headers={"Accept": "text/html, application/json;q=0, */*"})
+    assert resp.status_code == 406
+
+
+async def test_large_listing_is_gzipped(async_client_with_db, repository):
+    await repository.bulk_create([Book(id=i, title=f"Книга {i}", author="Автор", year=2000) for i in range(1, 201)])
+    resp = await async_client_with_db.get("/books/?limit=200", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["content-encoding"] == "gzip"
+    assert len(resp.json()) == 200
+
+
+# ----------------------------------------------------------------------
+# Импорт и экспорт каталога
+# ----------------------------------------------------------------------
+async def test_import_and_export_endpoints(async_client_with_db):
+    body = "id,title,author,year\n1,Первая,Автор,2000\n2,Вторая,Автор,\n3,Третья,Автор,давно\n"
+    resp = await async_client_with_db.post("/books/import?format=csv&mode=create", content=body.encode())
+    assert resp.status_code == 200
+    report = resp.json()
+    assert report["completed"] is True
+    assert report["statuses"] == {"created": 2}
+    assert report["invalid"] == 1
+    assert report["errors"][0]["record"] == 3
+
+    resp = await async_client_with_db.get("/books/export")
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    assert "attachment" in resp.headers["content-disposition"]
+    assert [json.loads(line)["id"] for line in resp.text.splitlines()] == [1, 2]
+
+    resp = await async_client_with_db.get("/books/export?format=csv")
+    assert resp.text.splitlines()[0] == "id,title,author,year"
+
+    resp = await async_client_with_db.get("/books/export?after=???")
+    assert resp.status_code == 400 and "Invalid cursor" in resp.json()["detail"]
+
+
+async def test_stats_endpoint(async_client_with_db, sample_books, created_book):
+    for book in sample_books:
+        await created_book(book)
+
+    resp = await async_client_with_db.get("/books/stats", params={"top_authors": 1})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["total"] == len(sample_books)
+    assert len(data["authors"]) == 1
+    assert sum(d["books"] for d in data["decades"]) + data["without_year"] == data["total"]
+
+    etag = resp.headers["ETag"]
+    resp = await async_client_with_db.get("/books/stats", params={"top_authors": 1}, headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+    await async_client_with_db.delete(f"/books/{sample_books[0].id}")
+    resp = await async_client_with_db.get("/books/stats", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.json()["total"] == len(sample_books) - 1
@@ -0,0 +1,125 @@
+import asyncio
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.config import Settings
+from app.db import repository
+from app.db.initial_data import initial_books
+from app.db.models import BookORM
+from app.main import app
+from app.server import default_workers, uvicorn_options, worker_environment
+
+
+def test_uvicorn_options():
+    options = uvicorn_options(Settings(workers=3))
+    assert options["workers"] == 3
+    assert options["loop"] == "uvloop" and options["http"] == "httptools"
+    assert uvicorn_options(Settings(), workers=2)["workers"] == 2
+    assert uvicorn_options(Settings())["workers"] == default_workers() >= 1
+
+
+def test_several_workers_do_not_share_memory_cache():
+    assert worker_environment(Settings(), 4)["BOOKS_CACHE_BACKEND"] == "none"
+    assert "BOOKS_CACHE_BACKEND" not in worker_environment(Settings(), 1)
+    assert "BOOKS_CACHE_BACKEND" not in worker_environment(Settings(cache_backend="redis"), 4)
+    assert worker_environment(Settings(), 4)["BOOKS_WORKERS"] == "4"
+
+
+async def test_init_lock_serializes_holders(tmp_path):
+    events = []
+
+    async def hold(name):
+        async with repository.init_lock(str(tmp_path / "init.lock")):
+            events.append(f"{name}+")
+            await asyncio.sleep(0.05)
+            events.append(f"{name}-")
+
+    await asyncio.gather(hold("a"), hold("b"))
+    assert events in (["a+", "a-", "b+", "b-"], ["b+", "b-", "a+", "a-"])
+
+
+async def test_concurrent_init_seeds_once_with_probe(tmp_path, monkeypatch):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'books.db'}")
+    monkeypatch.setattr(repository, "engine", engine)
+    monkeypatch.setattr(repository, "read_engine", None)
+    monkeypatch.setattr(repository, "AsyncSessionLocal",
+                        sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False))
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    await asyncio.gather(*(repository.init_db() for _ in range(3)))
+    await repository.warm_up()
+    # Прогрев открыл все постоянные соединения пула
+    assert engine.pool.checkedin() == engine.pool.size()
+
+    async with engine.connect() as conn:
+        assert await conn.scalar(select(func.count()).select_from(BookORM)) == len(initial_books)
+    probes = [s for s in statements if s.startswith("SELECT books.id") and "LIMIT" in s]
+    assert len(probes) >= 3
+    assert (tmp_path / "books.db.init.lock").exists()
+    await engine.dispose()
+
+
+async def test_health_and_readiness(async_client, mock_repo, monkeypatch):
+    assert (await async_client.get("/health")).json() == {"status": "ok"}
+
+    monkeypatch.setattr(app.state, "ready", False, raising=False)
+    resp = await async_client.get("/ready")
+    assert resp.status_code == 503 and resp.json()["status"] == "starting"
+
+    monkeypatch.setattr(app.state, "ready", True)
+    assert (await async_client.get("/ready")).json() == {"status": "ready"}
+
+    mock_repo.ping.side_effect = ConnectionError("database is down: /srv/books.db")
+    resp = await async_client.get("/ready")
+    assert resp.status_code == 503 and resp.json() == {"status": "unavailable"}
+
+
+def test_import_does_not_create_engines():
+    import subprocess
+    import sys
+
+    code = (
+        "import sys, app.main, app.db.repository as r; "
+        "assert 'engine' not in vars(r) and 'aiosqlite' not in sys.modules; "
+        "assert list(app.main.startup_report.phases) == ['import']"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_openapi_artifact_round_trip(tmp_path):
+    from fastapi import FastAPI
+    from app.schema import build_schema, load_schema
+
+    path = tmp_path / "openapi.json"
+    schema = build_schema(app, path)
+    fresh = FastAPI(title=app.title)
+    assert load_schema(fresh, path)
+    assert fresh.openapi() == schema
+
+    assert not load_schema(FastAPI(title="Другое приложение"), path)
+    assert not load_schema(FastAPI(title=app.title), tmp_path / "missing.json")
+
+
+async def test_lifespan_reports_startup_phases(tmp_path, monkeypatch):
+    from app.config import get_settings
+    from app.main import lifespan
+    from app.schema import build_schema
+    from app.startup import StartupReport
+
+    report = StartupReport()
+    monkeypatch.setattr("app.main.startup_report", report)
+    monkeypatch.setattr(get_settings(), "init_on_startup", False)
+    monkeypatch.setattr(get_settings(), "warm_up", False)
+    monkeypatch.setattr(get_settings(), "openapi_path", str(tmp_path / "openapi.json"))
+    build_schema(app, tmp_path / "openapi.json")
+    monkeypatch.setattr(app, "openapi_schema", None)
+    monkeypatch.setattr(repository, "dispose_engines", lambda: asyncio.sleep(0))
+
+    async with lifespan(app):
+        assert app.openapi_schema is not None
+    assert list(report.phases) == ["engines", "openapi"]
+    assert report.summary().startswith("startup ")
@@ -0,0 +1,193 @@
+import asyncio
+import json
+from collections import Counter
+
+import pytest_asyncio
+from sqlalchemy import select, text
+
+from app.config import Settings
+from app.db.batching import CreateBatcher
+from app.db.cache import BookCache, MemoryCache
+from app.db.models import Base, Book, BookORM
+from app.db.repository import (
+    AlreadyExistsError, OverloadedError, ShardedBookRepository, rebalance_shards, upgrade_schema,
+)
+from app.db.sharding import ShardSet, jump_hash
+from app.db.singleflight import SingleFlight
+from app.transfer import import_books
+
+
+def book(book_id: int) -> Book:
+    return Book(id=book_id, title=f"Книга {book_id}", author=f"Автор {book_id % 4}", year=1990 + book_id % 30)
+
+
+async def open_shards(tmp_path, count: int) -> ShardSet:
+    urls = [f"sqlite+aiosqlite:///{tmp_path / f'shard{i}.db'}" for i in range(count)]
+    shard_set = ShardSet.from_urls(urls, Settings(metrics_enabled=False))
+    for shard in shard_set:
+        async with shard.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(upgrade_schema)
+    return shard_set
+
+
+async def dispose(shard_set: ShardSet) -> None:
+    for _, engine in shard_set.engines():
+        await engine.dispose()
+
+
+async def shard_ids(shard_set: ShardSet, indexes=None) -> list[list[int]]:
+    ids = []
+    for shard in shard_set:
+        if indexes is not None and shard.index not in indexes:
+            continue
+        async with shard.engine.connect() as conn:
+            ids.append(list((await conn.scalars(select(BookORM.id).order_by(BookORM.id))).all()))
+    return ids
+
+
+@pytest_asyncio.fixture
+async def sharded(tmp_path):
+    shard_set = await open_shards(tmp_path, 3)
+    repo = ShardedBookRepository(shard_set, cache=BookCache(MemoryCache()), flights=SingleFlight())
+    yield repo
+    await repo.close()
+    await dispose(shard_set)
+
+
+def test_jump_hash_is_balanced_and_moves_few_keys():
+    before = [jump_hash(key, 4) for key in range(10_000)]
+    after = [jump_hash(key, 5) for key in range(10_000)]
+    assert all(1_900 < count < 2_600 for count in Counter(before).values())
+    moved = [new for old, new in zip(before, after) if old != new]
+    # Переезжает примерно пятая часть ключей, и только в новый шард
+    assert 1_700 < len(moved) < 2_300 and set(moved) == {4}
+
+
+async def test_point_operations_go_to_owner(sharded):
+    for book_id in range(1, 31):
+        await sharded.create(book(book_id))
+    await sharded.update(7, book(7).model_copy(update={"title": "Новое"}))
+    await sharded.patch(8, {"year": 2024})
+    await sharded.delete(9)
+
+    ids = await shard_ids(sharded.shard_set)
+    assert all(sharded.shard_set.owner(book_id) == index for index, part in enumerate(ids) for book_id in part)
+    assert sorted(sum(ids, [])) == [i for i in range(1, 31) if i != 9]
+    assert (await sharded.get(7)).title == "Новое"
+    assert (await sharded.get(8)).year == 2024
+    assert await sharded.get(9) is None
+
+    report = await sharded.bulk_upsert([book(40), book(7), book(40)])
+    assert [item.status for item in report.items] == ["duplicate", "updated", "created"]
+    report = await sharded.bulk_delete([40, 41, 1])
+    assert [item.status for item in report.items] == ["deleted", "not_found", "deleted"]
+
+
+async def test_bulk_failure_on_one_shard_is_reported_per_item(sharded):
+    # Диалект известен без открытия сессий шардов
+    assert sharded.dialect.name == "sqlite"
+    assert all(shard._session is None for shard in sharded.shards)
+
+    async with sharded.shard_set.shards[1].engine.begin() as conn:
+        await conn.execute(text("DROP TABLE books"))
+    books = [book(book_id) for book_id in range(1, 31)]
+    report = await sharded.bulk_create(books)
+
+    failed = {b.id for b in books if sharded.shard_set.owner(b.id) == 1}
+    assert failed and len(failed) < len(books)
+    assert [item.status for item in report.items] == ["failed" if b.id in failed else "created" for b in books]
+    assert report.summary == {"created": len(books) - len(failed), "failed": len(failed)}
+    # Части остальных шардов зафиксированы
+    assert set(sum(await shard_ids(sharded.shard_set, indexes={0, 2}), [])) == {b.id for b in books} - failed
+
+
+async def break_shard(shard_set: ShardSet, index: int) -> None:
+    async with shard_set.shards[index].engine.begin() as conn:
+        await conn.execute(text("DROP TABLE books"))
+
+
+async def test_shard_failure_is_not_a_conflict_for_batcher(sharded):
+    await sharded.create(book(1))
+    await break_shard(sharded.shard_set, 1)
+    shard_set = sharded.shard_set
+    batcher = CreateBatcher(shard_set.shards[0].session_factory, max_delay=0.05,
+                            repository_factory=lambda: ShardedBookRepository(shard_set, cache=sharded.cache))
+    # 1 уже есть в шарде 0, 3 — новая книга шарда 2, 4 — книга сломанного шарда 1
+    assert [shard_set.owner(i) for i in (1, 3, 4)] == [0, 2, 1]
+    results = await asyncio.gather(*(batcher.submit(book(i)) for i in (1, 3, 4)), return_exceptions=True)
+    await batcher.close()
+
+    assert isinstance(results[0], AlreadyExistsError)
+    assert results[1] == book(3)
+    assert isinstance(results[2], OverloadedError)
+
+
+async def test_import_stops_on_shard_failure(sharded):
+    await break_shard(sharded.shard_set, 1)
+    data = b"".join(json.dumps(book(i).model_dump()).encode() + b"\n" for i in range(1, 21))
+
+    async def chunks():
+        yield data
+
+    report = await import_books(sharded, chunks(), batch_size=10)
+    first_failed = min(i for i in range(1, 21) if sharded.shard_set.owner(i) == 1)
+    assert not report.completed and report.resume_from == 0 and report.statuses == {}
+    assert report.errors[-1].record == first_failed and "not written" in report.errors[-1].error
+
+
+async def test_reads_merge_shards_in_id_order(sharded):
+    await sharded.bulk_create([book(book_id) for book_id in range(1, 101)])
+
+    ids, after = [], None
+    while True:
+        page, after = await sharded.get_page(limit=7, after=after)
+        assert len(page) <= 7
+        ids += [b.id for b in page]
+        if after is None:
+            break
+    assert ids == list(range(1, 101))
+
+    found, _ = await sharded.search(author="Автор 1", limit=1000)
+    assert [b.id for b in found] == list(range(1, 101, 4))
+    assert [b.id for b in await sharded.get_all()] == list(range(1, 101))
+
+    streamed = [b.id async for part in sharded.stream_all(partition_size=9) for b in part]
+    assert streamed == list(range(1, 101))
+
+    stats = await sharded.get_stats(top_authors=2)
+    assert (stats.total, stats.authors_total, stats.year_min, stats.year_max) == (100, 4, 1990, 2019)
+    assert [(a.author, a.books) for a in stats.authors] == [("Автор 0", 25), ("Автор 1", 25)]
+    assert sum(d.books for d in stats.decades) == 100
+
+    version, _ = await sharded.get_table_version()
+    await sharded.create(book(101))
+    assert (await sharded.get_table_version())[0] > version
+
+
+async def test_rebalance_copies_then_cleans_up(tmp_path):
+    old = await open_shards(tmp_path, 2)
+    repo = ShardedBookRepository(old, cache=BookCache(MemoryCache()), flights=SingleFlight())
+    await repo.bulk_create([book(book_id) for book_id in range(1, 201)])
+    await repo.close()
+    await dispose(old)
+
+    new = await open_shards(tmp_path, 3)
+    report = await rebalance_shards(new, batch_size=32)
+    moved = [i for i in range(1, 201) if jump_hash(i, 2) != jump_hash(i, 3)]
+    assert report.copied == len(moved) and report.deleted == 0
+    assert set(report.moves) <= {(0, 2), (1, 2)}
+
+    # До cleanup копии остаются на старом месте, но в ответы попадают один раз
+    repo = ShardedBookRepository(new, cache=BookCache(MemoryCache()), flights=SingleFlight())
+    assert [b.id for b in await repo.get_all()] == list(range(1, 201))
+    assert sum(map(len, await shard_ids(new))) == 200 + len(moved)
+
+    report = await rebalance_shards(new, cleanup=True)
+    assert (report.copied, report.deleted) == (0, len(moved))
+    ids = await shard_ids(new)
+    assert sorted(sum(ids, [])) == list(range(1, 201))
+    assert all(new.owner(book_id) == index for index, part in enumerate(ids) for book_id in part)
+    assert (await repo.get_stats()).total == 200
+    await repo.close()
+    await dispose(new)
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event
+
+from app.db.cache import BookCache, MemoryCache
+from app.db.models import Book
+from app.db.repository import BookRepository
+from app.db.singleflight import SingleFlight
+
+
+async def test_concurrent_calls_share_one_load():
+    flights = SingleFlight()
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*[flights.do("key", loader) for _ in range(20)])
+    assert results == [1] * 20
+    assert calls == 1
+    assert flights.stats.leaders == 1 and flights.stats.shared == 19
+    assert len(flights) == 0
+
+
+async def test_errors_propagate_to_all_waiters():
+    flights = SingleFlight()
+
+    async def loader():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(*[flights.do("key", loader) for _ in range(5)], return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+async def test_waiters_retry_when_leader_is_cancelled():
+    flights = SingleFlight()
+    started = asyncio.Event()
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        started.set()
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    leader = asyncio.create_task(flights.do("key", loader))
+    await started.wait()
+    follower = asyncio.create_task(flights.do("key", loader))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == "ok"
+    assert calls == 2
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+
+async def test_cancelled_waiter_does_not_cancel_leader():
+    flights = SingleFlight()
+
+    async def loader():
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    leader = asyncio.create_task(flights.do("key", loader))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flights.do("key", loader))
+    await asyncio.sleep(0)
+    follower.cancel()
+    assert await leader == "ok"
+
+
+async def test_forget_starts_a_new_load():
+    flights = SingleFlight()
+    release = asyncio.Event()
+    values = iter(["old", "new"])
+
+    async def loader():
+        value = next(values)
+        if value == "old":
+            await release.wait()
+        return value
+
+    first = asyncio.create_task(flights.do("key", loader))
+    await asyncio.sleep(0)
+    flights.forget("key")
+    assert await flights.do("key", loader) == "new"
+    release.set()
+    assert await first == "old"
+
+
+async def test_repository_reads_coalesce_into_one_query(db_engine, session_factory, repository):
+    await repository.create(Book(id=1, title="A", author="B", year=2000))
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if "SAVEPOINT" not in statement:
+            statements.append(statement)
+
+    cache, flights = BookCache(MemoryCache()), SingleFlight()
+
+    async def read():
+        async with session_factory() as session:
+            return await BookRepository(session, cache=cache, flights=flights).get(1)
+
+    event.listen(db_engine.sync_engine, "before_cursor_execute", _record)
+    try:
+        books = await asyncio.gather(*[read() for _ in range(10)])
+    finally:
+        event.remove(db_engine.sync_engine, "before_cursor_execute", _record)
+
+    assert {b.title for b in books} == {"A"}
+    assert len(statements) == 1